@@ -0,0 +1,57 @@
+"""
+Admin-only diagnostics endpoints.
+All routes require the X-Admin-Token header to match the ADMIN_TOKEN env var;
+when ADMIN_TOKEN is unset the admin API is disabled.
+"""
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel, Field
+from typing import Optional
+import hmac
+import os
+
+from app.core.profiler import profiling_session
+
+router = APIRouter()
+
+
+def require_admin(x_admin_token: Optional[str] = Header(default=None)) -> None:
+    """Reject the request unless it carries the configured admin token."""
+    expected = os.getenv("ADMIN_TOKEN")
+    if not expected:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, expected):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+
+class ProfileRequest(BaseModel):
+    """Request body for arming the profiler."""
+    requests: int = Field(default=1, ge=1, le=1000)
+    interval_ms: float = Field(default=5.0, ge=1.0, le=1000.0)
+
+
+@router.post("/admin/profile", dependencies=[Depends(require_admin)])
+async def arm_profiler(req: ProfileRequest):
+    """
+    Attach the sampling profiler to the next `requests` requests.
+    Fetch the result from GET /api/admin/profile once they complete.
+    """
+    try:
+        profiling_session.arm(req.requests, req.interval_ms)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return profiling_session.status()
+
+
+@router.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def get_profile(format: str = "collapsed"):
+    """
+    Return the latest profile in collapsed-stack format (flamegraph-ready),
+    or the session status with format=status.
+    """
+    if format == "status":
+        return profiling_session.status()
+    result = profiling_session.result
+    if result is None:
+        raise HTTPException(status_code=404, detail="No completed profile available")
+    return PlainTextResponse(result)
@@ -0,0 +1,172 @@
+"""
+Classroom mode API: several student profiles per session answering each
+teacher utterance concurrently.
+
+POST /api/classroom/feedback streams newline-delimited JSON, one line per
+event as soon as it happens:
+    {"type": "hands", "students": ["Ava", "Ben"]}
+    {"type": "reply", "student": "Ben", "text": "..."}   (in the order students finish)
+    {"type": "done"}
+    {"type": "superseded"} / {"type": "error", "detail": ...[, "retry_after": ...]}
+"""
+import asyncio
+import json
+from typing import AsyncIterator, List, Optional, Tuple
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, field_validator
+
+from app.api.feedback import FeedbackRequest, require_slide_url
+from app.api.settings import SettingsRequest, get_session_id
+from app.core import metrics, tracing
+from app.core.classroom import CLASSROOM_PROMPT, classroom_store, persona_prompts, select_hands
+from app.core.inflight import Superseded, inflight_replies
+from app.core.model_router import DeadlineExceeded
+from app.core.scheduler import Overloaded
+from app.core.workflow_loader import load_workflow_module
+
+router = APIRouter()
+
+MAX_STUDENTS = 12
+
+
+class StudentProfile(SettingsRequest):
+    """One student of a classroom."""
+    name: str = Field(min_length=1, max_length=40, pattern=r"^[\w .'-]+$")
+
+
+class ClassroomRequest(BaseModel):
+    """Request body for setting the students of a session."""
+    students: List[StudentProfile] = Field(min_length=1, max_length=MAX_STUDENTS)
+
+    @field_validator("students")
+    @classmethod
+    def unique_names(cls, students: List[StudentProfile]) -> List[StudentProfile]:
+        names = [s.name.lower() for s in students]
+        if len(set(names)) != len(names):
+            raise ValueError("Student names must be unique")
+        return students
+
+
+class ClassroomResponse(BaseModel):
+    message: str
+    classroom: ClassroomRequest
+
+
+class ClassroomFeedbackRequest(FeedbackRequest):
+    # Students answering at most (None: CLASSROOM_MAX_HANDS, 0: everyone)
+    hands: Optional[int] = Field(default=None, ge=0)
+
+
+class Fanout:
+    """A prepared classroom utterance: workflow, answering students and their prompts."""
+
+    def __init__(self, wf, names: List[str], prompts: List[Tuple[str, str]]):
+        self.wf = wf
+        self.names = names
+        self.prompts = prompts
+
+
+def prepare_fanout(session_id: str, req: ClassroomFeedbackRequest) -> Fanout:
+    """
+    Validate a classroom utterance and pick the students who raise their hands.
+
+    Raises:
+        HTTPException: 400 without a usable slide URL, 404 without a classroom
+    """
+    require_slide_url(req.slide_url)
+    students = classroom_store.students(session_id)
+    if not students:
+        raise HTTPException(status_code=404, detail="No classroom is configured for this session.")
+    wf = load_workflow_module()
+    if wf is None or not hasattr(wf, "stream_classroom"):
+        raise RuntimeError("workflow.stream_classroom is not available.")
+    hands = select_hands(students, req.teacher_text, classroom_store.last_spoke(session_id), req.hands)
+    return Fanout(wf, [s["name"] for s in hands], persona_prompts(hands))
+
+
+async def run_fanout(session_id: str, teacher_text: str, fanout: Fanout, emit) -> None:
+    """
+    Generate the replies of a fan-out, calling `await emit(name, delta, reply)`
+    for every streamed delta (reply None) and every finished reply (delta None).
+    """
+    with tracing.span("classroom.fanout", session=session_id, students=len(fanout.names)):
+        answered = []
+        async for name, delta, reply in fanout.wf.stream_classroom(
+            teacher_text, fanout.prompts, session_id=session_id, system_prompt=CLASSROOM_PROMPT
+        ):
+            if reply is not None:
+                answered.append(name)
+            await emit(name, delta, reply)
+        classroom_store.record_turn(session_id, answered)
+
+
+def _ndjson(event: dict) -> bytes:
+    return (json.dumps(event) + "\n").encode()
+
+
+@router.post("/classroom", response_model=ClassroomResponse)
+async def save_classroom(classroom: ClassroomRequest, session_id: str = Depends(get_session_id)):
+    """Set the students of a session (replaces the previous roster)."""
+    action = "updated" if classroom_store.students(session_id) else "created"
+    try:
+        await classroom_store.set(session_id, classroom.model_dump())
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to save classroom: {str(e)}")
+    return ClassroomResponse(message=f"Classroom {action} successfully", classroom=classroom)
+
+
+@router.get("/classroom", response_model=Optional[ClassroomRequest])
+async def get_classroom(session_id: str = Depends(get_session_id)):
+    """Return the students of a session, or None if it has no classroom."""
+    students = classroom_store.students(session_id)
+    return ClassroomRequest(students=students) if students else None
+
+
+@router.post("/classroom/feedback")
+async def classroom_feedback(req: ClassroomFeedbackRequest, session_id: str = Depends(get_session_id)):
+    """
+    Send a teacher utterance to the classroom. The answering students reply
+    concurrently and each reply is streamed as soon as it is complete. Like
+    /feedback, the fan-out supersedes (and is superseded by) other replies of
+    the session.
+    """
+    try:
+        fanout = prepare_fanout(session_id, req)
+    except HTTPException:
+        raise
+    except Exception as e:
+        metrics.record_error("classroom_feedback")
+        raise HTTPException(status_code=500, detail=f"Failed to receive feedback: {str(e)}")
+
+    async def events() -> AsyncIterator[bytes]:
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def emit(name, delta, reply):
+            if reply is not None:
+                await queue.put({"type": "reply", "student": name, "text": reply})
+
+        task = asyncio.ensure_future(inflight_replies.run(session_id, run_fanout(session_id, req.teacher_text, fanout, emit)))
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            yield _ndjson({"type": "hands", "students": fanout.names})
+            while (event := await queue.get()) is not None:
+                yield _ndjson(event)
+            try:
+                task.result()
+                yield _ndjson({"type": "done"})
+            except Superseded:
+                yield _ndjson({"type": "superseded"})
+            except Overloaded as e:
+                yield _ndjson({"type": "error", "detail": str(e), "retry_after": e.retry_after})
+            except DeadlineExceeded as e:
+                yield _ndjson({"type": "error", "detail": f"Student replies timed out: {e}"})
+            except Exception as e:
+                metrics.record_error("classroom_feedback")
+                yield _ndjson({"type": "error", "detail": f"Failed to receive feedback: {str(e)}"})
+        finally:
+            # The client went away: stop generating
+            task.cancel()
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
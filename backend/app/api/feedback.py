@@ -2,32 +2,27 @@
 Feedback API endpoint that accepts a transcript and slide index.
 Currently returns an acknowledgement only (generation will be implemented later).
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from pathlib import Path
 from typing import Optional
-import json
 import os
 import sys
 
-# Chatbot wrapper (lives at backend/chatbot.py)
-# When running the FastAPI app (module 'app'), the parent directory is on sys.path
-# so we can import 'chatbot' directly.
-try:
-    from chatbot import Chatbot  # type: ignore
-except Exception as e:
-    Chatbot = None  # fallback for environments without OpenAI configured
-
-# Workflow loader for robust imports
+# Workflow loader for robust imports. The workflow (and with it the OpenAI
+# client library) is loaded on the first request, not at startup.
 from app.core.workflow_loader import load_workflow_module
-#from ../../backend.workflow import get_feedback,add_slide,begin_conversation
-#from workflow import get_feedback,add_slide,begin_conversation
 current_dir = os.path.dirname(os.path.abspath(__file__))
 utils_path = os.path.join(current_dir, '..','..','..','backend')
 sys.path.append(utils_path)
-import workflow
-# Reuse the settings file path from the settings API
-from app.api.settings import SETTINGS_FILE
+# Session resolution shared with the settings API
+from app.api.settings import get_session_id
+from app.core import metrics
+from app.core.inflight import Superseded, inflight_replies
+from app.core.model_router import DeadlineExceeded
+from app.core.scheduler import Overloaded
+from app.core.settings_store import settings_store
+from app.core.slide_store import slide_store
+from app.core.speculation import speculator
 
 router = APIRouter()
 
@@ -51,80 +46,113 @@ class SlideChangeAck(BaseModel):
     status: str
 
 
+class InterimAck(BaseModel):
+    status: str
+
+
+def require_slide_url(slide_url: Optional[str]) -> str:
+    """
+    Check that a slide URL can be shown to the model: a public http(s) URL
+    (e.g., S3), or, while S3 replication is configured, the /images/... URL
+    of a slide stored on this server (see app.core.slide_store).
+
+    Raises:
+        HTTPException: 400 if the URL is missing or neither kind
+    """
+    if not slide_url or not isinstance(slide_url, str):
+        raise HTTPException(status_code=400, detail="slide_url is required.")
+    if slide_url.startswith(("http://", "https://")):
+        return slide_url
+    if slide_store.local_path(slide_url) is None or not slide_store.accepts_local_urls():
+        raise HTTPException(
+            status_code=400,
+            detail="slide_url must be a publicly reachable URL (e.g., S3) or, when S3 is configured, "
+                   "the /images/... URL of an uploaded slide.",
+        )
+    return slide_url
+
+
+async def _collect_reply(deltas) -> str:
+    parts = [delta async for delta in deltas]
+    return "".join(parts).strip()
+
+
 @router.post("/feedback", response_model=StudentFeedbackResponse)
-async def feedback(req: FeedbackRequest) -> StudentFeedbackResponse:
+async def feedback(req: FeedbackRequest, session_id: str = Depends(get_session_id)) -> StudentFeedbackResponse:
     """
     Accept a transcript (teacher_text) and slide_index, then generate a
-    simulated student response using the Chatbot with context from settings.
+    simulated student response using the Chatbot with context from the
+    session's student profile.
     """
     try:
         # Load workflow module dynamically
         wf = load_workflow_module()
-        # 1) Load settings if present
-        settings: Optional[dict] = None
-        if SETTINGS_FILE.exists():
-            with open(SETTINGS_FILE, "r") as f:
-                settings = json.load(f)
-
-        # 2) Build system prompt from context template
-        context_path = Path(__file__).parent.parent.parent / "context.txt"
-        system_prompt = "You are a teaching assistant simulating a student."
-        if context_path.exists():
-            template = context_path.read_text()
-            if settings:
-                # Map settings → placeholders
-                system_prompt = (
-                    template
-                    .replace("<persona>", settings.get("student_persona", "curious"))
-                    .replace("<grade>", settings.get("grade_level", "middle"))
-                    .replace("<subject>", settings.get("subject", "general"))
-                    .replace("<level>", settings.get("understanding_level", "on-level"))
-                    .replace("<style>", settings.get("explanation_style", "step-by-step"))
-                )
-            else:
-                system_prompt = template
-
-        # 3) Require a public slide URL (e.g., S3); do not use local paths
-        if not req.slide_url or not isinstance(req.slide_url, str) or not req.slide_url.startswith(("http://", "https://")):
-            raise HTTPException(status_code=400, detail="slide_url is required and must be a publicly reachable URL (e.g., S3).")
-        slide_url = req.slide_url
-
-        # 4) Compose conversation with system, slide image, and teacher text
-        conversation = [
-            ("system", system_prompt),
-            (
-                "user",
-                [
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": slide_url, "detail": "high"},
-                    }
-                ],
-            ),
-            ("user", req.teacher_text),
-        ]
-
-        # 5) Generate response and update history using workflow.get_feedback
-        if wf is None or not hasattr(wf, "get_feedback"):
-            raise RuntimeError("workflow.get_feedback is not available.")
-        reply = wf.get_feedback(req.teacher_text)  # type: ignore
+        with metrics.stage_timer("prompt_build"):
+            # 1) Rendered system prompt for the session's profile (cached in memory)
+            system_prompt = settings_store.system_prompt(session_id)
+
+        # 2) Require a usable slide URL (S3 or an uploaded slide). The slide
+        # itself reaches the model through the history (slide_change)
+        require_slide_url(req.slide_url)
+
+        # 3) Generate response and update history using workflow.stream_feedback,
+        # or commit the reply speculatively generated from interim transcripts.
+        # The call supersedes any reply still being generated for this session
+        # and is itself cancelled by a newer utterance or slide change.
+        if wf is None or not hasattr(wf, "stream_feedback"):
+            raise RuntimeError("workflow.stream_feedback is not available.")
+        reply = await inflight_replies.run(
+            session_id,
+            _collect_reply(speculator.reply_stream(wf, req.teacher_text, session_id, system_prompt)),
+        )
 
         return StudentFeedbackResponse(student_feedback=reply)
+    except Superseded:
+        raise HTTPException(status_code=409, detail="Superseded by a newer utterance or slide change")
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=f"Student reply timed out: {e}")
+    except Overloaded as e:
+        raise HTTPException(
+            status_code=429,
+            detail=f"Too many student replies are being generated: {e}",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+    except HTTPException:
+        raise
     except Exception as e:
+        metrics.record_error("feedback")
         raise HTTPException(status_code=500, detail=f"Failed to receive feedback: {str(e)}")
 
 
+@router.post("/feedback/interim", response_model=InterimAck, status_code=202)
+async def feedback_interim(req: FeedbackRequest, session_id: str = Depends(get_session_id)) -> InterimAck:
+    """
+    Accept an interim (still changing) transcript. Once it stabilizes, a reply
+    is generated speculatively and committed by /feedback if the final
+    transcript matches.
+    """
+    require_slide_url(req.slide_url)
+    wf = load_workflow_module()
+    if wf is None or not hasattr(wf, "draft_feedback"):
+        return InterimAck(status="ignored")
+    system_prompt = settings_store.system_prompt(session_id)
+    accepted = speculator.interim(wf, session_id, req.teacher_text, system_prompt)
+    return InterimAck(status="accepted" if accepted else "ignored")
+
+
 @router.post("/slide_change", response_model=SlideChangeAck)
-async def slide_change(req: SlideChangeRequest) -> SlideChangeAck:
+async def slide_change(req: SlideChangeRequest, session_id: str = Depends(get_session_id)) -> SlideChangeAck:
     """
     Record the slide change in the conversation history (if stateful workflow is available).
     """
     try:
         wf = load_workflow_module()
-        if not req.slide_url or not isinstance(req.slide_url, str) or not req.slide_url.startswith(("http://", "https://")):
-            raise HTTPException(status_code=400, detail="slide_url is required and must be a publicly reachable URL (e.g., S3).")
+        require_slide_url(req.slide_url)
+        # A reply about the previous slide is no longer wanted
+        inflight_replies.supersede(session_id, "slide_change")
+        speculator.discard(session_id)
         if wf and hasattr(wf, "add_slide"):
-            wf.add_slide(req.slide_url)  # type: ignore
+            wf.add_slide(req.slide_url, session_id=session_id)  # type: ignore
             return SlideChangeAck(status="ok")
         # If workflow is not available, no-op but succeed
         return SlideChangeAck(status="ignored")
@@ -1,17 +1,23 @@
 """
 Settings API endpoint for managing student profile configuration.
-Stores settings in a JSON file in the data folder.
+Profiles are kept per session (X-Session-Id header) in the in-memory
+settings store and persisted to JSON files in the data folder.
 """
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException
 from pydantic import BaseModel
-from pathlib import Path
 import json
 from typing import Optional
 
+from app.core.settings_store import settings_store, validate_session_id
+
 router = APIRouter()
 
-# Path to settings file
-SETTINGS_FILE = Path(__file__).parent.parent.parent / "data" / "settings.json"
+def get_session_id(x_session_id: Optional[str] = Header(default=None)) -> str:
+    """Resolve the session from the X-Session-Id header (defaults to the shared session)."""
+    try:
+        return validate_session_id(x_session_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 class SettingsRequest(BaseModel):
@@ -30,31 +36,32 @@ class SettingsResponse(BaseModel):
 
 
 @router.post("/settings", response_model=SettingsResponse)
-async def save_settings(settings: SettingsRequest):
+async def save_settings(
+    settings: SettingsRequest,
+    session_id: str = Depends(get_session_id),
+):
     """
-    Save or update student profile settings in a JSON file.
+    Save or update the student profile of a session.
+    The profile is available immediately; the JSON file is written in the background.
 
     Args:
         settings: SettingsRequest containing all configuration parameters
+        session_id: Session the profile belongs to (X-Session-Id header)
 
     Returns:
         SettingsResponse with confirmation message and saved settings
 
     Raises:
-        HTTPException: If file operations fail
+        HTTPException: If the session id is invalid
     """
     try:
-        # Ensure data directory exists
-        SETTINGS_FILE.parent.mkdir(parents=True, exist_ok=True)
-
-        # Convert settings to dict
-        settings_dict = settings.model_dump()
-
-        # Write to JSON file (overwrites if exists)
-        with open(SETTINGS_FILE, 'w') as f:
-            json.dump(settings_dict, f, indent=2)
+        action = "updated" if settings_store.get(session_id) is not None else "created"
+    except json.JSONDecodeError:
+        # A corrupted file is replaced by the new profile
+        action = "updated"
 
-        action = "updated" if SETTINGS_FILE.exists() else "created"
+    try:
+        await settings_store.set(session_id, settings.model_dump())
 
         return SettingsResponse(
             message=f"Settings {action} successfully",
@@ -69,9 +76,9 @@ async def save_settings(settings: SettingsRequest):
 
 
 @router.get("/settings", response_model=Optional[SettingsRequest])
-async def get_settings():
+async def get_settings(session_id: str = Depends(get_session_id)):
     """
-    Retrieve current settings from JSON file.
+    Retrieve the current settings of a session.
 
     Returns:
         SettingsRequest with current settings, or None if no settings exist
@@ -80,12 +87,10 @@ async def get_settings():
         HTTPException: If file read fails
     """
     try:
-        if not SETTINGS_FILE.exists():
+        settings_dict = settings_store.get(session_id)
+        if settings_dict is None:
             return None
 
-        with open(SETTINGS_FILE, 'r') as f:
-            settings_dict = json.load(f)
-
         return SettingsRequest(**settings_dict)
 
     except json.JSONDecodeError:
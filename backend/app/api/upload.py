@@ -2,40 +2,99 @@
 Upload API endpoint for handling slide file uploads.
 Converts PPTX/PDF files to PNG images and returns slide metadata.
 """
-from fastapi import APIRouter, UploadFile, File, HTTPException, Form
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, Form
 from pydantic import BaseModel
 from typing import List, Optional
 from pathlib import Path
+import asyncio
 import shutil
 import os
+import threading
+import time
 
 from app.core.slide_converter import SlideConverter
 from app.core.s3_uploader import S3Uploader
-from app.core.context_helper import render_context_from_settings
-try:
-    from workflow import begin_conversation  # type: ignore
-except Exception:
-    begin_conversation = None  # gracefully handle absence in some envs
-from app.api.settings import save_settings, SettingsRequest  # type: ignore
+from app.core.deck_manifest import deck_manifest
+from app.core.deck_outline import extract_outline
+from app.core.slide_store import slide_store
+from app.core.workflow_loader import load_workflow_module
+from app.core import metrics, tracing
+from app.api.settings import get_session_id, save_settings, SettingsRequest  # type: ignore
 
 router = APIRouter()
 
 # Initialize slide converter
 IMAGES_DIR = Path(__file__).parent.parent.parent / "data" / "images"
 UPLOADS_DIR = Path(__file__).parent.parent.parent / "data" / "uploads"
-UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
 
 slide_converter = SlideConverter(IMAGES_DIR)
 
-# Initialize S3 uploader (optional - only if AWS credentials are configured)
-s3_uploader: Optional[S3Uploader] = None
-try:
-    if os.getenv("AWS_S3_BUCKET"):
-        s3_uploader = S3Uploader()
-        print("S3 uploader initialized successfully")
-except Exception as e:
-    print(f"S3 uploader not initialized: {e}")
-    print("Images will only be stored locally")
+# Namespaces (per-deck image directories) unused for this long are deleted
+NAMESPACE_TTL_SECONDS = float(os.getenv("IMAGE_NAMESPACE_TTL_HOURS", "24")) * 3600
+# Minimum time between two cleanup sweeps
+CLEANUP_INTERVAL_SECONDS = 600
+_last_cleanup = 0.0
+_cleanup_lock = threading.Lock()
+
+# S3 uploader (optional - only if AWS credentials are configured).
+# Created on first upload so boto3 stays out of the startup path.
+_s3_uploader: Optional[S3Uploader] = None
+_s3_initialized = False
+_s3_lock = threading.Lock()
+
+
+def get_s3_uploader() -> Optional[S3Uploader]:
+    """Return the shared S3 uploader, creating it on first use (None if not configured)."""
+    global _s3_uploader, _s3_initialized
+    if _s3_initialized:
+        return _s3_uploader
+    with _s3_lock:
+        if not _s3_initialized:
+            try:
+                if os.getenv("AWS_S3_BUCKET"):
+                    _s3_uploader = S3Uploader()
+                    print("S3 uploader initialized successfully")
+            except Exception as e:
+                print(f"S3 uploader not initialized: {e}")
+                print("Images will only be stored locally")
+            _s3_initialized = True
+    return _s3_uploader
+
+
+def cleanup_old_namespaces() -> None:
+    """
+    Remove expired slide namespaces (at most once per interval). Local files
+    go right away; their S3 copies are deleted by the slide_store sync task,
+    so S3 latency never adds to an upload.
+    """
+    global _last_cleanup
+    if not _cleanup_lock.acquire(blocking=False):
+        # Another upload is already sweeping
+        return
+    try:
+        now = time.monotonic()
+        if _last_cleanup and now - _last_cleanup < CLEANUP_INTERVAL_SECONDS:
+            return
+        _last_cleanup = now
+        # Pre-ingested decks stay, locally and in S3
+        removed = slide_converter.cleanup_namespaces(NAMESPACE_TTL_SECONDS, keep=deck_manifest.decks.keys())
+        for namespace in removed:
+            upload_dir = UPLOADS_DIR / namespace
+            if upload_dir.exists():
+                shutil.rmtree(upload_dir, ignore_errors=True)
+            slide_store.retire_namespace(namespace)
+    finally:
+        _cleanup_lock.release()
+
+
+def save_original(file_content: bytes, filename: str) -> str:
+    """Keep the uploaded file next to the other uploads of the same deck; returns the deck's namespace."""
+    namespace = slide_converter.namespace_for(file_content)
+    upload_dir = UPLOADS_DIR / namespace
+    upload_dir.mkdir(parents=True, exist_ok=True)
+    with open(upload_dir / Path(filename).name, 'wb') as f:
+        f.write(file_content)
+    return namespace
 
 
 class SlideInfo(BaseModel):
@@ -64,10 +123,12 @@ async def upload_slides(
     studentLevel: Optional[str] = Form(default=None),
     explanationStyle: Optional[str] = Form(default=None),
     studentPersona: Optional[str] = Form(default=None),
+    session_id: str = Depends(get_session_id),
 ):
     """
     Upload a PowerPoint (PPTX) or PDF file and convert it to slide images.
-    Clears previous uploads and stores slides directly in data/images/.
+    Slides are stored in a per-deck namespace, data/images/<namespace>/,
+    so earlier and concurrent uploads stay intact.
 
     Args:
         file: The uploaded PPTX or PDF file
@@ -91,43 +152,54 @@ async def upload_slides(
 
     try:
         # Read file content
-        file_content = await file.read()
+        with metrics.stage_timer("upload_receive"), tracing.span("upload.receive") as sp:
+            file_content = await file.read()
+            sp.set_attribute("bytes", len(file_content))
 
-        # Clear and reset uploads directory
-        if UPLOADS_DIR.exists():
-            shutil.rmtree(UPLOADS_DIR)
-        UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
+        # Hashing, file I/O and the converter subprocesses run in worker
+        # threads: the event loop keeps serving WebSockets and streamed replies
+        namespace = await asyncio.to_thread(save_original, file_content, file.filename)
 
-        # Save original file to uploads directory
-        original_file_path = UPLOADS_DIR / file.filename
-        with open(original_file_path, 'wb') as f:
-            f.write(file_content)
+        # Convert file to PNG images (reuses the namespace if already converted)
+        with tracing.span("upload.convert", filename=file.filename):
+            image_paths = await asyncio.to_thread(slide_converter.convert_file, file_content, file.filename)
 
-        # Convert file to PNG images (this also clears the images directory)
-        image_paths = slide_converter.convert_file(file_content, file.filename)
+        # Decks converted ahead of time by tools/ingest_decks.py
+        ingested = deck_manifest.get(namespace)
 
-        # Upload to S3 if configured
-        s3_urls = []
-        stored_in_s3 = False
-        if s3_uploader:
-            try:
-                # Clear previous slides from S3
-                s3_uploader.clear_prefix("slides")
+        # Per-slide text summaries, sent ahead of the turns of every call
+        if ingested is not None and "outline" in ingested:
+            deck_outline = ingested["outline"]
+        else:
+            deck_outline = await asyncio.to_thread(extract_outline, file_content, file.filename)
 
-                # Upload new slides to S3
-                s3_urls = s3_uploader.upload_files(image_paths, s3_prefix="slides")
-                stored_in_s3 = True
-                print(f"Successfully uploaded {len(s3_urls)} slides to S3")
+        # Replicate to S3 if configured. Slides are committed locally first and
+        # uploaded in the background (app.core.slide_store), so S3 latency or
+        # outages never hold up the upload; sessions use the local URLs until
+        # the replicas are confirmed.
+        s3_urls: List[Optional[str]] = []
+        s3_uploader = get_s3_uploader()
+        ingested_urls = (ingested or {}).get("s3_urls") or []
+        if s3_uploader and len(ingested_urls) == len(image_paths):
+            # Uploaded at ingestion time under the same content-addressed keys
+            s3_urls = ingested_urls
+        elif s3_uploader:
+            try:
+                with tracing.span("upload.enqueue_s3", slides=len(image_paths)):
+                    s3_urls = await asyncio.to_thread(slide_store.enqueue, image_paths)
             except Exception as e:
-                print(f"Warning: Failed to upload to S3: {e}")
+                metrics.record_error("s3_enqueue")
+                print(f"Warning: Failed to queue slides for S3: {e}")
                 print("Slides are still available locally")
+        stored_in_s3 = bool(s3_urls) and all(s3_urls)
+        replicating = bool(s3_urls) and not stored_in_s3
 
         # Build response with image URLs
         slides = []
         for idx, image_path in enumerate(image_paths):
             # Construct local URL path
-            # Format: /images/slide_000.png
-            image_url = f"/images/{image_path.name}"
+            # Format: /images/<namespace>/slide_000_<hash>.png
+            image_url = f"/images/{image_path.parent.name}/{image_path.name}"
 
             # Get S3 URL if available
             s3_url = s3_urls[idx] if idx < len(s3_urls) else None
@@ -141,10 +213,13 @@ async def upload_slides(
         message = f"Successfully uploaded and converted {len(slides)} slides"
         if stored_in_s3:
             message += " (stored in S3)"
+        elif replicating:
+            message += " (stored locally, replicating to S3)"
         else:
             message += " (stored locally only)"
 
-        # Save settings via the settings API and render context.txt, then seed conversation
+        # Save the session's settings via the settings API, then seed its conversation.
+        # context.txt stays a template; prompts are rendered per session.
         settings_dict = {
             "grade_level": gradeLevel or "",
             "subject": subject or "",
@@ -152,22 +227,26 @@ async def upload_slides(
             "explanation_style": explanationStyle or "",
             "student_persona": studentPersona or "",
         }
+        with tracing.span("upload.seed_conversation"):
+            try:
+                # Persist settings (equivalent to calling /api/settings)
+                await save_settings(SettingsRequest(**settings_dict), session_id=session_id)
+            except Exception as e:
+                print(f"Warning: saving settings failed: {e}")
+            try:
+                # Initialize the conversation history with the session's rendered prompt
+                wf = load_workflow_module()
+                if wf is not None and hasattr(wf, "begin_conversation"):
+                    await asyncio.to_thread(
+                        wf.begin_conversation, settings_dict, session_id=session_id, deck_outline=deck_outline
+                    )
+            except Exception as e:
+                print(f"Warning: begin_conversation failed: {e}")
+
         try:
-            # Persist settings (equivalent to calling /api/settings)
-            await save_settings(SettingsRequest(**settings_dict))
-        except Exception as e:
-            print(f"Warning: saving settings failed: {e}")
-        try:
-            # Render the context template with current settings
-            render_context_from_settings(settings_dict)
-        except Exception as e:
-            print(f"Warning: rendering context failed: {e}")
-        try:
-            # Initialize the conversation history with the rendered context
-            if begin_conversation:
-                begin_conversation(settings_dict)
+            await asyncio.to_thread(cleanup_old_namespaces)
         except Exception as e:
-            print(f"Warning: begin_conversation failed: {e}")
+            print(f"Warning: namespace cleanup failed: {e}")
 
         return UploadResponse(
             slides=slides,
@@ -178,6 +257,7 @@ async def upload_slides(
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
+        metrics.record_error("upload")
         raise HTTPException(
             status_code=500,
             detail=f"Failed to process file: {str(e)}"
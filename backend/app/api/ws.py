@@ -0,0 +1,257 @@
+"""
+WebSocket session channel: slide changes, teacher utterances and streamed
+student replies over one long-lived connection per session.
+
+Endpoint: /api/ws/{session_id}?last_seq=N
+
+Client -> server messages:
+    {"type": "ping"}
+    {"type": "slide_change", "id": ..., "slide_index": 2, "slide_url": "https://..."}
+    {"type": "utterance", "id": ..., "teacher_text": "...", "slide_index": 2, "slide_url": "https://..."}
+    {"type": "interim", "teacher_text": "...", "slide_index": 2, "slide_url": "https://..."}
+    {"type": "classroom_utterance", "id": ..., "teacher_text": "...", "slide_index": 2,
+     "slide_url": "https://...", "hands": 2}
+
+Server -> client events:
+    welcome      {"seq", "gap"} on connect; gap=true means missed events were lost
+    pong         answer to ping (transient)
+    ping         sent after a quiet period; the client answers with pong (or any message)
+    slide_ack    {"reply_to", "slide_index", "status"}
+    reply_delta  {"reply_to", "delta"} streamed reply text (transient)
+    reply        {"reply_to", "text"} complete reply
+    superseded   {"reply_to"} the reply was cancelled by a newer utterance or slide change
+    hands                {"reply_to", "students"} students answering a classroom utterance
+    student_reply_delta  {"reply_to", "student", "delta"} (transient)
+    student_reply        {"reply_to", "student", "text"} one student's complete reply
+    classroom_done       {"reply_to"} every answering student has replied
+    queued       {"reply_to", "position", "retry_after"} the reply waits for an LLM slot (transient)
+    error        {"reply_to", "detail"[, "retry_after"]}; retry_after is set when overloaded
+
+slide_url is a public URL (e.g. S3) or, when S3 is configured, the /images/...
+URL of an uploaded slide.
+Durable events carry a "seq" and are replayed after a reconnect with last_seq.
+
+Configuration (environment variables):
+    WS_HEARTBEAT_SECONDS  Quiet period before the server pings (default 25);
+                          the connection is closed after two silent periods
+"""
+import asyncio
+import os
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, HTTPException, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+
+from app.api.classroom import ClassroomFeedbackRequest, prepare_fanout, run_fanout
+from app.api.feedback import FeedbackRequest, SlideChangeRequest, require_slide_url
+from app.core import metrics, tracing
+from app.core.inflight import Superseded, inflight_replies
+from app.core.scheduler import Overloaded, queue_listener
+from app.core.session_channel import SessionChannel, channel_registry
+from app.core.settings_store import settings_store, validate_session_id
+from app.core.speculation import speculator
+from app.core.workflow_loader import load_workflow_module
+
+router = APIRouter()
+
+HEARTBEAT_SECONDS = float(os.getenv("WS_HEARTBEAT_SECONDS", "25"))
+
+# Policy violation (RFC 6455): invalid session id
+CLOSE_POLICY_VIOLATION = 1008
+CLOSE_GOING_AWAY = 1001
+
+
+def _error_detail(e: Exception) -> str:
+    if isinstance(e, HTTPException):
+        return str(e.detail)
+    if isinstance(e, ValidationError):
+        return "Invalid message: " + "; ".join(
+            f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors()
+        )
+    return str(e)
+
+
+async def handle_slide_change(channel: SessionChannel, message: Dict[str, Any]) -> None:
+    """Record a slide change in the session history and acknowledge it."""
+    reply_to = message.get("id")
+    try:
+        req = SlideChangeRequest(**message)
+        slide_url = require_slide_url(req.slide_url)
+        wf = load_workflow_module()
+        status = "ignored"
+        # A reply about the previous slide is no longer wanted
+        inflight_replies.supersede(channel.session_id, "slide_change")
+        speculator.discard(channel.session_id)
+        if wf and hasattr(wf, "add_slide"):
+            await asyncio.to_thread(wf.add_slide, slide_url, session_id=channel.session_id)
+            status = "ok"
+        await channel.emit("slide_ack", reply_to=reply_to, slide_index=req.slide_index, status=status)
+    except Exception as e:
+        metrics.record_error("ws_slide_change")
+        await channel.emit("error", reply_to=reply_to, detail=_error_detail(e))
+
+
+async def handle_utterance(channel: SessionChannel, message: Dict[str, Any]) -> None:
+    """Start the student's reply to a teacher utterance; it streams in its own task."""
+    reply_to = message.get("id")
+    try:
+        req = FeedbackRequest(**message)
+        require_slide_url(req.slide_url)
+        wf = load_workflow_module()
+        if wf is None or not hasattr(wf, "stream_feedback"):
+            raise RuntimeError("workflow.stream_feedback is not available.")
+        with metrics.stage_timer("prompt_build"):
+            system_prompt = settings_store.system_prompt(channel.session_id)
+    except Exception as e:
+        metrics.record_error("ws_utterance")
+        await channel.emit("error", reply_to=reply_to, detail=_error_detail(e))
+        return
+
+    def on_queued(position: int, retry_after: int) -> None:
+        channel.spawn(channel.emit("queued", durable=False, reply_to=reply_to,
+                                   position=position, retry_after=retry_after))
+
+    async def stream_reply() -> str:
+        with tracing.span("ws.utterance", session=channel.session_id):
+            # Set in the reply task, which is where the scheduler reads it
+            queue_listener.set(on_queued)
+            parts = []
+            async for delta in speculator.reply_stream(wf, req.teacher_text, channel.session_id, system_prompt):
+                parts.append(delta)
+                await channel.emit("reply_delta", durable=False, reply_to=reply_to, delta=delta)
+            return "".join(parts).strip()
+
+    # Registered now, so a later slide change or utterance supersedes it
+    reply = inflight_replies.start(channel.session_id, stream_reply())
+    channel.spawn(deliver_reply(channel, reply_to, reply))
+
+
+async def deliver_reply(channel: SessionChannel, reply_to: Any, reply: "asyncio.Future[str]") -> None:
+    """Wait for a reply started by handle_utterance and send its outcome."""
+    try:
+        text = await inflight_replies.result(reply)
+        await channel.emit("reply", reply_to=reply_to, text=text)
+    except Superseded:
+        await channel.emit("superseded", reply_to=reply_to)
+    except Overloaded as e:
+        await channel.emit("error", reply_to=reply_to, detail=str(e), retry_after=e.retry_after)
+    except Exception as e:
+        metrics.record_error("ws_utterance")
+        await channel.emit("error", reply_to=reply_to, detail=_error_detail(e))
+
+
+async def handle_classroom_utterance(channel: SessionChannel, message: Dict[str, Any]) -> None:
+    """Start the replies of the classroom's answering students, each tagged with its name."""
+    reply_to = message.get("id")
+    try:
+        req = ClassroomFeedbackRequest(**message)
+        fanout = prepare_fanout(channel.session_id, req)
+    except Exception as e:
+        metrics.record_error("ws_classroom_utterance")
+        await channel.emit("error", reply_to=reply_to, detail=_error_detail(e))
+        return
+    await channel.emit("hands", reply_to=reply_to, students=fanout.names)
+
+    async def emit(name, delta, reply):
+        if reply is None:
+            await channel.emit("student_reply_delta", durable=False, reply_to=reply_to, student=name, delta=delta)
+        else:
+            await channel.emit("student_reply", reply_to=reply_to, student=name, text=reply)
+
+    replies = inflight_replies.start(channel.session_id, run_fanout(channel.session_id, req.teacher_text, fanout, emit))
+    channel.spawn(deliver_classroom(channel, reply_to, replies))
+
+
+async def deliver_classroom(channel: SessionChannel, reply_to: Any, replies: asyncio.Future) -> None:
+    """Wait for a fan-out started by handle_classroom_utterance and send its outcome."""
+    try:
+        await inflight_replies.result(replies)
+        await channel.emit("classroom_done", reply_to=reply_to)
+    except Superseded:
+        await channel.emit("superseded", reply_to=reply_to)
+    except Overloaded as e:
+        await channel.emit("error", reply_to=reply_to, detail=str(e), retry_after=e.retry_after)
+    except Exception as e:
+        metrics.record_error("ws_classroom_utterance")
+        await channel.emit("error", reply_to=reply_to, detail=_error_detail(e))
+
+
+async def handle_interim(channel: SessionChannel, message: Dict[str, Any]) -> None:
+    """Feed an interim transcript to the speculator (no reply unless it is invalid)."""
+    try:
+        req = FeedbackRequest(**message)
+        require_slide_url(req.slide_url)
+        wf = load_workflow_module()
+        if wf is not None and hasattr(wf, "draft_feedback"):
+            speculator.interim(wf, channel.session_id, req.teacher_text,
+                               settings_store.system_prompt(channel.session_id))
+    except Exception as e:
+        await channel.emit("error", durable=False, reply_to=message.get("id"), detail=_error_detail(e))
+
+
+HANDLERS = {
+    "slide_change": handle_slide_change,
+    "utterance": handle_utterance,
+    "classroom_utterance": handle_classroom_utterance,
+    "interim": handle_interim,
+}
+
+
+@router.websocket("/ws/{session_id}")
+async def session_socket(websocket: WebSocket, session_id: str, last_seq: Optional[int] = None):
+    """
+    Long-lived channel of a session. Messages are handled in tasks owned by
+    the channel, one after another in arrival order: a slide change is in the
+    history before a later utterance builds its conversation. Only the reply
+    streams run concurrently, so replies keep streaming into the resume buffer
+    if the connection drops, and pings are answered meanwhile.
+    """
+    try:
+        session_id = validate_session_id(session_id)
+    except ValueError as e:
+        await websocket.close(code=CLOSE_POLICY_VIOLATION, reason=str(e))
+        return
+
+    await websocket.accept()
+    channel = channel_registry.get(session_id)
+    await channel.attach(websocket, last_seq)
+    metrics.WS_CONNECTIONS.inc()
+    awaiting_pong = False
+    try:
+        while True:
+            try:
+                message = await asyncio.wait_for(websocket.receive_json(), timeout=HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if awaiting_pong:
+                    await websocket.close(code=CLOSE_GOING_AWAY, reason="heartbeat timeout")
+                    break
+                awaiting_pong = True
+                await channel.emit("ping", durable=False)
+                continue
+            awaiting_pong = False
+
+            if not isinstance(message, dict):
+                message = {}
+            message_type = message.get("type")
+            known = message_type in HANDLERS or message_type in ("ping", "pong")
+            metrics.WS_MESSAGES.labels(type=message_type if known else "unknown", direction="in").inc()
+            if message_type == "ping":
+                await channel.emit("pong", durable=False)
+                continue
+            if message_type == "pong":
+                continue
+            handler = HANDLERS.get(message_type)
+            if handler is None:
+                await channel.emit("error", durable=False, reply_to=message.get("id"),
+                                   detail=f"Unknown message type: {message_type}")
+                continue
+            channel.spawn_ordered(handler(channel, message))
+    except (WebSocketDisconnect, RuntimeError):
+        # RuntimeError: the socket was closed by a newer connection for the session
+        pass
+    except ValueError:
+        # Non-JSON frame
+        await websocket.close(code=CLOSE_POLICY_VIOLATION, reason="Messages must be JSON")
+    finally:
+        metrics.WS_CONNECTIONS.dec()
+        channel.detach(websocket)
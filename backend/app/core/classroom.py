@@ -0,0 +1,111 @@
+"""
+Classroom mode: several student profiles per session answering together.
+
+Each teacher utterance goes to every student that "raises a hand" at once.
+All students share one conversation prefix (classroom system prompt, slides,
+earlier turns and the new utterance) so the provider can reuse its prompt
+cache across the fan-out; only the final persona message differs.
+
+Hand-raising: students addressed by name always answer; otherwise the
+students who have spoken least recently go first, up to the number of hands
+requested (CLASSROOM_MAX_HANDS when not given, 0 = everyone).
+
+Disk layout:
+    data/classrooms/<session_id>.json  {"students": [{"name": ..., <profile fields>}, ...]}
+"""
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from app.core.context_helper import CONTEXT_PATH, render_system_prompt
+from app.core.settings_store import DATA_DIR, SessionDocumentStore
+
+
+MAX_HANDS = int(os.getenv("CLASSROOM_MAX_HANDS", "0"))
+
+# Shared by every student of every classroom; must stay byte-identical for prompt caching
+CLASSROOM_PROMPT = (
+    "You are simulating the students of a classroom while a teacher presents slides. "
+    "Replies of other students appear as assistant messages prefixed with their name. "
+    "Answer only as the student described in the final system message, in that "
+    "student's voice, without prefixing your name."
+)
+
+
+class ClassroomStore(SessionDocumentStore):
+    """Per-session student rosters, persisted like single-student profiles."""
+
+    kind = "classroom"
+
+    def __init__(self, data_dir: Path = DATA_DIR):
+        super().__init__(data_dir)
+        # session -> (turn counter, student name -> turn the student last spoke)
+        self._turns: Dict[str, Tuple[int, Dict[str, int]]] = {}
+        self._turns_lock = threading.Lock()
+
+    def path_for(self, session_id: str) -> Path:
+        return self.data_dir / "classrooms" / f"{session_id}.json"
+
+    def students(self, session_id: str) -> List[dict]:
+        """Profiles of the session's students (empty without a classroom)."""
+        roster = self.get(session_id)
+        return list(roster.get("students", [])) if roster else []
+
+    def record_turn(self, session_id: str, names: List[str]) -> None:
+        """Remember which students just answered (for the hand-raise rotation)."""
+        with self._turns_lock:
+            turn, spoke = self._turns.get(session_id, (0, {}))
+            turn += 1
+            for name in names:
+                spoke[name] = turn
+            self._turns[session_id] = (turn, spoke)
+
+    def last_spoke(self, session_id: str) -> Dict[str, int]:
+        with self._turns_lock:
+            return dict(self._turns.get(session_id, (0, {}))[1])
+
+
+def _addressed(name: str, text: str) -> bool:
+    return re.search(rf"\b{re.escape(name)}\b", text, re.IGNORECASE) is not None
+
+
+def select_hands(
+    students: List[dict], teacher_text: str, last_spoke: Dict[str, int], hands: Optional[int] = None
+) -> List[dict]:
+    """
+    Pick the students who answer an utterance.
+
+    Args:
+        students: Classroom roster (each with a "name")
+        teacher_text: The utterance; students named in it always answer
+        last_spoke: Turn each student last answered in (see ClassroomStore.record_turn)
+        hands: Maximum number of answering students (None: CLASSROOM_MAX_HANDS, 0: everyone)
+
+    Returns:
+        Answering students in roster order
+    """
+    named = [s for s in students if _addressed(s["name"], teacher_text)]
+    if named:
+        return named
+    limit = MAX_HANDS if hands is None else hands
+    if limit <= 0 or limit >= len(students):
+        return list(students)
+    # Least recently heard first; roster order breaks ties
+    ranked = sorted(range(len(students)), key=lambda i: (last_spoke.get(students[i]["name"], 0), i))
+    chosen = set(ranked[:limit])
+    return [s for i, s in enumerate(students) if i in chosen]
+
+
+def persona_prompts(students: List[dict]) -> List[Tuple[str, str]]:
+    """(name, final system message) for each student; the template is read once."""
+    template = CONTEXT_PATH.read_text() if CONTEXT_PATH.exists() else None
+    prompts = []
+    for student in students:
+        persona = render_system_prompt(student, template=template)
+        prompts.append((student["name"], f"You are {student['name']}. {persona}"))
+    return prompts
+
+
+classroom_store = ClassroomStore()
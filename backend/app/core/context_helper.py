@@ -1,37 +1,39 @@
 from pathlib import Path
-from typing import Dict
+from typing import Dict, Optional
 
+# Locate the context template (backend/context.txt)
+CONTEXT_PATH = Path(__file__).parent.parent.parent / "context.txt"
 
-def render_context_from_settings(settings: Dict[str, str]) -> None:
-    """
-    Render the backend/context.txt file by substituting placeholders
-    with values from the provided settings dict.
-
-    Expected placeholders in the template:
-      <persona>, <grade>, <subject>, <level>, <style>
-    """
-    # Locate the context template (backend/context.txt)
-    context_path = Path(__file__).parent.parent.parent / "context.txt"
-    if not context_path.exists():
-        # Nothing to do if the template doesn't exist
-        return
-
-    template = context_path.read_text()
+DEFAULT_SYSTEM_PROMPT = "You are a teaching assistant simulating a student."
 
-    # Map placeholders to settings keys
-    replacements = {
-        "<persona>": settings.get("student_persona", ""),
-        "<grade>": settings.get("grade_level", ""),
-        "<subject>": settings.get("subject", ""),
-        "<level>": settings.get("understanding_level", ""),
-        "<style>": settings.get("explanation_style", ""),
-    }
+# Fallback values used when rendering a prompt for a profile with missing fields
+PROMPT_DEFAULTS = {
+    "student_persona": "curious",
+    "grade_level": "middle",
+    "subject": "general",
+    "understanding_level": "on-level",
+    "explanation_style": "step-by-step",
+}
 
-    rendered = template
-    for placeholder, value in replacements.items():
-        rendered = rendered.replace(placeholder, str(value))
-
-    # Overwrite the context file with rendered content
-    context_path.write_text(rendered)
 
+def render_system_prompt(settings: Optional[Dict[str, str]], template: Optional[str] = None) -> str:
+    """
+    Render the system prompt for a student profile without touching disk
+    (beyond reading the template when it is not passed in).
 
+    Missing or empty profile fields fall back to PROMPT_DEFAULTS. Without a template
+    file a generic prompt is returned.
+    """
+    if template is None:
+        if not CONTEXT_PATH.exists():
+            return DEFAULT_SYSTEM_PROMPT
+        template = CONTEXT_PATH.read_text()
+    settings = settings or {}
+    return (
+        template
+        .replace("<persona>", settings.get("student_persona") or PROMPT_DEFAULTS["student_persona"])
+        .replace("<grade>", settings.get("grade_level") or PROMPT_DEFAULTS["grade_level"])
+        .replace("<subject>", settings.get("subject") or PROMPT_DEFAULTS["subject"])
+        .replace("<level>", settings.get("understanding_level") or PROMPT_DEFAULTS["understanding_level"])
+        .replace("<style>", settings.get("explanation_style") or PROMPT_DEFAULTS["explanation_style"])
+    )
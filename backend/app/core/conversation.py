@@ -0,0 +1,78 @@
+"""
+Prompt-cache-friendly conversation layout.
+
+Providers cache the longest previously seen prompt prefix, so everything
+that stays the same for a session comes first and the volatile parts last:
+
+    1. system prompt (profile persona, or the shared classroom prompt)
+    2. deck outline (one line per slide; fixed for the whole lesson)
+    3. turns in history order (slides shown, utterances, replies); only
+       ever appended to, so earlier turns remain part of the prefix
+    4. the new utterance, then per-call suffix messages (e.g. the persona
+       of one classroom student)
+
+Messages are rendered deterministically (same text, same image part layout)
+so the prefix is byte-identical from one call to the next. Local slide URLs
+are resolved through app.core.slide_store (all slides of a call with one
+lookup, see resolve_slides), so a slide's image part changes once, when its
+S3 replica is confirmed.
+"""
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+from app.core.slide_store import slide_store
+
+Message = Tuple[str, Any]
+
+
+def resolve_slides(slide_urls: Iterable[str]) -> Dict[str, str]:
+    """Provider URLs of the slides of a conversation, resolved together."""
+    return slide_store.resolve_all(slide_urls)
+
+
+def slide_message(slide_url: str, resolved: Optional[Mapping[str, str]] = None) -> Message:
+    """
+    A slide image shown to the model. Local /images/... URLs are looked up in
+    resolved (from resolve_slides), or resolved on their own if missing there.
+    """
+    url = resolved.get(slide_url) if resolved else None
+    if url is None:
+        url = slide_store.resolve(slide_url)
+    return ("user", [{"type": "image_url", "image_url": {"url": url, "detail": "high"}}])
+
+
+def deck_message(outline: Sequence[str]) -> Optional[Message]:
+    """The deck outline as a system message (None for an empty outline)."""
+    if not any(outline):
+        return None
+    lines = [f"{i}. {text}" if text else f"{i}. (no text)" for i, text in enumerate(outline, start=1)]
+    return ("system", "Outline of the slide deck being presented:\n" + "\n".join(lines))
+
+
+def build_conversation(
+    system_prompt: Optional[str],
+    deck_outline: Sequence[str],
+    turns: Sequence[Message],
+    user_text: Optional[str] = None,
+    suffix: Sequence[Message] = (),
+) -> List[Message]:
+    """
+    Assemble the messages of a call in cache-friendly order.
+
+    Args:
+        system_prompt: Leading system message (omitted if None)
+        deck_outline: Per-slide summaries of the deck (may be empty)
+        turns: Earlier messages in history order, without system messages
+        user_text: The new utterance (omitted if None)
+        suffix: Messages that differ per call, placed last
+    """
+    conversation: List[Message] = []
+    if system_prompt is not None:
+        conversation.append(("system", system_prompt))
+    deck = deck_message(deck_outline)
+    if deck is not None:
+        conversation.append(deck)
+    conversation.extend(turns)
+    if user_text is not None:
+        conversation.append(("user", user_text))
+    conversation.extend(suffix)
+    return conversation
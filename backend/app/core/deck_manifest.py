@@ -0,0 +1,115 @@
+"""
+Manifest of pre-ingested decks.
+
+tools/ingest_decks.py converts decks ahead of time into a deck cache
+directory (outside data/, which may be reset on startup):
+
+    <cache>/images/<namespace>/slide_000_<hash>.png   converted slides
+    <cache>/manifest.json                             one entry per deck
+
+At startup every worker loads the manifest and links the cached namespaces
+into data/images, so the first upload of a known deck is a cache hit in
+SlideConverter. The upload route also reuses the S3 URLs and deck outline
+recorded at ingestion, and namespace cleanup leaves these decks alone.
+
+Manifest entries (keyed by namespace, see SlideConverter.namespace_for):
+    {"namespace", "source", "slides": [file names], "s3_urls": [...],
+     "outline": [...], "ingested_at"}
+
+Configuration (environment variables):
+    DECK_CACHE_DIR  Deck cache directory (default: backend/deck_cache)
+"""
+import json
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.core.slide_converter import MANIFEST_NAME
+
+
+DEFAULT_CACHE_DIR = Path(__file__).parent.parent.parent / "deck_cache"
+MANIFEST_FILE = "manifest.json"
+
+
+def read_manifest(path: Path) -> Dict[str, dict]:
+    """Deck entries of a manifest file (empty if it does not exist)."""
+    try:
+        return json.loads(path.read_text()).get("decks", {})
+    except FileNotFoundError:
+        return {}
+
+
+def write_manifest(path: Path, decks: Dict[str, dict]) -> None:
+    """Replace a manifest file atomically."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(prefix=".manifest-", dir=path.parent)
+    with os.fdopen(fd, "w") as f:
+        json.dump({"version": 1, "decks": decks}, f, indent=2, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def _link_tree(src: Path, dst: Path) -> None:
+    """Hard-link (or copy, across filesystems) the files of src into a new directory dst."""
+    dst.mkdir()
+    for item in src.iterdir():
+        try:
+            os.link(item, dst / item.name)
+        except OSError:
+            shutil.copy2(item, dst / item.name)
+
+
+class DeckManifest:
+    """Pre-ingested decks known to this worker."""
+
+    def __init__(self, cache_dir: Path):
+        self.cache_dir = Path(cache_dir)
+        self.decks: Dict[str, dict] = {}
+
+    @property
+    def images_dir(self) -> Path:
+        return self.cache_dir / "images"
+
+    @property
+    def path(self) -> Path:
+        return self.cache_dir / MANIFEST_FILE
+
+    def get(self, namespace: str) -> Optional[dict]:
+        return self.decks.get(namespace)
+
+    def load_and_seed(self, images_dir: Path) -> int:
+        """
+        Load the manifest and link its namespaces into images_dir.
+        Namespaces already present are left as they are.
+
+        Returns:
+            Number of namespaces linked
+        """
+        try:
+            self.decks = read_manifest(self.path)
+        except (OSError, ValueError) as e:
+            print(f"Warning: could not read deck manifest {self.path}: {e}")
+            self.decks = {}
+        seeded = 0
+        for namespace in self.decks:
+            src = self.images_dir / namespace
+            dst = Path(images_dir) / namespace
+            if dst.exists() or not (src / MANIFEST_NAME).exists():
+                continue
+            # Link into a work dir and rename, like a conversion publishes a namespace
+            work_dir = Path(tempfile.mkdtemp(prefix=f".{namespace}-", dir=images_dir))
+            work_dir.rmdir()
+            try:
+                _link_tree(src, work_dir)
+                work_dir.rename(dst)
+                seeded += 1
+            except OSError as e:
+                # Another worker seeded it first, or the cache is unreadable
+                shutil.rmtree(work_dir, ignore_errors=True)
+                if not dst.exists():
+                    print(f"Warning: could not seed deck {namespace}: {e}")
+        return seeded
+
+
+deck_manifest = DeckManifest(Path(os.getenv("DECK_CACHE_DIR") or DEFAULT_CACHE_DIR))
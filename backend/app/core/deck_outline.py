@@ -0,0 +1,80 @@
+"""
+Deck outline: a short text summary of every slide of an uploaded deck.
+
+The outline is placed near the start of every conversation about the deck,
+ahead of the turns, so the model knows where the lesson is going and the
+prompt prefix stays identical for the whole lesson (see app.core.conversation).
+
+PPTX text is read with python-pptx, PDF text with poppler's pdftotext (the
+same poppler install pdf2image needs). Other formats, or a missing tool,
+give an empty outline.
+"""
+import io
+import shutil
+import subprocess
+from pathlib import Path
+from typing import List
+
+from app.core import tracing
+
+# Characters kept per slide
+MAX_SLIDE_CHARS = 160
+
+
+def _summarize(text: str) -> str:
+    summary = " ".join(text.split())
+    if len(summary) > MAX_SLIDE_CHARS:
+        summary = summary[:MAX_SLIDE_CHARS - 3].rstrip() + "..."
+    return summary
+
+
+def _pptx_texts(file_content: bytes) -> List[str]:
+    from pptx import Presentation
+
+    texts = []
+    for slide in Presentation(io.BytesIO(file_content)).slides:
+        parts = []
+        title = slide.shapes.title
+        title_id = None
+        if title is not None and title.has_text_frame:
+            title_id = title.shape_id
+            parts.append(title.text_frame.text)
+        for shape in slide.shapes:
+            if shape.shape_id != title_id and shape.has_text_frame:
+                parts.append(shape.text_frame.text)
+        texts.append(" ".join(parts))
+    return texts
+
+
+def _pdf_texts(file_content: bytes) -> List[str]:
+    if not shutil.which("pdftotext"):
+        return []
+    result = subprocess.run(
+        ["pdftotext", "-layout", "-", "-"], input=file_content, capture_output=True, timeout=60
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode(errors="replace").strip())
+    pages = result.stdout.decode(errors="replace").split("\f")
+    # pdftotext ends the last page with a form feed as well
+    return pages[:-1] if pages and not pages[-1].strip() else pages
+
+
+def extract_outline(file_content: bytes, filename: str) -> List[str]:
+    """
+    Return one short summary per slide (empty strings for slides without text).
+    Never raises: an outline is optional, so failures return an empty list.
+    """
+    ext = Path(filename).suffix.lower()
+    try:
+        with tracing.span("convert.outline", ext=ext) as sp:
+            if ext == ".pptx":
+                texts = _pptx_texts(file_content)
+            elif ext == ".pdf":
+                texts = _pdf_texts(file_content)
+            else:
+                texts = []
+            sp.set_attribute("slides", len(texts))
+    except Exception as e:
+        print(f"Warning: could not extract deck outline: {e}")
+        return []
+    return [_summarize(text) for text in texts]
@@ -0,0 +1,388 @@
+"""
+Append-only, indexed conversation log.
+
+Each session's history is a JSONL file of records, one per line:
+
+    {"role": "system", "content": "<rendered prompt>"}
+    {"role": "deck", "content": ["<slide 1 summary>", ...]}
+    {"role": "slide", "content": "<slide url>"}
+    {"role": "user", "content": "<teacher utterance>"}
+    {"role": "assistant", "content": "<reply>"[, "student": "<name>"]}
+
+JSON escapes newlines, so any reply text is safe. Next to the log,
+<log>.idx holds a fixed-width entry per record (byte offset, length and
+number of the latest slide record). A read takes the header (system and
+deck records) plus the last HISTORY_WINDOW_RECORDS records with a few
+seeks and one contiguous read, however long the lesson gets. The window
+start advances in steps of half the window, so the prompt prefix stays the
+same for many turns (see app.core.conversation), and the slide on screen
+at the window start is always included.
+
+Writers append a whole exchange with one write under an exclusive flock
+on <log>.lock, and update the index afterwards, so readers (shared lock)
+only see complete records. A crash can leave a torn last record or an
+index that is behind the log. This is detected on the next access in O(1)
+(the last index entry must end where the log ends). The tail is then
+re-indexed and a torn record truncated. fsync is batched: appends within
+HISTORY_FSYNC_MS of each other are synced together by one background
+flush. The index is never fsynced; it can always be rebuilt from the log.
+
+Configuration (environment variables):
+    HISTORY_WINDOW_RECORDS  Records after the header sent to the model (default 160, 0 = all)
+    HISTORY_FSYNC_MS        Group commit interval; 0 fsyncs every append (default 200)
+"""
+import json
+import os
+import struct
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None  # type: ignore
+
+from app.core import metrics
+
+
+WINDOW_RECORDS = int(os.getenv("HISTORY_WINDOW_RECORDS", "160"))
+FSYNC_SECONDS = float(os.getenv("HISTORY_FSYNC_MS", "200")) / 1000
+
+HEADER_ROLES = ("system", "deck")
+# Index entry: offset, length, number of the latest slide record at or before it
+ENTRY = struct.Struct("<QII")
+NO_SLIDE = 0xFFFFFFFF
+
+Record = Dict[str, Any]
+
+HISTORY_RECOVERIES = metrics.REGISTRY.counter(
+    "snail_history_recoveries_total",
+    "History logs repaired on access by kind (reindexed, truncated)",
+    labelnames=("kind",),
+)
+
+
+def encode_record(record: Record) -> bytes:
+    return (json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n").encode("utf-8")
+
+
+def decode_record(line: bytes) -> Optional[Record]:
+    """Parse one log line (None if it is not a valid record)."""
+    try:
+        record = json.loads(line)
+    except ValueError:
+        return None
+    if not isinstance(record, dict) or not isinstance(record.get("role"), str):
+        return None
+    return record
+
+
+def iter_records(path: Path) -> Iterator[Record]:
+    """Valid records of a log file, read without the index and without repairing it."""
+    with open(path, "rb") as f:
+        for line in f:
+            if line.endswith(b"\n"):
+                record = decode_record(line)
+                if record is not None:
+                    yield record
+
+
+def read_legacy_history(path: Path) -> List[Record]:
+    """
+    Convert a history in the old "role:::content" line format to records.
+    Lines that do not start a known role continue the previous record, which
+    recovers replies that contained newlines (or blank lines). A deck line
+    that is not valid JSON is skipped, with the lines continuing it.
+    """
+    records: List[Record] = []
+    # Text record that continuation lines extend
+    current: Optional[Record] = None
+    skipped = 0
+    with open(path, "r") as f:
+        for line in f.read().split("\n"):
+            role, sep, content = line.partition(":::")
+            if sep and role in ("system", "deck", "slide", "user", "assistant"):
+                current = None
+                if role == "deck":
+                    try:
+                        records.append({"role": role, "content": json.loads(content)})
+                    except ValueError:
+                        skipped += 1
+                    continue
+                current = {"role": role, "content": content}
+                records.append(current)
+            elif current is not None:
+                current["content"] += "\n" + line
+    # The file ends with a newline, which the loop reads as an empty continuation
+    if current is not None:
+        current["content"] = current["content"].rstrip("\n")
+    if skipped:
+        print(f"Warning: skipped {skipped} malformed deck line(s) in {path}")
+    return records
+
+
+class _GroupCommit:
+    """Batches fsyncs of recently appended logs into one background flush."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._dirty: Set[str] = set()
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def mark(self, path: Path) -> None:
+        with self._lock:
+            self._dirty.add(str(path))
+            if self._timer is None:
+                self._timer = threading.Timer(self.interval, self.sync)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def sync(self) -> None:
+        """fsync every log appended to since the last flush."""
+        with self._lock:
+            paths, self._dirty = self._dirty, set()
+            self._timer = None
+        for path in paths:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                os.fsync(fd)
+            except OSError as e:
+                metrics.record_error("history_fsync")
+                print(f"Warning: fsync of {path} failed: {e}")
+            finally:
+                os.close(fd)
+
+
+group_commit = _GroupCommit(FSYNC_SECONDS)
+
+
+def sync() -> None:
+    """Flush pending group commits (call before shutdown)."""
+    group_commit.sync()
+
+
+class HistoryLog:
+    """One session's conversation log and its offset index."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.index_path = Path(f"{path}.idx")
+        self.lock_path = Path(f"{path}.lock")
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    @contextmanager
+    def _locked(self, exclusive: bool) -> Iterator[None]:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.lock_path, "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    # Index helpers
+
+    def _entries(self, idx, first: int, count: int) -> List[Tuple[int, int, int]]:
+        idx.seek(first * ENTRY.size)
+        data = idx.read(count * ENTRY.size)
+        return [ENTRY.unpack_from(data, i * ENTRY.size) for i in range(len(data) // ENTRY.size)]
+
+    def _consistent(self) -> bool:
+        """O(1) check that the index covers exactly the log."""
+        try:
+            log_size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return not self.index_path.exists()
+        try:
+            idx_size = os.path.getsize(self.index_path)
+        except FileNotFoundError:
+            return log_size == 0
+        if idx_size % ENTRY.size:
+            return False
+        if idx_size == 0:
+            return log_size == 0
+        with open(self.index_path, "rb") as idx:
+            offset, length, _ = self._entries(idx, idx_size // ENTRY.size - 1, 1)[0]
+        return offset + length == log_size
+
+    def _recover(self) -> None:
+        """Re-index the unindexed tail of the log and truncate a torn last record (exclusive lock held)."""
+        if not self.path.exists():
+            self.index_path.unlink(missing_ok=True)
+            return
+        log_size = os.path.getsize(self.path)
+        entries: List[Tuple[int, int, int]] = []
+        if self.index_path.exists():
+            with open(self.index_path, "rb") as idx:
+                entries = self._entries(idx, 0, os.path.getsize(self.index_path) // ENTRY.size)
+        # Keep index entries that lie within the log
+        while entries and entries[-1][0] + entries[-1][1] > log_size:
+            entries.pop()
+        valid = len(entries)
+        position = entries[-1][0] + entries[-1][1] if entries else 0
+        last_slide = entries[-1][2] if entries else NO_SLIDE
+        good_end = position
+        with open(self.path, "rb") as log:
+            log.seek(position)
+            for line in log:
+                if line.endswith(b"\n"):
+                    record = decode_record(line)
+                    if record is not None:
+                        if record["role"] == "slide":
+                            last_slide = len(entries)
+                        entries.append((position, len(line), last_slide))
+                        good_end = position + len(line)
+                position += len(line)
+        if good_end < log_size:
+            # A torn write (or garbage) after the last valid record
+            with open(self.path, "r+b") as log:
+                log.truncate(good_end)
+            HISTORY_RECOVERIES.labels(kind="truncated").inc()
+            print(f"Warning: truncated {log_size - good_end} bytes of torn history in {self.path}")
+        with open(self.index_path, "r+b" if self.index_path.exists() else "wb") as idx:
+            idx.seek(valid * ENTRY.size)
+            idx.write(b"".join(ENTRY.pack(*entry) for entry in entries[valid:]))
+            idx.truncate(len(entries) * ENTRY.size)
+        if len(entries) > valid:
+            HISTORY_RECOVERIES.labels(kind="reindexed").inc()
+
+    def _ensure_consistent(self) -> None:
+        """Repair the log if needed; called with the exclusive lock held."""
+        if not self._consistent():
+            self._recover()
+
+    # Writes
+
+    def reset(self, records: List[Record]) -> None:
+        """Replace the whole log (a new conversation) with the given records."""
+        data, entries = self._encode(records, 0, 0, NO_SLIDE)
+        with self._locked(exclusive=True):
+            # Without an index the log is re-indexed on access, so a crash
+            # between the two replaces leaves a consistent state
+            self.index_path.unlink(missing_ok=True)
+            self._write_atomic(self.path, data)
+            self._write_atomic(self.index_path, b"".join(ENTRY.pack(*e) for e in entries))
+        if FSYNC_SECONDS > 0:
+            group_commit.mark(self.path)
+
+    def append(self, records: List[Record]) -> None:
+        """Append records (e.g. one utterance and its reply) as a single write."""
+        with self._locked(exclusive=True):
+            self._ensure_consistent()
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                start = os.fstat(fd).st_size
+                with open(self.index_path, "r+b" if self.index_path.exists() else "w+b") as idx:
+                    count = idx.seek(0, os.SEEK_END) // ENTRY.size
+                    last_slide = self._entries(idx, count - 1, 1)[0][2] if count else NO_SLIDE
+                    data, entries = self._encode(records, start, count, last_slide)
+                    # Log first: the index never points past complete records
+                    os.write(fd, data)
+                    if FSYNC_SECONDS <= 0:
+                        os.fsync(fd)
+                    idx.seek(count * ENTRY.size)
+                    idx.write(b"".join(ENTRY.pack(*e) for e in entries))
+            finally:
+                os.close(fd)
+        if FSYNC_SECONDS > 0:
+            group_commit.mark(self.path)
+
+    @staticmethod
+    def _encode(records: List[Record], offset: int, number: int,
+                last_slide: int) -> Tuple[bytes, List[Tuple[int, int, int]]]:
+        lines, entries = [], []
+        for i, record in enumerate(records):
+            line = encode_record(record)
+            if record["role"] == "slide":
+                last_slide = number + i
+            entries.append((offset, len(line), last_slide))
+            lines.append(line)
+            offset += len(line)
+        return b"".join(lines), entries
+
+    @staticmethod
+    def _write_atomic(path: Path, data: bytes) -> None:
+        tmp = Path(f"{path}.tmp")
+        with open(tmp, "wb") as f:
+            f.write(data)
+            if FSYNC_SECONDS <= 0:
+                os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    # Reads
+
+    def read_window(self, max_records: int = WINDOW_RECORDS) -> Tuple[List[Record], List[Record]]:
+        """
+        Read the header records and the latest turns.
+
+        Args:
+            max_records: Records after the header to return at most (0 = all)
+
+        Returns:
+            (header records, window records in log order); the window starts
+            with the slide on screen at its first turn when that slide is
+            older than the window
+        """
+        if not self.exists():
+            return [], []
+        # Readers share the lock; a log that needs repair is re-read under the exclusive lock
+        for repair in (False, True):
+            with self._locked(exclusive=repair):
+                if repair:
+                    self._ensure_consistent()
+                elif not self._consistent():
+                    continue
+                return self._read_window(max_records)
+        raise AssertionError("unreachable")
+
+    def _read_window(self, max_records: int) -> Tuple[List[Record], List[Record]]:
+        if not self.index_path.exists():
+            # An empty log
+            return [], []
+        with open(self.index_path, "rb") as idx, open(self.path, "rb") as log:
+            count = os.fstat(idx.fileno()).st_size // ENTRY.size
+            header: List[Record] = []
+            for offset, length, _ in self._entries(idx, 0, min(len(HEADER_ROLES), count)):
+                log.seek(offset)
+                record = decode_record(log.read(length))
+                if record is None or record["role"] not in HEADER_ROLES:
+                    break
+                header.append(record)
+            first = len(header)
+            body = count - first
+            start = first
+            if max_records > 0 and body > max_records:
+                # Advance in steps so the prompt prefix changes only now and then
+                step = max(1, max_records // 2)
+                start = first + -(-(body - max_records) // step) * step
+            entries = self._entries(idx, start, count - start)
+            window: List[Record] = []
+            if entries and first <= entries[0][2] < start:
+                offset, length, _ = self._entries(idx, entries[0][2], 1)[0]
+                log.seek(offset)
+                slide = decode_record(log.read(length))
+                if slide is not None:
+                    window.append(slide)
+            if entries:
+                base = entries[0][0]
+                log.seek(base)
+                data = log.read(entries[-1][0] + entries[-1][1] - base)
+                for offset, length, _ in entries:
+                    record = decode_record(data[offset - base:offset - base + length])
+                    if record is not None:
+                        window.append(record)
+        return header, window
+
+    def read_all(self) -> List[Record]:
+        header, window = self.read_window(max_records=0)
+        return header + window
@@ -0,0 +1,93 @@
+"""
+Per-session supersession of in-flight student replies.
+
+Each session has at most one reply being generated. A newer utterance or a
+slide change cancels the outstanding one: the provider stream is closed
+(saving the remaining completion tokens) and the stale reply is never
+written to the session history.
+
+State is per worker process; with several workers, requests of one session
+only supersede each other when they land on the same worker (which is the
+case for the WebSocket channel).
+"""
+import asyncio
+import weakref
+from typing import Awaitable, Dict, TypeVar
+
+from app.core import metrics
+
+
+T = TypeVar("T")
+
+
+class Superseded(Exception):
+    """The reply was cancelled by a newer request of the same session."""
+
+
+class InflightReplies:
+    """Tracks the reply task of each session."""
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._superseded: "weakref.WeakSet[asyncio.Task]" = weakref.WeakSet()
+
+    def supersede(self, session_id: str, reason: str) -> bool:
+        """
+        Cancel the session's outstanding reply, if any.
+
+        Args:
+            session_id: Session whose reply is cancelled
+            reason: What superseded it ("utterance" or "slide_change"), for metrics
+
+        Returns:
+            True if a reply was cancelled
+        """
+        task = self._tasks.pop(session_id, None)
+        if task is None or task.done():
+            return False
+        self._superseded.add(task)
+        task.cancel()
+        metrics.LLM_SUPERSEDED.labels(reason=reason).inc()
+        return True
+
+    def start(self, session_id: str, coro: Awaitable[T]) -> "asyncio.Future[T]":
+        """
+        Start coro as the session's current reply, superseding the previous one.
+        The reply is registered before this returns, so a request handled
+        right after it supersedes it. Wait for it with result().
+        """
+        self.supersede(session_id, "utterance")
+        task = asyncio.ensure_future(coro)
+        self._tasks[session_id] = task
+        task.add_done_callback(lambda t: self._forget(session_id, t))
+        return task
+
+    async def result(self, task: "asyncio.Future[T]") -> T:
+        """
+        Wait for a reply from start().
+
+        Raises:
+            Superseded: If a newer request cancelled this reply
+        """
+        try:
+            return await task
+        except asyncio.CancelledError:
+            if task in self._superseded:
+                raise Superseded() from None
+            raise
+
+    async def run(self, session_id: str, coro: Awaitable[T]) -> T:
+        """
+        Run coro as the session's current reply, superseding the previous one.
+
+        Raises:
+            Superseded: If a newer request cancelled this reply
+        """
+        return await self.result(self.start(session_id, coro))
+
+    def _forget(self, session_id: str, task: asyncio.Future) -> None:
+        if self._tasks.get(session_id) is task:
+            del self._tasks[session_id]
+
+
+inflight_replies = InflightReplies()
@@ -0,0 +1,425 @@
+"""
+Lightweight in-process metrics registry rendered in the Prometheus text format.
+
+Counters, gauges and histograms are kept in memory and exposed by the
+/metrics endpoint. No external client library is required.
+"""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+# Default latency buckets (seconds), roughly covering 5ms .. 2min
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0
+)
+
+# Buckets for token counts
+TOKEN_BUCKETS: Tuple[float, ...] = (
+    16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768
+)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Dict[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.extend(extra.items())
+    if not pairs:
+        return ""
+    body = ",".join(
+        '{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in pairs
+    )
+    return "{" + body + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class for a metric family with optional labels."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._children: Dict[Tuple[str, ...], "_Metric"] = {}
+
+    def labels(self, *values: str, **kwargs: str):
+        """Return the child metric for the given label values."""
+        if kwargs:
+            values = tuple(str(kwargs[name]) for name in self.labelnames)
+        else:
+            values = tuple(str(v) for v in values)
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {values}")
+        with self._lock:
+            child = self._children.get(values)
+            if child is None:
+                child = self._new_child()
+                self._children[values] = child
+            return child
+
+    def _new_child(self) -> "_Metric":
+        raise NotImplementedError
+
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        raise NotImplementedError
+
+    def _iter_children(self) -> List[Tuple[Tuple[str, ...], "_Metric"]]:
+        if not self.labelnames:
+            return [((), self)]
+        with self._lock:
+            return sorted(self._children.items())
+
+    def render(self) -> List[str]:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        for values, child in self._iter_children():
+            for suffix, extra, value in child._samples():
+                extra_labels = dict([extra.split("=", 1)]) if extra else None
+                lines.append(
+                    f"{self.name}{suffix}{_format_labels(self.labelnames, values, extra_labels)} {_format_value(value)}"
+                )
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._value = 0.0
+
+    def _new_child(self) -> "Counter":
+        return Counter(self.name, self.documentation)
+
+    def inc(self, amount: float = 1.0) -> None:
+        if amount < 0:
+            raise ValueError("Counters can only be incremented")
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        return [("_total" if not self.name.endswith("_total") else "", "", self._value)]
+
+
+class Gauge(_Metric):
+    """Value that can go up and down."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._value = 0.0
+
+    def _new_child(self) -> "Gauge":
+        return Gauge(self.name, self.documentation)
+
+    def inc(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0) -> None:
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self._value = float(value)
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    @contextmanager
+    def track_inprogress(self) -> Iterator[None]:
+        """Increment while the block runs, decrement when it exits."""
+        self.inc()
+        try:
+            yield
+        finally:
+            self.dec()
+
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        return [("", "", self._value)]
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed upper bounds."""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._count = 0
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value: float) -> None:
+        idx = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[idx] += 1
+            self._sum += value
+            self._count += 1
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        """Observe the wall-clock duration of the block in seconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    @property
+    def count(self) -> int:
+        return self._count
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def _samples(self) -> List[Tuple[str, str, float]]:
+        samples = []
+        cumulative = 0
+        with self._lock:
+            counts = list(self._counts)
+            total_sum, total_count = self._sum, self._count
+        for bound, bucket_count in zip(self.buckets, counts):
+            cumulative += bucket_count
+            samples.append(("_bucket", f"le={_format_value(bound)}", cumulative))
+        samples.append(("_bucket", "le=+Inf", total_count))
+        samples.append(("_sum", "", total_sum))
+        samples.append(("_count", "", total_count))
+        return samples
+
+
+class Registry:
+    """Collection of metric families rendered together."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))  # type: ignore[return-value]
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))  # type: ignore[return-value]
+
+    def histogram(
+        self,
+        name: str,
+        documentation: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))  # type: ignore[return-value]
+
+    def render(self) -> str:
+        """Render every registered metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# Content type expected by Prometheus scrapers
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# ---------------------------------------------------------------------------
+# Application metrics
+# ---------------------------------------------------------------------------
+
+# Per-stage pipeline latency. Stages:
+#   upload_receive, libreoffice, rasterize, s3_upload_slide, prompt_build
+STAGE_SECONDS = REGISTRY.histogram(
+    "snail_stage_duration_seconds",
+    "Duration of individual pipeline stages",
+    labelnames=("stage",),
+)
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "snail_http_request_duration_seconds",
+    "HTTP request latency by route",
+    labelnames=("method", "route"),
+)
+
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "snail_http_requests_in_flight",
+    "HTTP requests currently being processed",
+    labelnames=("route",),
+)
+
+LLM_TTFT_SECONDS = REGISTRY.histogram(
+    "snail_llm_time_to_first_token_seconds",
+    "Time from sending an LLM request until the first content token arrives",
+    labelnames=("model",),
+)
+
+LLM_TOTAL_SECONDS = REGISTRY.histogram(
+    "snail_llm_request_duration_seconds",
+    "Total duration of LLM completion calls",
+    labelnames=("model",),
+)
+
+LLM_TOKENS = REGISTRY.histogram(
+    "snail_llm_tokens",
+    "Tokens per LLM call, by direction (prompt/completion)",
+    labelnames=("model", "direction"),
+    buckets=TOKEN_BUCKETS,
+)
+
+LLM_PROMPT_TOKENS = REGISTRY.counter(
+    "snail_llm_prompt_tokens_total",
+    "Prompt tokens by whether the provider served them from its prompt cache (cache=hit/miss)",
+    labelnames=("model", "cache"),
+)
+
+LLM_IN_FLIGHT = REGISTRY.gauge(
+    "snail_llm_requests_in_flight",
+    "LLM completion calls currently outstanding",
+)
+
+CACHE_REQUESTS = REGISTRY.counter(
+    "snail_cache_requests_total",
+    "Cache lookups by cache name and result (hit/miss)",
+    labelnames=("cache", "result"),
+)
+
+ERRORS = REGISTRY.counter(
+    "snail_errors_total",
+    "Errors by component",
+    labelnames=("component",),
+)
+
+LLM_SUPERSEDED = REGISTRY.counter(
+    "snail_llm_superseded_total",
+    "In-flight LLM calls cancelled because a newer utterance or slide change arrived",
+    labelnames=("reason",),
+)
+
+LLM_TOKENS_SAVED = REGISTRY.counter(
+    "snail_llm_tokens_saved_total",
+    "Completion tokens not generated because a streaming call was cancelled (max_tokens minus tokens seen)",
+    labelnames=("model",),
+)
+
+LLM_ROUTES = REGISTRY.counter(
+    "snail_llm_routes_total",
+    "LLM calls by chosen model and routing reason",
+    labelnames=("model", "reason"),
+)
+
+LLM_HEDGES = REGISTRY.counter(
+    "snail_llm_hedges_total",
+    "Hedged LLM requests: fired or skipped (no free slot), and whether the hedge won or lost the race",
+    labelnames=("outcome",),
+)
+
+SPECULATIONS = REGISTRY.counter(
+    "snail_speculations_total",
+    "Speculative replies from interim transcripts by outcome "
+    "(started, restarted, committed, mismatched, stale, discarded, failed)",
+    labelnames=("outcome",),
+)
+
+LLM_ACTIVE = REGISTRY.gauge(
+    "snail_llm_scheduler_active",
+    "LLM completions holding a scheduler slot",
+)
+
+LLM_QUEUE_DEPTH = REGISTRY.gauge(
+    "snail_llm_scheduler_queue_depth",
+    "LLM calls waiting for a scheduler slot",
+)
+
+LLM_QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    "snail_llm_scheduler_wait_seconds",
+    "Time LLM calls waited for a scheduler slot",
+)
+
+LLM_ADMISSIONS = REGISTRY.counter(
+    "snail_llm_scheduler_admissions_total",
+    "Scheduler decisions by result (admitted, rejected, timeout; "
+    "extra_admitted, extra_refused for hedged requests)",
+    labelnames=("result",),
+)
+
+LLM_RATE_LIMITED = REGISTRY.counter(
+    "snail_llm_rate_limited_total",
+    "Provider 429 responses that paused the scheduler",
+)
+
+TRACES_DROPPED = REGISTRY.counter(
+    "snail_traces_dropped_total",
+    "Finished traces not exported because the export queue was full",
+)
+
+WS_CONNECTIONS = REGISTRY.gauge(
+    "snail_ws_connections",
+    "Open WebSocket session channels",
+)
+
+WS_MESSAGES = REGISTRY.counter(
+    "snail_ws_messages_total",
+    "WebSocket messages by type and direction (in/out)",
+    labelnames=("type", "direction"),
+)
+
+
+def stage_timer(stage: str):
+    """Context manager timing a pipeline stage into STAGE_SECONDS."""
+    return STAGE_SECONDS.labels(stage=stage).time()
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """Count a cache hit or miss."""
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def record_error(component: str) -> None:
+    """Count an error for the given component."""
+    ERRORS.labels(component=component).inc()
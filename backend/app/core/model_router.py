@@ -0,0 +1,252 @@
+"""
+Latency-aware model routing for student replies.
+
+Per turn, a fast model (OPENAI_FAST_MODEL) or the strong model (OPENAI_MODEL)
+is chosen: a slide that has not been discussed yet or a long explanation
+goes to the strong model, short conversational turns to the fast one.
+
+Streaming calls are bounded by a deadline and hedged: if the first request
+has not produced a token after the recent p95 time-to-first-token of its
+model, an identical second request is fired and whichever produces a token
+first is kept; the other one is cancelled (its completion tokens are
+counted as saved). The hedge counts as a request of its own: the caller's
+admit_hedge hook (the scheduler's try_admit) must grant it a slot, otherwise
+the call waits for the primary alone.
+
+Configuration (environment variables):
+    OPENAI_MODEL            Strong model (always used when no fast model is set)
+    OPENAI_FAST_MODEL       Fast model for short turns (optional)
+    LLM_FAST_MAX_WORDS      Longest teacher utterance routed to the fast model (default 25)
+    LLM_DEADLINE_SECONDS    Total time allowed per call (default 30)
+    LLM_HEDGE_ENABLED       "0" disables hedged requests (default "1")
+    LLM_HEDGE_AFTER_MS      Hedge delay until enough latency samples exist (default 2000)
+    LLM_HEDGE_MIN_MS        Lower bound for the p95-based hedge delay (default 300)
+"""
+import asyncio
+import math
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+from app.core import metrics
+
+
+# Samples needed before the observed p95 replaces LLM_HEDGE_AFTER_MS
+MIN_SAMPLES = 20
+
+
+# Admits a hedged request: returns the callback releasing its admission, or None
+AdmitHedge = Callable[[], Optional[Callable[[], None]]]
+
+
+def _noop() -> None:
+    pass
+
+
+class DeadlineExceeded(TimeoutError):
+    """An LLM call did not finish within its deadline."""
+
+
+class Route:
+    """Model chosen for one call and why."""
+
+    def __init__(self, model: str, reason: str):
+        self.model = model
+        self.reason = reason
+
+
+def _last_text(conversation: Sequence[Tuple[str, Any]]) -> str:
+    for role, content in reversed(conversation):
+        if role == "user" and isinstance(content, str):
+            return content
+    return ""
+
+
+def _has_undiscussed_slide(conversation: Sequence[Tuple[str, Any]]) -> bool:
+    """True if a slide image was shown after the last student reply."""
+    for role, content in reversed(conversation):
+        if role == "assistant":
+            return False
+        if role == "user" and isinstance(content, list):
+            return True
+    return False
+
+
+class ModelRouter:
+    """Chooses models and runs hedged, deadline-bounded streaming calls."""
+
+    def __init__(self):
+        self.fast_max_words = int(os.getenv("LLM_FAST_MAX_WORDS", "25"))
+        self.deadline = float(os.getenv("LLM_DEADLINE_SECONDS", "30"))
+        self.hedge_enabled = os.getenv("LLM_HEDGE_ENABLED", "1").lower() not in ("0", "false", "no")
+        self.hedge_after = float(os.getenv("LLM_HEDGE_AFTER_MS", "2000")) / 1000
+        self.hedge_min = float(os.getenv("LLM_HEDGE_MIN_MS", "300")) / 1000
+        self._ttft: Dict[str, Deque[float]] = {}
+
+    # Model names are read per call: scripts load .env after importing this module
+    @property
+    def strong_model(self) -> str:
+        return os.getenv("OPENAI_MODEL")
+
+    @property
+    def fast_model(self) -> Optional[str]:
+        return os.getenv("OPENAI_FAST_MODEL") or None
+
+    def choose(self, conversation: Sequence[Tuple[str, Any]]) -> Route:
+        """Pick the model for a turn."""
+        if not self.fast_model:
+            route = Route(self.strong_model, "default")
+        elif _has_undiscussed_slide(conversation):
+            route = Route(self.strong_model, "new_slide")
+        elif len(_last_text(conversation).split()) > self.fast_max_words:
+            route = Route(self.strong_model, "long_turn")
+        else:
+            route = Route(self.fast_model, "short_turn")
+        metrics.LLM_ROUTES.labels(model=str(route.model), reason=route.reason).inc()
+        return route
+
+    def observe_ttft(self, model: str, seconds: float) -> None:
+        """Record a time-to-first-token sample used for the hedge delay."""
+        self._ttft.setdefault(model, deque(maxlen=200)).append(seconds)
+
+    def hedge_delay(self, model: str) -> float:
+        """Seconds to wait for a first token before hedging (recent p95 of the model)."""
+        samples = self._ttft.get(model)
+        if not samples or len(samples) < MIN_SAMPLES:
+            return self.hedge_after
+        ordered = sorted(samples)
+        p95 = ordered[min(len(ordered) - 1, math.ceil(0.95 * len(ordered)) - 1)]
+        return max(p95, self.hedge_min)
+
+    async def stream(
+        self, open_stream: Callable[[str], Awaitable[Any]], model: str,
+        admit_hedge: Optional[AdmitHedge] = None, max_tokens: int = 0,
+    ) -> AsyncIterator[Any]:
+        """
+        Stream chunks of a completion with a deadline and an optional hedged request.
+
+        Args:
+            open_stream: Starts a streaming completion for a model and returns the
+                         provider's async chunk stream (must support close())
+            model: Model to call
+            admit_hedge: Admits a hedged request: returns a release callback, or
+                         None to skip the hedge. Without it no hedge is sent.
+            max_tokens: Completion limit of the call, counted as saved for the
+                        attempt that loses a hedge race
+
+        Raises:
+            DeadlineExceeded: If the call exceeds LLM_DEADLINE_SECONDS
+        """
+        deadline = time.monotonic() + self.deadline
+        stream, iterator, first_chunks, release = await self._first_token(
+            open_stream, model, deadline, admit_hedge, max_tokens
+        )
+        try:
+            for chunk in first_chunks:
+                yield chunk
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(
+                        iterator.__anext__(), timeout=max(deadline - time.monotonic(), 0)
+                    )
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    metrics.record_error("llm_deadline")
+                    raise DeadlineExceeded(f"{model} did not finish within {self.deadline:g}s") from None
+                yield chunk
+        finally:
+            try:
+                await stream.close()
+            finally:
+                release()
+
+    async def _first_token(
+        self, open_stream: Callable[[str], Awaitable[Any]], model: str, deadline: float,
+        admit_hedge: Optional[AdmitHedge], max_tokens: int = 0,
+    ) -> Tuple[Any, AsyncIterator[Any], List[Any], Callable[[], None]]:
+        """
+        Run the primary (and possibly a hedged) attempt until one yields content.
+        Also returns the callback releasing the winner's hedge admission (a no-op
+        for the primary, whose admission belongs to the caller).
+        """
+        primary = asyncio.ensure_future(self._attempt(open_stream, model))
+        attempts = [primary]
+        hedged = None
+        release_hedge: Callable[[], None] = _noop
+        winner = None
+        delay = self.hedge_delay(model) if self.hedge_enabled and admit_hedge is not None else None
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    metrics.record_error("llm_deadline")
+                    raise DeadlineExceeded(f"{model} produced no token within {self.deadline:g}s")
+                pending = [a for a in attempts if not a.done()]
+                timeout = remaining if hedged is not None or delay is None else min(delay, remaining)
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if hedged is None and delay is not None:
+                        # The primary is slower than usual: race it with a second
+                        # request, if admission control has room for one right now
+                        release = admit_hedge()
+                        delay = None
+                        if release is None:
+                            metrics.LLM_HEDGES.labels(outcome="skipped").inc()
+                            continue
+                        release_hedge = release
+                        hedged = asyncio.ensure_future(self._attempt(open_stream, model))
+                        attempts.append(hedged)
+                        metrics.LLM_HEDGES.labels(outcome="fired").inc()
+                    continue
+                for attempt in done:
+                    if attempt.exception() is None:
+                        winner = attempt
+                        if hedged is not None:
+                            metrics.LLM_HEDGES.labels(outcome="won" if attempt is hedged else "lost").inc()
+                        return (*attempt.result(), release_hedge if attempt is hedged else _noop)
+                if all(a.done() for a in attempts):
+                    # Every attempt failed; surface the primary's error
+                    raise primary.exception()
+        finally:
+            losers = [a for a in attempts if a is not winner]
+            for attempt in losers:
+                attempt.cancel()
+            await asyncio.gather(*losers, return_exceptions=True)
+            for attempt in losers:
+                if attempt.cancelled():
+                    # Stopped before its first token: none of the completion is
+                    # generated. Without a winner the caller counts the primary.
+                    if winner is not None or attempt is hedged:
+                        metrics.LLM_TOKENS_SAVED.labels(model=model).inc(max_tokens)
+                elif attempt.exception() is None:
+                    # A loser that got its first token at the same moment is closed here
+                    await attempt.result()[0].close()
+                    metrics.LLM_TOKENS_SAVED.labels(model=model).inc(max(max_tokens - 1, 0))
+            if hedged is not None and winner is not hedged:
+                release_hedge()
+
+    async def _attempt(
+        self, open_stream: Callable[[str], Awaitable[Any]], model: str
+    ) -> Tuple[Any, AsyncIterator[Any], List[Any]]:
+        """Open a stream and read until the first content chunk (buffering earlier chunks)."""
+        stream = await open_stream(model)
+        iterator = stream.__aiter__()
+        buffered: List[Any] = []
+        try:
+            while True:
+                try:
+                    chunk = await iterator.__anext__()
+                except StopAsyncIteration:
+                    break
+                buffered.append(chunk)
+                if chunk.choices and chunk.choices[0].delta.content:
+                    break
+        except BaseException:
+            await stream.close()
+            raise
+        return stream, iterator, buffered
+
+
+model_router = ModelRouter()
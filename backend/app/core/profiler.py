@@ -0,0 +1,122 @@
+"""
+Opt-in sampling profiler for investigating slow requests.
+
+An admin arms the profiler for the next N requests. While any of those
+requests is in flight a background thread samples the Python stacks of all
+other threads at a fixed interval. The result is emitted in the "collapsed
+stack" format (`frame;frame;frame count`) consumed by flamegraph.pl,
+speedscope and similar tools.
+"""
+import os
+import sys
+import threading
+from collections import Counter
+from typing import Dict, Optional
+
+
+class SamplingProfiler:
+    """Samples stacks of every thread except its own into collapsed-stack counts."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.is_set():
+            names = {t.ident: t.name for t in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+            self._stop.wait(self.interval)
+
+    def collapsed(self) -> str:
+        """Render samples in the collapsed-stack format."""
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+
+class ProfilingSession:
+    """
+    Attaches a SamplingProfiler to the next N requests.
+
+    `begin_request()` returns True when the request should be counted toward
+    the armed window; `end_request()` must then be called when it finishes.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._remaining = 0
+        self._active = 0
+        self._interval = 0.005
+        self._profiler: Optional[SamplingProfiler] = None
+        self._result: Optional[str] = None
+        self._profiled = 0
+
+    def arm(self, requests: int, interval_ms: float = 5.0) -> None:
+        with self._lock:
+            if self._profiler is not None:
+                raise RuntimeError("A profiling session is already running")
+            self._remaining = requests
+            self._interval = interval_ms / 1000.0
+            self._result = None
+            self._profiled = 0
+
+    def begin_request(self) -> bool:
+        with self._lock:
+            if self._remaining <= 0:
+                return False
+            self._remaining -= 1
+            self._active += 1
+            self._profiled += 1
+            if self._profiler is None:
+                self._profiler = SamplingProfiler(self._interval)
+                self._profiler.start()
+            return True
+
+    def end_request(self) -> None:
+        with self._lock:
+            self._active -= 1
+            if self._active > 0 or self._remaining > 0 or self._profiler is None:
+                return
+            profiler, self._profiler = self._profiler, None
+        profiler.stop()
+        with self._lock:
+            self._result = profiler.collapsed()
+
+    def status(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "armed": self._remaining > 0,
+                "remaining_requests": self._remaining,
+                "in_flight": self._active,
+                "profiled_requests": self._profiled,
+                "result_ready": self._result is not None,
+            }
+
+    @property
+    def result(self) -> Optional[str]:
+        return self._result
+
+
+profiling_session = ProfilingSession()
+
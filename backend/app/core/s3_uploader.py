@@ -1,11 +1,12 @@
 """
 S3 uploader utility for uploading slide images to AWS S3.
+boto3 is imported when an uploader is constructed, not at module import.
 """
 import os
 from pathlib import Path
 from typing import List, Optional
-import boto3
-from botocore.exceptions import ClientError
+
+from app.core import metrics, tracing
 
 
 class S3Uploader:
@@ -16,7 +17,8 @@ class S3Uploader:
         bucket_name: Optional[str] = None,
         aws_access_key_id: Optional[str] = None,
         aws_secret_access_key: Optional[str] = None,
-        region_name: Optional[str] = None
+        region_name: Optional[str] = None,
+        endpoint_url: Optional[str] = None
     ):
         """
         Initialize S3 uploader.
@@ -26,6 +28,8 @@ class S3Uploader:
             aws_access_key_id: AWS access key (defaults to AWS_ACCESS_KEY_ID env var)
             aws_secret_access_key: AWS secret key (defaults to AWS_SECRET_ACCESS_KEY env var)
             region_name: AWS region (defaults to AWS_REGION env var or 'us-east-1')
+            endpoint_url: S3-compatible endpoint such as MinIO or a local stand-in
+                          (defaults to AWS_S3_ENDPOINT_URL env var; unset means AWS)
         """
         self.bucket_name = bucket_name or os.getenv("AWS_S3_BUCKET")
 
@@ -34,12 +38,20 @@ class S3Uploader:
                 "S3 bucket name must be provided either as argument or via AWS_S3_BUCKET env var"
             )
 
+        self.endpoint_url = endpoint_url or os.getenv("AWS_S3_ENDPOINT_URL")
+
+        import boto3
+        from botocore.exceptions import ClientError
+
+        self._client_error = ClientError
+
         # Initialize S3 client
         self.s3_client = boto3.client(
             's3',
             aws_access_key_id=aws_access_key_id or os.getenv("AWS_ACCESS_KEY_ID"),
             aws_secret_access_key=aws_secret_access_key or os.getenv("AWS_SECRET_ACCESS_KEY"),
-            region_name=region_name or os.getenv("AWS_REGION", "us-east-1")
+            region_name=region_name or os.getenv("AWS_REGION", "us-east-1"),
+            endpoint_url=self.endpoint_url
         )
 
     def upload_file(
@@ -66,30 +78,36 @@ class S3Uploader:
             ClientError: If upload fails
         """
         extra_args = {
-            'ContentType': content_type
+            'ContentType': content_type,
+            # Keys embed a content hash, so an object never changes once written
+            'CacheControl': 'public, max-age=31536000, immutable'
         }
 
         # Don't use ACL - modern S3 buckets have ACLs disabled by default
         # Instead, configure bucket policy or use CloudFront for public access
 
         try:
-            self.s3_client.upload_file(
-                str(file_path),
-                self.bucket_name,
-                s3_key,
-                ExtraArgs=extra_args
-            )
+            with metrics.stage_timer("s3_upload_slide"), tracing.span("s3.upload_file", key=s3_key):
+                self.s3_client.upload_file(
+                    str(file_path),
+                    self.bucket_name,
+                    s3_key,
+                    ExtraArgs=extra_args
+                )
 
             # Generate public URL
             region = self.s3_client.meta.region_name
-            if region == 'us-east-1':
+            if self.endpoint_url:
+                # Path-style URL for S3-compatible endpoints
+                url = f"{self.endpoint_url.rstrip('/')}/{self.bucket_name}/{s3_key}"
+            elif region == 'us-east-1':
                 url = f"https://{self.bucket_name}.s3.amazonaws.com/{s3_key}"
             else:
                 url = f"https://{self.bucket_name}.s3.{region}.amazonaws.com/{s3_key}"
 
             return url
 
-        except ClientError as e:
+        except self._client_error as e:
             error_msg = str(e)
             raise RuntimeError(
                 f"Failed to upload {file_path.name} to {self.bucket_name}/{s3_key}: {error_msg}"
@@ -137,6 +155,10 @@ class S3Uploader:
         Args:
             s3_prefix: Prefix (folder) to clear
         """
+        with tracing.span("s3.clear_prefix", prefix=s3_prefix):
+            self._clear_prefix(s3_prefix)
+
+    def _clear_prefix(self, s3_prefix: str):
         try:
             # List and delete all objects with pagination support
             continuation_token = None
@@ -179,5 +201,5 @@ class S3Uploader:
             else:
                 print(f"No objects found in S3 prefix '{s3_prefix}'")
 
-        except ClientError as e:
+        except self._client_error as e:
             print(f"Warning: Failed to clear S3 prefix {s3_prefix}: {str(e)}")
@@ -0,0 +1,320 @@
+"""
+Admission control and fair scheduling for LLM calls.
+
+Every completion acquires a slot from the scheduler before it is sent:
+    - at most LLM_MAX_CONCURRENCY completions run at once (per worker)
+    - waiting calls are served round-robin across sessions, so one busy
+      classroom cannot starve the others
+    - requests/minute and tokens/minute token buckets keep the worker within
+      the provider's RPM/TPM limits (token use is estimated up front and
+      settled with the real usage afterwards)
+    - a provider 429 pauses all admissions for its Retry-After period
+    - a hedged second request (app.core.model_router) needs a slot and
+      budget of its own (try_admit); it is skipped when that would wait
+
+Callers that would wait too long are rejected with Overloaded, which carries
+a retry-after estimate (HTTP 429 + Retry-After). Queued callers can be told
+their position through a per-request listener (WebSocket "queued" events).
+
+Configuration (environment variables):
+    LLM_MAX_CONCURRENCY        Concurrent completions (default 8)
+    LLM_RPM_LIMIT              Requests per minute, 0 = unlimited (default 0)
+    LLM_TPM_LIMIT              Tokens per minute, 0 = unlimited (default 0)
+    LLM_MAX_QUEUE              Waiting calls before new ones are rejected (default 64)
+    LLM_QUEUE_TIMEOUT_SECONDS  Longest wait for a slot (default 20)
+    LLM_RATE_LIMIT_RETRIES     Provider 429s retried per call (default 3, read by chatbot.py)
+"""
+import asyncio
+import contextvars
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional
+
+from app.core import metrics
+
+
+# Called with (position, retry_after_seconds) while a call waits for a slot
+QueueListener = Callable[[int, int], None]
+
+queue_listener: contextvars.ContextVar[Optional[QueueListener]] = contextvars.ContextVar(
+    "llm_queue_listener", default=None
+)
+
+
+class Overloaded(Exception):
+    """The call was not admitted; retry after retry_after seconds."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Continuously refilling bucket sized to a per-minute limit (0 = unlimited)."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+
+    @property
+    def unlimited(self) -> bool:
+        return self.capacity <= 0
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount can be taken (amounts above capacity wait for a full bucket)."""
+        if self.unlimited:
+            return 0.0
+        self._refill()
+        missing = min(amount, self.capacity) - self.tokens
+        return max(missing / self.rate, 0.0)
+
+    def take(self, amount: float) -> None:
+        if not self.unlimited:
+            self._refill()
+            self.tokens -= min(amount, self.capacity)
+
+    def give(self, amount: float) -> None:
+        if not self.unlimited:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class Slot:
+    """An admitted call; set actual_tokens once usage is known."""
+
+    def __init__(self, session_id: str, tokens: int):
+        self.session_id = session_id
+        self.reserved_tokens = tokens
+        self.actual_tokens: Optional[int] = None
+        self.granted = 0.0
+
+
+class _Waiter:
+    def __init__(self, slot: Slot, future: asyncio.Future, listener: Optional[QueueListener]):
+        self.slot = slot
+        self.future = future
+        self.listener = listener
+        self.position = -1
+
+
+class LLMScheduler:
+    """Per-worker admission control for LLM completions."""
+
+    def __init__(self):
+        self.max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+        self.max_queue = int(os.getenv("LLM_MAX_QUEUE", "64"))
+        self.queue_timeout = float(os.getenv("LLM_QUEUE_TIMEOUT_SECONDS", "20"))
+        self.requests = TokenBucket(float(os.getenv("LLM_RPM_LIMIT", "0")))
+        self.tokens = TokenBucket(float(os.getenv("LLM_TPM_LIMIT", "0")))
+        self.active = 0
+        self.paused_until = 0.0
+        # Average time a slot is held, for retry-after estimates
+        self.service_seconds = 2.0
+        self._queues: Dict[str, Deque[_Waiter]] = {}
+        self._rotation: Deque[str] = deque()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    def retry_after(self, position: int) -> int:
+        """Estimated seconds until a call at queue position `position` is admitted."""
+        pause = max(self.paused_until - time.monotonic(), 0.0)
+        turns = position // max(self.max_concurrency, 1) + 1
+        return max(1, math.ceil(pause + turns * self.service_seconds))
+
+    @asynccontextmanager
+    async def admit(self, session_id: str, tokens: int) -> AsyncIterator[Slot]:
+        """
+        Wait for a slot for one completion of `session_id` estimated at `tokens`.
+
+        Raises:
+            Overloaded: If the queue is full or the wait exceeds LLM_QUEUE_TIMEOUT_SECONDS
+        """
+        slot = Slot(session_id, tokens)
+        waiter = self._enqueue(slot)
+        start = time.monotonic()
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not waiter.future.done():
+                self._remove(waiter)
+                waiter.future.cancel()
+                metrics.LLM_ADMISSIONS.labels(result="timeout").inc()
+                raise Overloaded("Timed out waiting for an LLM slot", self.retry_after(self.waiting)) from None
+        except BaseException:
+            # Caller cancelled while waiting (e.g. superseded)
+            if not waiter.future.done():
+                self._remove(waiter)
+                waiter.future.cancel()
+                raise
+            self._release(slot, time.monotonic())
+            raise
+        granted = time.monotonic()
+        metrics.LLM_QUEUE_WAIT_SECONDS.observe(granted - start)
+        try:
+            yield slot
+        finally:
+            self._release(slot, granted)
+
+    def try_admit(self, session_id: str, tokens: int) -> Optional[Slot]:
+        """
+        Admit an extra call (a hedged request) only if that needs no waiting:
+        nothing is queued, a slot is free, admissions are not paused and both
+        buckets have room. The caller must hand the slot back with release().
+
+        Returns:
+            The slot, or None if the call should not be made
+        """
+        slot = Slot(session_id, tokens)
+        wait = max(
+            self.paused_until - time.monotonic(),
+            self.requests.wait_time(1),
+            self.tokens.wait_time(tokens),
+        )
+        if self.waiting or self.active >= self.max_concurrency or wait > 0:
+            metrics.LLM_ADMISSIONS.labels(result="extra_refused").inc()
+            return None
+        self.requests.take(1)
+        self.tokens.take(tokens)
+        self.active += 1
+        slot.granted = time.monotonic()
+        metrics.LLM_ADMISSIONS.labels(result="extra_admitted").inc()
+        metrics.LLM_ACTIVE.set(self.active)
+        return slot
+
+    def release(self, slot: Slot) -> None:
+        """Hand back a slot from try_admit()."""
+        self._release(slot, slot.granted)
+
+    def rate_limited(self, retry_after: Optional[float]) -> None:
+        """Pause admissions after a provider 429."""
+        metrics.LLM_RATE_LIMITED.inc()
+        pause = retry_after if retry_after and retry_after > 0 else 1.0
+        self.paused_until = max(self.paused_until, time.monotonic() + pause)
+        self._schedule(pause)
+
+    def _enqueue(self, slot: Slot) -> _Waiter:
+        if self.waiting >= self.max_queue:
+            metrics.LLM_ADMISSIONS.labels(result="rejected").inc()
+            raise Overloaded("Too many queued LLM calls", self.retry_after(self.waiting))
+        waiter = _Waiter(slot, asyncio.get_running_loop().create_future(), queue_listener.get())
+        queue = self._queues.get(slot.session_id)
+        if queue is None:
+            queue = self._queues[slot.session_id] = deque()
+            self._rotation.append(slot.session_id)
+        queue.append(waiter)
+        self._dispatch()
+        return waiter
+
+    def _remove(self, waiter: _Waiter) -> None:
+        queue = self._queues.get(waiter.slot.session_id)
+        if queue is not None and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                self._drop_session(waiter.slot.session_id)
+        self._dispatch()
+
+    def _drop_session(self, session_id: str) -> None:
+        del self._queues[session_id]
+        self._rotation.remove(session_id)
+
+    def _release(self, slot: Slot, granted: float) -> None:
+        self.active -= 1
+        self.service_seconds = 0.8 * self.service_seconds + 0.2 * (time.monotonic() - granted)
+        if slot.actual_tokens is not None:
+            # Settle the estimate with the real usage
+            difference = slot.reserved_tokens - slot.actual_tokens
+            if difference > 0:
+                self.tokens.give(difference)
+            elif difference < 0:
+                self.tokens.take(-difference)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Admit waiters round-robin across sessions while capacity allows."""
+        metrics.LLM_ACTIVE.set(self.active)
+        while self._rotation and self.active < self.max_concurrency:
+            session_id = self._rotation[0]
+            waiter = self._queues[session_id][0]
+            wait = max(
+                self.paused_until - time.monotonic(),
+                self.requests.wait_time(1),
+                self.tokens.wait_time(waiter.slot.reserved_tokens),
+            )
+            if wait > 0:
+                self._schedule(wait)
+                break
+            self._queues[session_id].popleft()
+            # Next session's turn
+            self._rotation.rotate(-1)
+            if not self._queues[session_id]:
+                self._drop_session(session_id)
+            self.requests.take(1)
+            self.tokens.take(waiter.slot.reserved_tokens)
+            self.active += 1
+            metrics.LLM_ADMISSIONS.labels(result="admitted").inc()
+            waiter.future.set_result(None)
+        metrics.LLM_ACTIVE.set(self.active)
+        metrics.LLM_QUEUE_DEPTH.set(self.waiting)
+        self._notify_positions()
+
+    def _schedule(self, delay: float) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    def _fair_order(self) -> List[_Waiter]:
+        """Waiters in the order they will be admitted."""
+        queues = [list(self._queues[s]) for s in self._rotation]
+        order = []
+        depth = 0
+        while True:
+            row = [q[depth] for q in queues if depth < len(q)]
+            if not row:
+                return order
+            order.extend(row)
+            depth += 1
+
+    def _notify_positions(self) -> None:
+        for position, waiter in enumerate(self._fair_order(), start=1):
+            if waiter.listener is not None and waiter.position != position:
+                waiter.position = position
+                try:
+                    waiter.listener(position, self.retry_after(position))
+                except Exception as e:
+                    print(f"Warning: queue listener failed: {e}")
+
+
+def estimate_tokens(messages: List[dict], max_tokens: int) -> int:
+    """Rough token cost of a chat completion: ~4 characters per token, fixed cost per image."""
+    total = max_tokens
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            total += len(content) // 4 + 4
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "image_url":
+                    total += 765
+                else:
+                    total += len(str(part.get("text", ""))) // 4
+    return total
+
+
+scheduler = LLMScheduler()
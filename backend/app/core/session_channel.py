@@ -0,0 +1,169 @@
+"""
+Per-session event channels for the WebSocket endpoint.
+
+A channel outlives individual connections: every durable server event gets
+a sequence number and is kept in a bounded ring buffer, so a client that
+reconnects with ?last_seq=N receives the events it missed. Transient events
+(reply deltas, pongs) are sent without a sequence number and never replayed;
+the final reply event carries the full text.
+
+Events can be published to a session from anywhere in the process
+(e.g. server-initiated student questions), whether or not a client is
+currently connected.
+
+Configuration (environment variables):
+    WS_RESUME_BUFFER         Durable events kept per session for resumption (default 256)
+    WS_CHANNEL_IDLE_SECONDS  Disconnected channels are dropped after this long (default 900)
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set
+
+from starlette.websockets import WebSocket
+
+from app.core import metrics
+
+
+RESUME_BUFFER_SIZE = int(os.getenv("WS_RESUME_BUFFER", "256"))
+CHANNEL_IDLE_SECONDS = float(os.getenv("WS_CHANNEL_IDLE_SECONDS", "900"))
+
+# Close code sent to a connection replaced by a newer one for the same session
+CLOSE_REPLACED = 4000
+
+
+class SessionChannel:
+    """Sequenced, resumable event stream of one session."""
+
+    def __init__(self, session_id: str, buffer_size: int = RESUME_BUFFER_SIZE):
+        self.session_id = session_id
+        self._seq = 0
+        self._buffer: Deque[Dict[str, Any]] = deque(maxlen=buffer_size)
+        self._websocket: Optional[WebSocket] = None
+        self._send_lock = asyncio.Lock()
+        self._order_lock = asyncio.Lock()
+        self.tasks: Set[asyncio.Task] = set()
+        self.last_active = time.monotonic()
+
+    @property
+    def connected(self) -> bool:
+        return self._websocket is not None
+
+    async def attach(self, websocket: WebSocket, last_seq: Optional[int] = None) -> None:
+        """
+        Make websocket the channel's connection and replay missed events.
+
+        Args:
+            websocket: Accepted WebSocket connection
+            last_seq: Last sequence number the client received (None for a fresh client)
+        """
+        async with self._send_lock:
+            previous, self._websocket = self._websocket, websocket
+            self.last_active = time.monotonic()
+            if previous is not None:
+                try:
+                    await previous.close(code=CLOSE_REPLACED)
+                except Exception:
+                    pass
+            missed: List[Dict[str, Any]] = []
+            gap = False
+            if last_seq is not None and last_seq < self._seq:
+                missed = [event for event in self._buffer if event["seq"] > last_seq]
+                # Events older than the buffer were dropped; the client must resync
+                gap = not missed or missed[0]["seq"] > last_seq + 1
+            elif last_seq is not None and last_seq > self._seq:
+                # The channel was recreated (restart, other worker); numbering starts over
+                gap = True
+            await self._send(websocket, {"type": "welcome", "session_id": self.session_id,
+                                         "seq": self._seq, "gap": gap})
+            for event in missed:
+                await self._send(websocket, event)
+
+    def detach(self, websocket: WebSocket) -> None:
+        """Forget websocket if it is still the channel's connection."""
+        if self._websocket is websocket:
+            self._websocket = None
+            self.last_active = time.monotonic()
+
+    async def emit(self, event_type: str, durable: bool = True, **payload: Any) -> Optional[int]:
+        """
+        Send an event to the connected client.
+
+        Args:
+            event_type: Value of the event's "type" field
+            durable: Assign a sequence number and keep the event for resumption
+            **payload: Remaining event fields
+
+        Returns:
+            Sequence number of a durable event, None for transient ones
+        """
+        event = {"type": event_type, **payload}
+        async with self._send_lock:
+            if durable:
+                self._seq += 1
+                event["seq"] = self._seq
+                self._buffer.append(event)
+            websocket = self._websocket
+            if websocket is not None:
+                try:
+                    await self._send(websocket, event)
+                except Exception:
+                    # Connection dropped; durable events are replayed on reconnect
+                    self.detach(websocket)
+        return event.get("seq")
+
+    async def _send(self, websocket: WebSocket, event: Dict[str, Any]) -> None:
+        await websocket.send_json(event)
+        metrics.WS_MESSAGES.labels(type=event["type"], direction="out").inc()
+
+    def spawn(self, coro) -> asyncio.Task:
+        """Run coro as a task owned by the channel (kept alive across reconnects)."""
+        task = asyncio.get_running_loop().create_task(coro)
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+        return task
+
+    def spawn_ordered(self, coro) -> asyncio.Task:
+        """
+        Like spawn, but coro only starts once the coros spawned in order before
+        it have finished (inbound messages are handled in arrival order).
+        """
+        async def ordered():
+            try:
+                async with self._order_lock:
+                    return await coro
+            finally:
+                # Never started if cancelled while waiting for its turn
+                coro.close()
+
+        return self.spawn(ordered())
+
+
+class ChannelRegistry:
+    """Channels of all sessions known to this worker."""
+
+    def __init__(self, idle_seconds: float = CHANNEL_IDLE_SECONDS):
+        self.idle_seconds = idle_seconds
+        self._channels: Dict[str, SessionChannel] = {}
+
+    def get(self, session_id: str) -> SessionChannel:
+        """Return the session's channel, creating it if needed."""
+        self._prune()
+        channel = self._channels.get(session_id)
+        if channel is None:
+            channel = self._channels[session_id] = SessionChannel(session_id)
+        return channel
+
+    async def publish(self, session_id: str, event_type: str, **payload: Any) -> Optional[int]:
+        """Send a durable server-initiated event to a session."""
+        return await self.get(session_id).emit(event_type, **payload)
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - self.idle_seconds
+        for session_id, channel in list(self._channels.items()):
+            if not channel.connected and not channel.tasks and channel.last_active < cutoff:
+                del self._channels[session_id]
+
+
+channel_registry = ChannelRegistry()
@@ -0,0 +1,164 @@
+"""
+In-memory student profile store keyed by session.
+
+Profiles are served from memory and written through to disk in the
+background with aiofiles, so neither reads nor writes block the event loop
+on the request path. The rendered system prompt is cached per session and
+invalidated when the profile (or the context template) changes. The
+in-memory and write-through part (SessionDocumentStore) also keeps the
+classroom rosters of app.core.classroom.
+
+Disk layout:
+    data/settings.json               profile of the default session
+    data/settings/<session_id>.json  profiles of other sessions
+"""
+import asyncio
+import json
+import os
+import re
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Set, Tuple
+
+import aiofiles
+import aiofiles.os
+
+from app.core import metrics
+from app.core.context_helper import CONTEXT_PATH, render_system_prompt
+
+
+DEFAULT_SESSION = "default"
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+DATA_DIR = Path(__file__).parent.parent.parent / "data"
+
+
+def validate_session_id(session_id: Optional[str]) -> str:
+    """Return a usable session id, raising ValueError for unsafe values."""
+    if not session_id:
+        return DEFAULT_SESSION
+    if not SESSION_ID_PATTERN.match(session_id):
+        raise ValueError("Session id must be 1-64 characters of letters, digits, '-' or '_'")
+    return session_id
+
+
+class SessionDocumentStore:
+    """
+    One JSON document per session, served from memory with async
+    write-through persistence. Subclasses choose the file of a session
+    (path_for) and name the store for metrics and warnings (kind).
+    """
+
+    kind = "document"
+
+    def __init__(self, data_dir: Path = DATA_DIR):
+        self.data_dir = Path(data_dir)
+        self._documents: Dict[str, Optional[dict]] = {}
+        self._lock = threading.Lock()
+        self._write_locks: Dict[str, asyncio.Lock] = {}
+        self._pending: Set[asyncio.Task] = set()
+
+    def path_for(self, session_id: str) -> Path:
+        raise NotImplementedError
+
+    def _load_from_disk(self, session_id: str) -> Optional[dict]:
+        path = self.path_for(session_id)
+        if not path.exists():
+            return None
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def get(self, session_id: str = DEFAULT_SESSION) -> Optional[dict]:
+        """
+        Return the document of a session (None if it has none).
+        Disk is only read the first time a session is seen in this process.
+
+        Raises:
+            json.JSONDecodeError: If the stored document is corrupted
+        """
+        with self._lock:
+            if session_id in self._documents:
+                metrics.record_cache(self.kind, hit=True)
+                return self._documents[session_id]
+        metrics.record_cache(self.kind, hit=False)
+        document = self._load_from_disk(session_id)
+        with self._lock:
+            # Another caller may have set the document meanwhile; keep theirs
+            return self._documents.setdefault(session_id, document)
+
+    async def set(self, session_id: str, document: dict) -> None:
+        """Update a document in memory and schedule the write to disk."""
+        with self._lock:
+            self._documents[session_id] = dict(document)
+            self._changed(session_id)
+        task = asyncio.get_running_loop().create_task(self._write(session_id))
+        self._pending.add(task)
+        task.add_done_callback(self._pending.discard)
+
+    def _changed(self, session_id: str) -> None:
+        """Called under the lock when a session's document is replaced."""
+
+    async def _write(self, session_id: str) -> None:
+        lock = self._write_locks.setdefault(session_id, asyncio.Lock())
+        async with lock:
+            with self._lock:
+                document = self._documents.get(session_id)
+            if document is None:
+                return
+            path = self.path_for(session_id)
+            tmp_path = path.with_suffix(".json.tmp")
+            try:
+                await aiofiles.os.makedirs(path.parent, exist_ok=True)
+                async with aiofiles.open(tmp_path, "w") as f:
+                    await f.write(json.dumps(document, indent=2))
+                await aiofiles.os.replace(tmp_path, path)
+            except Exception as e:
+                metrics.record_error(f"{self.kind}_write")
+                print(f"Warning: failed to persist {self.kind} for session {session_id}: {e}")
+
+    async def flush(self) -> None:
+        """Wait for all scheduled writes to finish."""
+        while self._pending:
+            await asyncio.gather(*list(self._pending), return_exceptions=True)
+
+
+class SettingsStore(SessionDocumentStore):
+    """Per-session student profiles with async write-through persistence."""
+
+    kind = "settings"
+
+    def __init__(self, data_dir: Path = DATA_DIR):
+        super().__init__(data_dir)
+        # session -> (template mtime, rendered prompt)
+        self._prompts: Dict[str, Tuple[float, str]] = {}
+
+    def path_for(self, session_id: str) -> Path:
+        if session_id == DEFAULT_SESSION:
+            return self.data_dir / "settings.json"
+        return self.data_dir / "settings" / f"{session_id}.json"
+
+    def _changed(self, session_id: str) -> None:
+        self._prompts.pop(session_id, None)
+
+    def system_prompt(self, session_id: str = DEFAULT_SESSION) -> str:
+        """Return the rendered system prompt for a session, cached until the profile changes."""
+        try:
+            template_mtime = os.stat(CONTEXT_PATH).st_mtime
+        except OSError:
+            template_mtime = -1.0
+        with self._lock:
+            cached = self._prompts.get(session_id)
+        if cached is not None and cached[0] == template_mtime:
+            metrics.record_cache("system_prompt", hit=True)
+            return cached[1]
+        metrics.record_cache("system_prompt", hit=False)
+        profile = self.get(session_id)
+        prompt = render_system_prompt(profile)
+        with self._lock:
+            # Only cache if the profile was not replaced while rendering
+            if self._documents.get(session_id) is profile:
+                self._prompts[session_id] = (template_mtime, prompt)
+        return prompt
+
+
+settings_store = SettingsStore()
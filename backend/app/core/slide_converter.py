@@ -1,62 +1,194 @@
 """
 Slide converter: converts PowerPoint (PPTX) and PDF files to PNG images.
 Each slide becomes a separate PNG file.
+
+Every deck is written to its own content-addressed namespace,
+<images_base_dir>/<namespace>/slide_000_<hash>.png, where the namespace is
+derived from the file bytes and the rendering settings. Re-uploading the
+same deck reuses the existing images, concurrent uploads never overwrite
+each other, and the served files are immutable.
+
+pdf2image (and through it Pillow) is imported on first conversion rather
+than at module import, keeping application startup fast.
 """
-import uuid
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
 from pathlib import Path
-from typing import List, Tuple
-import io
+from typing import Collection, List, Optional
 
-from pptx import Presentation
-from pdf2image import convert_from_path, convert_from_bytes
-from PIL import Image
+from app.core import metrics, tracing
+
+# Lists the slide filenames of a completed namespace
+MANIFEST_NAME = "slides.json"
 
 
 class SlideConverter:
     """Converts presentation files to individual slide images."""
 
-    def __init__(self, images_base_dir: Path):
+    def __init__(
+        self,
+        images_base_dir: Path,
+        dpi: Optional[int] = None,
+        thread_count: Optional[int] = None,
+        use_pdftocairo: Optional[bool] = None,
+        png_compress_level: Optional[int] = None
+    ):
         """
         Initialize the slide converter.
 
         Args:
             images_base_dir: Base directory where slide images will be stored
+            dpi: Rasterization resolution (defaults to SLIDE_RENDER_DPI env var or 300)
+            thread_count: Poppler worker processes per document
+                          (defaults to SLIDE_RENDER_THREADS env var or 1)
+            use_pdftocairo: Render with pdftocairo instead of pdftoppm
+                            (defaults to SLIDE_RENDER_PDFTOCAIRO env var or False)
+            png_compress_level: zlib level 0-9 for saved PNGs; lower is faster
+                                but larger (defaults to SLIDE_PNG_COMPRESS_LEVEL env var or 6)
         """
         self.images_base_dir = Path(images_base_dir)
         self.images_base_dir.mkdir(parents=True, exist_ok=True)
 
+        self.dpi = dpi if dpi is not None else int(os.getenv("SLIDE_RENDER_DPI", "300"))
+        self.thread_count = (
+            thread_count if thread_count is not None else int(os.getenv("SLIDE_RENDER_THREADS", "1"))
+        )
+        self.use_pdftocairo = (
+            use_pdftocairo if use_pdftocairo is not None
+            else os.getenv("SLIDE_RENDER_PDFTOCAIRO", "0").lower() in ("1", "true", "yes")
+        )
+        self.png_compress_level = (
+            png_compress_level if png_compress_level is not None
+            else int(os.getenv("SLIDE_PNG_COMPRESS_LEVEL", "6"))
+        )
+
+    def namespace_for(self, file_content: bytes) -> str:
+        """
+        Content-addressed namespace for a deck under the current rendering settings.
+
+        Args:
+            file_content: Raw bytes of the uploaded file
+
+        Returns:
+            16 hex character namespace id
+        """
+        digest = hashlib.sha256(file_content)
+        digest.update(f"|dpi={self.dpi}|cairo={self.use_pdftocairo}".encode())
+        return digest.hexdigest()[:16]
+
+    def _load_namespace(self, namespace_dir: Path) -> Optional[List[Path]]:
+        """Return the slide paths of a completed namespace, or None if it is missing or partial."""
+        manifest = namespace_dir / MANIFEST_NAME
+        try:
+            names = json.loads(manifest.read_text())
+        except (OSError, ValueError):
+            return None
+        paths = [namespace_dir / name for name in names]
+        if not all(p.exists() for p in paths):
+            return None
+        # Refresh the age used by cleanup_namespaces
+        os.utime(manifest)
+        return paths
+
     def convert_file(self, file_content: bytes, filename: str) -> List[Path]:
         """
-        Convert an uploaded file to PNG images.
-        Clears existing images and saves directly to the base images directory.
+        Convert an uploaded file to PNG images in its content-addressed namespace.
+        If the same deck was already converted with the same settings, the existing
+        images are returned without converting again.
 
         Args:
             file_content: Raw bytes of the uploaded file
             filename: Original filename (used to determine file type)
 
         Returns:
-            List of image file paths
+            List of image file paths (all in the same namespace directory)
 
         Raises:
             ValueError: If file type is not supported
         """
-        import shutil
+        file_ext = Path(filename).suffix.lower()
+        if file_ext not in ['.pdf', '.pptx', '.ppt']:
+            raise ValueError(f"Unsupported file type: {file_ext}. Only .pdf, .pptx, and .ppt are supported.")
+
+        namespace = self.namespace_for(file_content)
+        namespace_dir = self.images_base_dir / namespace
+        existing = self._load_namespace(namespace_dir)
+        metrics.record_cache("slides", hit=existing is not None)
+        if existing is not None:
+            return existing
 
-        # Clear existing images
-        if self.images_base_dir.exists():
-            shutil.rmtree(self.images_base_dir)
         self.images_base_dir.mkdir(parents=True, exist_ok=True)
+        # Convert into a private work dir, then publish it with an atomic rename
+        work_dir = Path(tempfile.mkdtemp(prefix=f".{namespace}-", dir=self.images_base_dir))
+        try:
+            with tracing.span("convert.file", ext=file_ext, bytes=len(file_content), namespace=namespace):
+                if file_ext == '.pdf':
+                    image_paths = self._convert_pdf(file_content, work_dir)
+                else:
+                    image_paths = self._convert_pptx(file_content, work_dir)
+
+            names = []
+            for image_path in image_paths:
+                file_hash = hashlib.sha256(image_path.read_bytes()).hexdigest()[:12]
+                name = f"{image_path.stem}_{file_hash}.png"
+                image_path.rename(work_dir / name)
+                names.append(name)
+            (work_dir / MANIFEST_NAME).write_text(json.dumps(names))
+
+            try:
+                work_dir.rename(namespace_dir)
+            except OSError:
+                # Another request published the same deck first; use theirs
+                shutil.rmtree(work_dir, ignore_errors=True)
+                existing = self._load_namespace(namespace_dir)
+                if existing is None:
+                    raise
+                return existing
+        except BaseException:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            raise
 
-        file_ext = Path(filename).suffix.lower()
+        return [namespace_dir / name for name in names]
 
-        if file_ext == '.pdf':
-            image_paths = self._convert_pdf(file_content, self.images_base_dir)
-        elif file_ext in ['.pptx', '.ppt']:
-            image_paths = self._convert_pptx(file_content, self.images_base_dir)
-        else:
-            raise ValueError(f"Unsupported file type: {file_ext}. Only .pdf, .pptx, and .ppt are supported.")
+    def cleanup_namespaces(self, max_age_seconds: float, keep: Collection[str] = ()) -> List[str]:
+        """
+        Delete namespaces not used for max_age_seconds, plus abandoned work dirs.
+
+        Args:
+            max_age_seconds: Age (since last conversion or reuse) after which a
+                             namespace is removed
+            keep: Namespaces never removed (e.g. pre-ingested decks)
 
-        return image_paths
+        Returns:
+            Namespaces that were removed
+        """
+        removed = []
+        cutoff = time.time() - max_age_seconds
+        if not self.images_base_dir.exists():
+            return removed
+        for entry in self.images_base_dir.iterdir():
+            if not entry.is_dir():
+                continue
+            try:
+                if entry.name.startswith("."):
+                    # Work dir of an interrupted conversion
+                    if entry.stat().st_mtime < time.time() - 3600:
+                        shutil.rmtree(entry, ignore_errors=True)
+                    continue
+                if entry.name in keep:
+                    continue
+                manifest = entry / MANIFEST_NAME
+                last_used = manifest.stat().st_mtime if manifest.exists() else entry.stat().st_mtime
+            except OSError:
+                continue
+            if last_used < cutoff:
+                shutil.rmtree(entry, ignore_errors=True)
+                removed.append(entry.name)
+        return removed
 
     def _convert_pdf(self, file_content: bytes, output_dir: Path) -> List[Path]:
         """
@@ -69,19 +201,25 @@ class SlideConverter:
         Returns:
             List of paths to generated PNG files
         """
-        try:
-            # Try to convert PDF pages to images
-            images = convert_from_bytes(
-                file_content,
-                dpi=300,  # High quality
-                fmt='png'
-            )
+        from pdf2image import convert_from_bytes
 
-            image_paths = []
-            for idx, img in enumerate(images):
-                output_path = output_dir / f"slide_{idx:03d}.png"
-                img.save(output_path, 'PNG')
-                image_paths.append(output_path)
+        try:
+            with metrics.stage_timer("rasterize"), tracing.span("convert.rasterize") as sp:
+                # Try to convert PDF pages to images
+                images = convert_from_bytes(
+                    file_content,
+                    dpi=self.dpi,
+                    fmt='png',
+                    thread_count=self.thread_count,
+                    use_pdftocairo=self.use_pdftocairo
+                )
+
+                image_paths = []
+                for idx, img in enumerate(images):
+                    output_path = output_dir / f"slide_{idx:03d}.png"
+                    img.save(output_path, 'PNG', compress_level=self.png_compress_level)
+                    image_paths.append(output_path)
+                sp.set_attribute("pages", len(image_paths))
 
             return image_paths
         except Exception as e:
@@ -108,7 +246,6 @@ class SlideConverter:
             List of paths to generated PNG files
         """
         import subprocess
-        import shutil
 
         # Save PPTX temporarily for processing
         temp_pptx = output_dir / "temp.pptx"
@@ -134,18 +271,19 @@ class SlideConverter:
             # Convert PPTX -> PDF using LibreOffice
             temp_pdf = output_dir / "temp.pdf"
 
-            result = subprocess.run(
-                [
-                    libreoffice_cmd,
-                    '--headless',
-                    '--convert-to', 'pdf',
-                    '--outdir', str(output_dir),
-                    str(temp_pptx)
-                ],
-                capture_output=True,
-                timeout=60,
-                text=True
-            )
+            with metrics.stage_timer("libreoffice"), tracing.span("convert.libreoffice"):
+                result = subprocess.run(
+                    [
+                        libreoffice_cmd,
+                        '--headless',
+                        '--convert-to', 'pdf',
+                        '--outdir', str(output_dir),
+                        str(temp_pptx)
+                    ],
+                    capture_output=True,
+                    timeout=60,
+                    text=True
+                )
 
             if result.returncode != 0:
                 raise RuntimeError(f"LibreOffice conversion failed: {result.stderr}")
@@ -166,6 +304,7 @@ class SlideConverter:
             return image_paths
 
         except subprocess.TimeoutExpired:
+            metrics.record_error("libreoffice_timeout")
             temp_pptx.unlink()
             raise RuntimeError("LibreOffice conversion timed out (>60 seconds)")
         except Exception as e:
@@ -0,0 +1,461 @@
+"""
+Local-first slide storage with write-behind S3 replication.
+
+Uploads commit converted slides to data/images and return right away; S3
+is only a replica. Every slide to replicate is recorded in a SQLite outbox
+(data/slide_outbox.sqlite3), and a background task in each worker drains
+it: due rows are claimed with a lease (so workers sharing the data dir do
+not upload the same slide twice), uploaded, and marked replicated with
+their S3 URL. Failures are retried with exponential backoff for as long as
+the slide exists locally, so an S3 outage delays replication instead of
+breaking sessions. Unless DATA_RESET_ON_STARTUP is set, the outbox survives
+restarts and pending slides are uploaded after the next start. Expired
+namespaces are removed from S3 the same way: retire_namespace records the
+prefix and the sync task deletes it, so uploads never wait on S3.
+
+Sessions keep the local /images/... URL of a slide (it is what the client
+sends and what the history records). When the conversation is built, the
+URL is resolved for the model provider: the S3 URL once replication has
+confirmed it. Until then a downscaled JPEG copy of the slide is inlined as
+a data URL, capped at SLIDE_INLINE_MAX_BYTES. The switch changes the
+prompt prefix once per slide. Local URLs are only accepted while S3
+replication is configured (see accepts_local_urls); without S3 the model
+needs public slide URLs, as it did before.
+
+Configuration (environment variables):
+    SLIDE_SYNC_CONCURRENCY        Parallel S3 uploads per worker (default 4)
+    SLIDE_SYNC_POLL_SECONDS       Outbox poll interval when idle (default 5)
+    SLIDE_SYNC_MAX_BACKOFF_SECONDS  Longest wait between retries of a slide (default 300)
+    SLIDE_INLINE_MAX_SIDE         Longest side of an inlined slide in pixels (default 1024)
+    SLIDE_INLINE_MAX_BYTES        Size cap of an inlined slide (default 196608)
+    SLIDE_INLINE_CACHE_BYTES      Memory for cached inlined slides (default 8388608)
+"""
+import asyncio
+import base64
+import io
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from app.core import metrics, tracing
+
+
+DATA_DIR = Path(__file__).parent.parent.parent / "data"
+IMAGES_URL_PREFIX = "/images/"
+
+SYNC_CONCURRENCY = int(os.getenv("SLIDE_SYNC_CONCURRENCY", "4"))
+POLL_SECONDS = float(os.getenv("SLIDE_SYNC_POLL_SECONDS", "5"))
+MAX_BACKOFF_SECONDS = float(os.getenv("SLIDE_SYNC_MAX_BACKOFF_SECONDS", "300"))
+INLINE_MAX_SIDE = int(os.getenv("SLIDE_INLINE_MAX_SIDE", "1024"))
+INLINE_MAX_BYTES = int(os.getenv("SLIDE_INLINE_MAX_BYTES", str(192 * 1024)))
+INLINE_CACHE_BYTES = int(os.getenv("SLIDE_INLINE_CACHE_BYTES", str(8 * 1024 * 1024)))
+# A claimed row is given back if its worker has not finished it by then
+LEASE_SECONDS = 120
+
+SLIDE_OUTBOX_PENDING = metrics.REGISTRY.gauge(
+    "snail_slide_outbox_pending",
+    "Slides waiting to be replicated to S3",
+)
+
+SLIDE_REPLICATIONS = metrics.REGISTRY.counter(
+    "snail_slide_replications_total",
+    "S3 replication attempts by result (uploaded, failed, dropped)",
+    labelnames=("result",),
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    key TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    url TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    lease_until REAL NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+CREATE TABLE IF NOT EXISTS deletions (
+    prefix TEXT PRIMARY KEY,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL DEFAULT 0,
+    lease_until REAL NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+"""
+
+
+class SlideOutbox:
+    """SQLite outbox of slides to replicate (url is set once replicated) and S3 prefixes to delete."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # Bumped by create(): connections opened before (e.g. before a data dir reset) are reopened
+        self._generation = 0
+
+    def create(self) -> None:
+        """Create the database and its schema (SlideStore.start calls this once per worker)."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        try:
+            # WAL mode is stored in the database file
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+        finally:
+            conn.close()
+        with self._lock:
+            self._generation += 1
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # One connection per thread, reused across operations
+        if not self._generation:
+            # Used without start() (tools, tests)
+            self.create()
+        local = self._local
+        conn = getattr(local, "conn", None)
+        if conn is None or local.generation != self._generation:
+            if conn is not None:
+                conn.close()
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            local.conn, local.generation = conn, self._generation
+        yield conn
+
+    def enqueue(self, items: Iterable[Tuple[str, Path]]) -> None:
+        """Record (s3 key, local path) pairs; keys already known are left as they are."""
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO outbox (key, path) VALUES (?, ?)",
+                [(key, str(path)) for key, path in items],
+            )
+
+    def urls(self, keys: Iterable[str]) -> Dict[str, str]:
+        """S3 URLs of the given keys that are replicated."""
+        keys = list(keys)
+        if not keys:
+            return {}
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT key, url FROM outbox WHERE url IS NOT NULL AND key IN ({','.join('?' * len(keys))})",
+                keys,
+            ).fetchall()
+        return dict(rows)
+
+    def claim(self, limit: int, now: float) -> List[Tuple[str, str, int]]:
+        """Lease up to limit due rows; returns (key, path, attempts)."""
+        return self._claim(
+            "SELECT key, path, attempts FROM outbox WHERE url IS NULL AND next_attempt <= ? "
+            "AND lease_until <= ? ORDER BY next_attempt LIMIT ?",
+            "UPDATE outbox SET lease_until = ? WHERE key = ?",
+            limit, now,
+        )
+
+    def claim_deletions(self, limit: int, now: float) -> List[Tuple[str, int]]:
+        """Lease up to limit due prefix deletions; returns (prefix, attempts)."""
+        return self._claim(
+            "SELECT prefix, attempts FROM deletions WHERE next_attempt <= ? AND lease_until <= ? "
+            "ORDER BY next_attempt LIMIT ?",
+            "UPDATE deletions SET lease_until = ? WHERE prefix = ?",
+            limit, now,
+        )
+
+    def _claim(self, select: str, lease: str, limit: int, now: float) -> list:
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = conn.execute(select, (now, now, limit)).fetchall()
+                conn.executemany(lease, [(now + LEASE_SECONDS, row[0]) for row in rows])
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return rows
+
+    def mark_replicated(self, key: str, url: str) -> None:
+        with self._connect() as conn:
+            conn.execute("UPDATE outbox SET url = ?, lease_until = 0, last_error = NULL WHERE key = ?", (url, key))
+
+    def mark_failed(self, key: str, error: str, retry_at: float) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE outbox SET attempts = attempts + 1, next_attempt = ?, lease_until = 0, last_error = ? "
+                "WHERE key = ?",
+                (retry_at, error, key),
+            )
+
+    def forget(self, key_prefix: str) -> None:
+        """Drop all rows under a key prefix (e.g. a removed namespace)."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM outbox WHERE substr(key, 1, ?) = ?", (len(key_prefix), key_prefix))
+
+    def retire(self, key_prefix: str) -> None:
+        """Stop replicating a key prefix and queue its deletion from S3."""
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM outbox WHERE substr(key, 1, ?) = ?", (len(key_prefix), key_prefix))
+                conn.execute("INSERT OR REPLACE INTO deletions (prefix) VALUES (?)", (key_prefix,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def mark_deleted(self, prefix: str) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM deletions WHERE prefix = ?", (prefix,))
+
+    def mark_deletion_failed(self, prefix: str, error: str, retry_at: float) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE deletions SET attempts = attempts + 1, next_attempt = ?, lease_until = 0, last_error = ? "
+                "WHERE prefix = ?",
+                (retry_at, error, prefix),
+            )
+
+    def pending(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM outbox WHERE url IS NULL").fetchone()[0]
+
+
+def inline_image(path: Path, max_side: int = INLINE_MAX_SIDE, max_bytes: int = INLINE_MAX_BYTES) -> str:
+    """
+    A downscaled JPEG data URL of a slide, at most max_bytes long.
+
+    Raises:
+        ValueError: If the slide does not fit even at a small size
+    """
+    from PIL import Image
+
+    with Image.open(path) as image:
+        image = image.convert("RGB")
+    side, quality = max_side, 80
+    while side >= 128:
+        copy = image.copy()
+        copy.thumbnail((side, side))
+        buffer = io.BytesIO()
+        copy.save(buffer, format="JPEG", quality=quality, optimize=True)
+        url = "data:image/jpeg;base64," + base64.b64encode(buffer.getvalue()).decode("ascii")
+        if len(url) <= max_bytes:
+            return url
+        # Lower the quality once, then shrink
+        if quality > 60:
+            quality = 60
+        else:
+            side = int(side * 0.75)
+    raise ValueError(f"slide {path.name} does not fit in {max_bytes} bytes")
+
+
+class _InlineCache:
+    """LRU cache of inlined slides bounded by total size."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._items: "OrderedDict[str, str]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, path: Path) -> str:
+        key = str(path)
+        with self._lock:
+            if key in self._items:
+                self._items.move_to_end(key)
+                return self._items[key]
+        # Slide files are content-addressed and never change, so caching is safe
+        url = inline_image(path)
+        with self._lock:
+            if key not in self._items and len(url) <= self.max_bytes:
+                self._items[key] = url
+                self._size += len(url)
+                while self._size > self.max_bytes:
+                    _, evicted = self._items.popitem(last=False)
+                    self._size -= len(evicted)
+        return url
+
+
+class SlideStore:
+    """Local slide files, their replication to S3, and URL resolution."""
+
+    def __init__(self, data_dir: Path = DATA_DIR):
+        self.images_dir = Path(data_dir) / "images"
+        self.outbox = SlideOutbox(Path(data_dir) / "slide_outbox.sqlite3")
+        self._uploader_factory: Optional[Callable[[], object]] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inline_cache = _InlineCache(INLINE_CACHE_BYTES)
+
+    @staticmethod
+    def s3_key(path: Path) -> str:
+        """S3 key of a slide file: slides/<namespace>/<file name>."""
+        return f"slides/{path.parent.name}/{path.name}"
+
+    def local_path(self, url: str) -> Optional[Path]:
+        """Local file of an /images/<namespace>/<file> URL (None if not such a URL or missing)."""
+        if not url.startswith(IMAGES_URL_PREFIX):
+            return None
+        parts = url[len(IMAGES_URL_PREFIX):].split("/")
+        if len(parts) != 2 or any(p in ("", ".", "..") for p in parts):
+            return None
+        path = self.images_dir / parts[0] / parts[1]
+        return path if path.is_file() else None
+
+    def _uploader(self):
+        return self._uploader_factory() if self._uploader_factory else None
+
+    def accepts_local_urls(self) -> bool:
+        """True if slides are replicated to S3, so a local slide URL is only inlined for a while."""
+        return self._uploader() is not None
+
+    def _notify(self) -> None:
+        """Wake the sync task (callable from worker threads)."""
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wake.set)
+
+    def enqueue(self, image_paths: List[Path]) -> List[Optional[str]]:
+        """
+        Queue slides for replication and wake the sync task.
+
+        Returns:
+            S3 URL of each slide, or None where it is not replicated yet
+        """
+        keys = [self.s3_key(p) for p in image_paths]
+        self.outbox.enqueue(zip(keys, image_paths))
+        replicated = self.outbox.urls(keys)
+        if len(replicated) < len(keys):
+            self._notify()
+        return [replicated.get(key) for key in keys]
+
+    def retire_namespace(self, namespace: str) -> None:
+        """Forget a removed namespace; its S3 copies are deleted by the sync task (if S3 is configured)."""
+        prefix = f"slides/{namespace}/"
+        if self._uploader() is None:
+            self.outbox.forget(prefix)
+            return
+        self.outbox.retire(prefix)
+        self._notify()
+
+    def resolve(self, url: str) -> str:
+        """URL of one slide as sent to the model provider (see resolve_all)."""
+        return self.resolve_all([url])[url]
+
+    def resolve_all(self, urls: Iterable[str]) -> Dict[str, str]:
+        """
+        URLs of slides as sent to the model provider, with one outbox query.
+
+        http(s) URLs are returned as they are. Local /images/... URLs resolve
+        to the replicated S3 URL, or to a downscaled data URL of the file
+        until then. Anything else is returned unchanged.
+
+        Returns:
+            Resolved URL by given URL
+        """
+        paths = {url: self.local_path(url) for url in urls}
+        keys = {url: self.s3_key(path) for url, path in paths.items() if path is not None}
+        try:
+            replicated = self.outbox.urls(set(keys.values()))
+        except sqlite3.Error as e:
+            print(f"Warning: slide outbox lookup failed: {e}")
+            replicated = {}
+        resolved = {}
+        for url, path in paths.items():
+            if path is None:
+                resolved[url] = url
+            elif keys[url] in replicated:
+                metrics.record_cache("slide_url", hit=True)
+                resolved[url] = replicated[keys[url]]
+            else:
+                metrics.record_cache("slide_url", hit=False)
+                resolved[url] = self._inline_cache.get(path)
+        return resolved
+
+    def start(self, uploader_factory: Callable[[], object]) -> None:
+        """Start the sync task on the running loop (uploader_factory returns an S3Uploader or None)."""
+        self._uploader_factory = uploader_factory
+        self.outbox.create()
+        self._wake = asyncio.Event()
+        self._loop = asyncio.get_running_loop()
+        self._task = self._loop.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._loop = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                claimed = await self.sync_once()
+            except Exception as e:
+                metrics.record_error("slide_sync")
+                print(f"Warning: slide sync failed: {e}")
+                claimed = 0
+            if claimed:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def sync_once(self) -> int:
+        """
+        Upload one batch of due slides and delete due prefixes of removed namespaces.
+
+        Returns:
+            Number of slides and prefixes claimed (0 when nothing is due or S3 is not configured)
+        """
+        SLIDE_OUTBOX_PENDING.set(await asyncio.to_thread(self.outbox.pending))
+        uploader = self._uploader()
+        if uploader is None:
+            return 0
+        now = time.time()
+        rows = await asyncio.to_thread(self.outbox.claim, SYNC_CONCURRENCY, now)
+        if rows:
+            with tracing.span("slide_sync.batch", slides=len(rows)):
+                await asyncio.gather(*(self._replicate(uploader, *row) for row in rows))
+        deletions = await asyncio.to_thread(self.outbox.claim_deletions, SYNC_CONCURRENCY, now)
+        for prefix, attempts in deletions:
+            await self._delete_prefix(uploader, prefix, attempts)
+        return len(rows) + len(deletions)
+
+    async def _replicate(self, uploader, key: str, path: str, attempts: int) -> None:
+        if not os.path.exists(path):
+            # The namespace was cleaned up before it could be replicated
+            await asyncio.to_thread(self.outbox.forget, key)
+            SLIDE_REPLICATIONS.labels(result="dropped").inc()
+            return
+        try:
+            url = await asyncio.to_thread(uploader.upload_file, Path(path), key)
+        except Exception as e:
+            delay = min(2.0 ** attempts, MAX_BACKOFF_SECONDS)
+            await asyncio.to_thread(self.outbox.mark_failed, key, str(e), time.time() + delay)
+            SLIDE_REPLICATIONS.labels(result="failed").inc()
+            print(f"Warning: replicating {key} to S3 failed (attempt {attempts + 1}, retry in {delay:.0f}s): {e}")
+            return
+        await asyncio.to_thread(self.outbox.mark_replicated, key, url)
+        SLIDE_REPLICATIONS.labels(result="uploaded").inc()
+
+    async def _delete_prefix(self, uploader, prefix: str, attempts: int) -> None:
+        try:
+            await asyncio.to_thread(uploader.clear_prefix, prefix)
+        except Exception as e:
+            delay = min(2.0 ** attempts, MAX_BACKOFF_SECONDS)
+            await asyncio.to_thread(self.outbox.mark_deletion_failed, prefix, str(e), time.time() + delay)
+            print(f"Warning: deleting {prefix} from S3 failed (attempt {attempts + 1}, retry in {delay:.0f}s): {e}")
+            return
+        await asyncio.to_thread(self.outbox.mark_deleted, prefix)
+
+
+slide_store = SlideStore()
@@ -0,0 +1,189 @@
+"""
+Speculative student replies from interim speech transcripts.
+
+While the teacher is still talking, the browser sends interim transcripts.
+Once the transcript has not changed for SPECULATION_STABLE_MS, a reply is
+generated for it in the background without touching the session history.
+When the final transcript arrives, the speculative reply is committed if the
+final text matches the speculated text closely (word-level difflib ratio of
+at least SPECULATION_MATCH_THRESHOLD) and the history has not changed since;
+otherwise it is cancelled and the reply is generated normally.
+
+Configuration (environment variables):
+    SPECULATION_ENABLED          "0" disables speculation (default "1")
+    SPECULATION_STABLE_MS        Quiet period before speculating (default 700)
+    SPECULATION_MIN_WORDS        Shortest transcript worth speculating on (default 4)
+    SPECULATION_MATCH_THRESHOLD  Similarity needed to commit (default 0.9)
+"""
+import asyncio
+import difflib
+import os
+import re
+import time
+from types import ModuleType
+from typing import AsyncIterator, Dict, List, Optional
+
+from app.core import metrics
+
+
+SPECULATION_ENABLED = os.getenv("SPECULATION_ENABLED", "1").lower() not in ("0", "false", "no")
+STABLE_SECONDS = float(os.getenv("SPECULATION_STABLE_MS", "700")) / 1000
+MIN_WORDS = int(os.getenv("SPECULATION_MIN_WORDS", "4"))
+MATCH_THRESHOLD = float(os.getenv("SPECULATION_MATCH_THRESHOLD", "0.9"))
+
+# Speculations of sessions that never send a final transcript are dropped after this
+IDLE_SECONDS = 300
+
+_WORD = re.compile(r"[\w']+")
+
+
+def _words(text: str) -> List[str]:
+    return _WORD.findall(text.lower())
+
+
+def similarity(a: str, b: str) -> float:
+    """Word-level similarity of two transcripts (0..1), ignoring case and punctuation."""
+    return difflib.SequenceMatcher(None, _words(a), _words(b), autojunk=False).ratio()
+
+
+def _history_size(wf: ModuleType, session_id: str) -> int:
+    try:
+        return os.path.getsize(wf.history_file(session_id))
+    except OSError:
+        return 0
+
+
+class _SessionSpeculation:
+    """Interim transcript state and speculative reply of one session."""
+
+    def __init__(self):
+        self.latest = ""
+        self.debounce: Optional[asyncio.TimerHandle] = None
+        self.text: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+        self.history_size = 0
+        self.updated = time.monotonic()
+
+    def cancel(self) -> None:
+        if self.debounce is not None:
+            self.debounce.cancel()
+            self.debounce = None
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+
+class Speculator:
+    """Schedules, matches and commits speculative replies per session."""
+
+    def __init__(self):
+        self._sessions: Dict[str, _SessionSpeculation] = {}
+
+    def interim(self, wf: ModuleType, session_id: str, text: str, system_prompt: str) -> bool:
+        """
+        Record an interim transcript; speculation starts once it stabilizes.
+
+        Returns:
+            False if speculation is disabled or the transcript did not change
+        """
+        if not SPECULATION_ENABLED:
+            return False
+        self._prune()
+        state = self._sessions.setdefault(session_id, _SessionSpeculation())
+        text = " ".join(text.split())
+        if text == state.latest:
+            return False
+        state.latest = text
+        state.updated = time.monotonic()
+        if state.debounce is not None:
+            state.debounce.cancel()
+        state.debounce = asyncio.get_running_loop().call_later(
+            STABLE_SECONDS, self._on_stable, wf, session_id, text, system_prompt
+        )
+        return True
+
+    def _on_stable(self, wf: ModuleType, session_id: str, text: str, system_prompt: str) -> None:
+        state = self._sessions.get(session_id)
+        if state is None or state.latest != text:
+            return
+        state.debounce = None
+        if len(_words(text)) < MIN_WORDS:
+            return
+        if state.task is not None and not state.task.done() and similarity(state.text or "", text) >= MATCH_THRESHOLD:
+            # The running speculation still covers what was said
+            return
+        if state.task is not None:
+            state.task.cancel()
+            metrics.SPECULATIONS.labels(outcome="restarted").inc()
+        state.text = text
+        state.history_size = _history_size(wf, session_id)
+        state.task = asyncio.get_running_loop().create_task(
+            wf.draft_feedback(text, session_id=session_id, system_prompt=system_prompt)
+        )
+        # Retrieve failures so they are not reported as unhandled
+        state.task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        metrics.SPECULATIONS.labels(outcome="started").inc()
+
+    def discard(self, session_id: str) -> None:
+        """Drop the session's speculation (e.g. the slide changed underneath it)."""
+        state = self._sessions.pop(session_id, None)
+        if state is not None:
+            if state.task is not None and not state.task.done():
+                metrics.SPECULATIONS.labels(outcome="discarded").inc()
+            state.cancel()
+
+    async def take(self, wf: ModuleType, session_id: str, final_text: str) -> Optional[str]:
+        """
+        Return the speculative reply if it can stand in for a reply to final_text.
+        The speculation is consumed either way.
+        """
+        state = self._sessions.pop(session_id, None)
+        if state is None or state.task is None:
+            if state is not None:
+                state.cancel()
+            return None
+        if state.debounce is not None:
+            state.debounce.cancel()
+        if similarity(state.text or "", final_text) < MATCH_THRESHOLD:
+            outcome = "mismatched"
+        elif _history_size(wf, session_id) != state.history_size:
+            # A slide change or another exchange was recorded since
+            outcome = "stale"
+        else:
+            try:
+                # Cancelling the caller (supersession) cancels the speculation too
+                reply = await state.task
+            except Exception as e:
+                metrics.SPECULATIONS.labels(outcome="failed").inc()
+                # The turn falls back to a fresh reply
+                metrics.record_error("speculation")
+                print(f"Warning: speculative reply failed: {e}")
+                return None
+            metrics.SPECULATIONS.labels(outcome="committed").inc()
+            return reply
+        state.cancel()
+        metrics.SPECULATIONS.labels(outcome=outcome).inc()
+        return None
+
+    async def reply_stream(
+        self, wf: ModuleType, text: str, session_id: str, system_prompt: str
+    ) -> AsyncIterator[str]:
+        """
+        Reply to a final transcript: commit a matching speculative reply (one
+        chunk), or stream a fresh reply with wf.stream_feedback.
+        """
+        draft = await self.take(wf, session_id, text)
+        if draft is not None:
+            await wf.write_history(wf.record_exchange, text, draft, session_id)
+            yield draft
+            return
+        async for delta in wf.stream_feedback(text, session_id=session_id, system_prompt=system_prompt):
+            yield delta
+
+    def _prune(self) -> None:
+        cutoff = time.monotonic() - IDLE_SECONDS
+        for session_id, state in list(self._sessions.items()):
+            if state.updated < cutoff:
+                self.discard(session_id)
+
+
+speculator = Speculator()
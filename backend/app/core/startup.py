@@ -0,0 +1,130 @@
+"""
+Startup helpers: phase timings and multi-worker-safe data-dir housekeeping.
+
+With several uvicorn workers every worker runs the app lifespan. The data
+folder reset must happen once per server launch, not once per worker, or a
+late worker would delete slides the others already serve. Housekeeping is
+therefore done under an exclusive file lock and recorded with a boot id
+stamp; workers of the same launch find the stamp and skip the reset.
+
+Configuration (environment variables):
+    DATA_RESET_ON_STARTUP  "1" wipes the data folder once per launch (default "0")
+    SNAIL_BOOT_ID          Explicit launch id (e.g. a deployment id); defaults to
+                           the process group leader's pid and start time
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - non-POSIX platforms
+    fcntl = None  # type: ignore
+
+from app.core import metrics
+
+
+STARTUP_PHASE_SECONDS = metrics.REGISTRY.gauge(
+    "snail_startup_phase_seconds",
+    "Duration of each startup phase of this worker",
+    labelnames=("phase",),
+)
+
+
+class StartupTimer:
+    """Records how long each startup phase took."""
+
+    def __init__(self):
+        self.phases: Dict[str, float] = {}
+
+    def record(self, phase: str, seconds: float) -> None:
+        self.phases[phase] = round(seconds, 4)
+        STARTUP_PHASE_SECONDS.labels(phase=phase).set(seconds)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+
+def _process_start_time(pid: int) -> str:
+    """Start time of a process in clock ticks (Linux), or '' when unavailable."""
+    try:
+        stat = Path(f"/proc/{pid}/stat").read_text()
+        # Field 22, counted after the parenthesised command name
+        return stat.rsplit(")", 1)[1].split()[19]
+    except (OSError, IndexError):
+        return ""
+
+
+def boot_id() -> str:
+    """
+    Identify the current server launch.
+
+    Every worker of one launch is in the process group of the command that
+    started it: uvicorn --workers/--reload spawns workers and gunicorn forks
+    them, and both keep the group. A single-process server leads its own
+    group. The group leader's pid plus its start time therefore identifies
+    the launch, and pid reuse cannot collide. A script that launches the
+    server more than once from the same group (no job control) should set
+    SNAIL_BOOT_ID.
+    """
+    explicit = os.getenv("SNAIL_BOOT_ID")
+    if explicit:
+        return explicit
+    leader = os.getpgrp()
+    return f"{leader}:{_process_start_time(leader)}"
+
+
+@contextmanager
+def _exclusive_lock(data_dir: Path) -> Iterator[None]:
+    # The lock lives outside data_dir because data_dir itself may be removed
+    digest = hashlib.sha1(str(data_dir.resolve()).encode()).hexdigest()[:12]
+    lock_path = Path(tempfile.gettempdir()) / f"snail-data-{digest}.lock"
+    with open(lock_path, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def prepare_data_dir(data_dir: Path, timer: StartupTimer) -> bool:
+    """
+    Reset data_dir once per launch (if enabled) and ensure its layout exists.
+
+    Returns:
+        True if this worker performed the reset
+    """
+    reset_enabled = os.getenv("DATA_RESET_ON_STARTUP", "0").lower() not in ("0", "false", "no")
+    stamp = data_dir / ".boot_id"
+    current = boot_id()
+    did_reset = False
+
+    wait_start = time.perf_counter()
+    with _exclusive_lock(data_dir):
+        timer.record("lock_wait", time.perf_counter() - wait_start)
+        with timer.phase("housekeeping"):
+            already_done = stamp.exists() and stamp.read_text().strip() == current
+            if reset_enabled and not already_done and data_dir.exists():
+                print(f"Resetting data folder: {data_dir}")
+                shutil.rmtree(data_dir)
+                did_reset = True
+
+            # Recreate the directory structure
+            (data_dir / "images").mkdir(parents=True, exist_ok=True)
+            (data_dir / "uploads").mkdir(parents=True, exist_ok=True)
+            stamp.write_text(current)
+    if did_reset:
+        print("Data folder reset complete")
+    return did_reset
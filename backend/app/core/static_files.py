@@ -0,0 +1,128 @@
+"""
+Static file mount for content-addressed slide images.
+
+Slide images live under a per-deck namespace and embed a content hash in
+their filename, so a URL always refers to the same bytes. They are served
+with a long-lived immutable Cache-Control header on top of Starlette's
+ETag / Last-Modified handling (conditional requests still get 304), and
+single byte ranges are supported for partial and resumed downloads.
+"""
+import os
+import re
+import typing
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, PathLike, StaticFiles
+from starlette.types import Receive, Scope, Send
+
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+_RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: str, size: int) -> typing.Optional[typing.Tuple[int, int]]:
+    """
+    Parse a single-range Range header.
+
+    Args:
+        header: Value of the Range request header
+        size: Size of the file in bytes
+
+    Returns:
+        Inclusive (start, end) byte positions, or None if the range is not satisfiable
+
+    Raises:
+        ValueError: If the header is malformed or asks for several ranges
+    """
+    match = _RANGE_PATTERN.match(header.strip())
+    if not match:
+        raise ValueError(f"Unsupported range: {header}")
+    first, last = match.groups()
+    if not first and not last:
+        raise ValueError(f"Unsupported range: {header}")
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0 or size == 0:
+            return None
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        return None
+    return start, end
+
+
+class RangeFileResponse(FileResponse):
+    """FileResponse that sends only the inclusive byte range [start, end]."""
+
+    def __init__(self, path: PathLike, start: int, end: int, **kwargs: typing.Any) -> None:
+        super().__init__(path, status_code=206, **kwargs)
+        self.start = start
+        self.end = end
+        self.headers["content-length"] = str(end - start + 1)
+        self.headers["content-range"] = f"bytes {start}-{end}/{self.stat_result.st_size}"
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if self.send_header_only:
+            await send({"type": "http.response.body", "body": b"", "more_body": False})
+            return
+        async with await anyio.open_file(self.path, mode="rb") as file:
+            await file.seek(self.start)
+            remaining = self.end - self.start + 1
+            while remaining > 0:
+                chunk = await file.read(min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                await send({"type": "http.response.body", "body": chunk, "more_body": remaining > 0})
+            if remaining > 0:
+                # File shrank underneath us; terminate the body
+                await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+class ImmutableStaticFiles(StaticFiles):
+    """StaticFiles with immutable caching and single byte-range support."""
+
+    def file_response(
+        self,
+        full_path: PathLike,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        method = scope["method"]
+        request_headers = Headers(scope=scope)
+        cache_headers = {"cache-control": IMMUTABLE_CACHE_CONTROL, "accept-ranges": "bytes"}
+
+        response = FileResponse(
+            full_path, status_code=status_code, stat_result=stat_result, method=method, headers=cache_headers
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+
+        range_header = request_headers.get("range")
+        if not range_header or status_code != 200 or method not in ("GET", "HEAD"):
+            return response
+        # If-Range: only honour the range when the client's copy is still current
+        if_range = request_headers.get("if-range")
+        if if_range and if_range not in (response.headers["etag"], response.headers["last-modified"]):
+            return response
+
+        try:
+            byte_range = parse_range(range_header, stat_result.st_size)
+        except ValueError:
+            # Multi-range and malformed requests get the whole file
+            return response
+        if byte_range is None:
+            return Response(
+                status_code=416,
+                headers={"content-range": f"bytes */{stat_result.st_size}", "accept-ranges": "bytes"},
+            )
+        return RangeFileResponse(
+            full_path, *byte_range, stat_result=stat_result, method=method, headers=cache_headers
+        )
@@ -0,0 +1,240 @@
+"""
+Lightweight request tracing.
+
+Spans are opened with the `span()` context manager and nest through a
+context variable, so the stages of one request end up in the same trace
+regardless of which module opened them. Finished traces are written as one
+JSON line each (a timeline of spans with start offsets and durations).
+
+Export is off unless enabled. Finished traces are handed to a queue that a
+background thread writes out, so the event loop never waits for the disk;
+when the writer falls behind, traces are dropped (snail_traces_dropped_total).
+The file is rotated to <path>.1 once it reaches TRACE_MAX_BYTES, so at most
+twice that is kept.
+
+Configuration (environment variables):
+    TRACING_ENABLED     "1" enables export (default off; spans still time)
+    TRACE_EXPORT_PATH   JSONL file to append traces to
+                        (default: data/traces/traces.jsonl)
+    TRACE_MIN_DURATION_MS  Only export traces at least this slow (default 0)
+    TRACE_SAMPLE_RATE   Fraction of traces exported (default 1)
+    TRACE_MAX_BYTES     Size at which the file is rotated (default 50 MB)
+    TRACE_QUEUE_SIZE    Traces waiting for the writer before new ones are
+                        dropped (default 1000)
+"""
+import json
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+from app.core import metrics
+
+
+DEFAULT_EXPORT_PATH = Path(__file__).parent.parent.parent / "data" / "traces" / "traces.jsonl"
+
+
+class Span:
+    """A timed unit of work inside a trace."""
+
+    __slots__ = (
+        "name", "trace_id", "span_id", "parent_id", "attributes",
+        "start_time", "_start", "duration", "status", "_trace",
+    )
+
+    def __init__(self, name: str, parent: Optional["Span"] = None, **attributes: Any):
+        self.name = name
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.attributes: Dict[str, Any] = dict(attributes)
+        self.start_time = time.time()
+        self._start = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.status = "ok"
+        # Spans of the whole trace are collected on the root span
+        self._trace: List["Span"] = parent._trace if parent else []
+
+    @property
+    def is_root(self) -> bool:
+        return self.parent_id is None
+
+    @property
+    def finished_spans(self) -> List["Span"]:
+        """Spans of the whole trace that have finished so far."""
+        return list(self._trace)
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def finish(self) -> None:
+        self.duration = time.perf_counter() - self._start
+        self._trace.append(self)
+
+    def to_dict(self, trace_start: float) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ms": round((self.start_time - trace_start) * 1000, 3),
+            "duration_ms": round((self.duration or 0.0) * 1000, 3),
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+def trace_record(root: Span) -> Dict[str, Any]:
+    """A finished trace as the JSON object written to the export file."""
+    spans = sorted(root._trace, key=lambda s: s.start_time)
+    return {
+        "trace_id": root.trace_id,
+        "name": root.name,
+        "timestamp": root.start_time,
+        "duration_ms": round((root.duration or 0.0) * 1000, 3),
+        "attributes": root.attributes,
+        "spans": [s.to_dict(root.start_time) for s in spans],
+    }
+
+
+class JsonlTraceExporter:
+    """
+    Appends finished traces to a JSONL file, one trace per line, from a
+    background thread. The file is rotated to <path>.1 at max_bytes.
+    """
+
+    def __init__(self, path: Path, max_bytes: int = 50 * 1024 * 1024, queue_size: int = 1000):
+        self.path = Path(path)
+        self.max_bytes = max_bytes
+        self._queue: "queue.Queue[Optional[Span]]" = queue.Queue(maxsize=queue_size)
+        self._size: Optional[int] = None
+        self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+        self._thread.start()
+
+    def export(self, root: Span) -> None:
+        """Queue a finished trace; drops it if the writer is behind (never blocks)."""
+        try:
+            self._queue.put_nowait(root)
+        except queue.Full:
+            metrics.TRACES_DROPPED.inc()
+
+    def close(self, timeout: float = 5.0) -> None:
+        """Write out the queued traces and stop the writer."""
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            # Write whatever else is waiting with the same open()
+            while batch[-1] is not None and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            roots = [root for root in batch if root is not None]
+            try:
+                self._write([json.dumps(trace_record(root), default=str) + "\n" for root in roots])
+            except Exception as e:
+                print(f"Warning: failed to export {len(roots)} traces: {e}")
+            if batch[-1] is None:
+                return
+
+    def _write(self, lines: List[str]) -> None:
+        if not lines:
+            return
+        if self._size is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._size = self.path.stat().st_size if self.path.exists() else 0
+        if self._size >= self.max_bytes:
+            os.replace(self.path, self.path.with_name(self.path.name + ".1"))
+            self._size = 0
+        data = "".join(lines)
+        with open(self.path, "a") as f:
+            f.write(data)
+        self._size += len(data.encode())
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+_exporter: Optional[JsonlTraceExporter] = None
+_exporter_lock = threading.Lock()
+
+
+def _tracing_enabled() -> bool:
+    return os.getenv("TRACING_ENABLED", "0").lower() in ("1", "true", "yes")
+
+
+def get_exporter() -> Optional[JsonlTraceExporter]:
+    """Return the configured exporter, or None when tracing export is disabled."""
+    global _exporter
+    if not _tracing_enabled():
+        return None
+    if _exporter is None:
+        with _exporter_lock:
+            if _exporter is None:
+                path = os.getenv("TRACE_EXPORT_PATH") or str(DEFAULT_EXPORT_PATH)
+                _exporter = JsonlTraceExporter(
+                    Path(path),
+                    max_bytes=int(os.getenv("TRACE_MAX_BYTES", str(50 * 1024 * 1024))),
+                    queue_size=int(os.getenv("TRACE_QUEUE_SIZE", "1000")),
+                )
+    return _exporter
+
+
+def shutdown() -> None:
+    """Write out traces still queued for export (blocking; call at shutdown)."""
+    global _exporter
+    with _exporter_lock:
+        exporter, _exporter = _exporter, None
+    if exporter is not None:
+        exporter.close()
+
+
+def current_span() -> Optional[Span]:
+    """Return the innermost active span, if any."""
+    return _current_span.get()
+
+
+@contextmanager
+def span(name: str, activate: bool = True, **attributes: Any) -> Iterator[Span]:
+    """
+    Time a block as a span of the current trace.
+
+    When no trace is active the span becomes the root of a new trace, which
+    is exported when it finishes. Pass activate=False from generators so the
+    span does not become the parent of spans opened by the consumer between
+    yields.
+    """
+    parent = _current_span.get()
+    current = Span(name, parent, **attributes)
+    token = _current_span.set(current) if activate else None
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.set_attribute("error", f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        current.finish()
+        if token is not None:
+            _current_span.reset(token)
+        if current.is_root:
+            _export(current)
+
+
+def _export(root: Span) -> None:
+    exporter = get_exporter()
+    if exporter is None:
+        return
+    min_ms = float(os.getenv("TRACE_MIN_DURATION_MS", "0") or 0)
+    if (root.duration or 0.0) * 1000 < min_ms:
+        return
+    if random.random() >= float(os.getenv("TRACE_SAMPLE_RATE", "1") or 0):
+        return
+    exporter.export(root)
@@ -1,25 +1,40 @@
 from pathlib import Path
 from types import ModuleType
-from typing import Optional
+from typing import Optional, Tuple
 import importlib.util
 import sys
 
+from app.core import metrics
+
+# (mtime of workflow.py, loaded module)
+_cached: Optional[Tuple[float, ModuleType]] = None
+
 
 def load_workflow_module() -> Optional[ModuleType]:
 	"""
 	Dynamically load the backend/workflow.py module by absolute path
 	so it works regardless of PYTHONPATH or working directory.
+	The module is cached and only re-executed when the file changes.
 	"""
+	global _cached
 	backend_dir = Path(__file__).parent.parent.parent
 	workflow_path = backend_dir / "workflow.py"
-	if not workflow_path.exists():
+	try:
+		mtime = workflow_path.stat().st_mtime
+	except OSError:
 		return None
 
+	if _cached is not None and _cached[0] == mtime:
+		metrics.record_cache("workflow_module", hit=True)
+		return _cached[1]
+	metrics.record_cache("workflow_module", hit=False)
+
 	spec = importlib.util.spec_from_file_location("workflow", str(workflow_path))
 	if spec is None or spec.loader is None:
 		return None
 	module = importlib.util.module_from_spec(spec)
 	sys.modules["workflow"] = module
 	spec.loader.exec_module(module)
+	_cached = (mtime, module)
 	return module
 
@@ -2,11 +2,17 @@
 FastAPI main application entry point.
 Stateless backend for teaching simulation tool.
 """
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+import asyncio
+import time
+
+# Measure module import cost (routers, dependencies) for the startup report
+_IMPORT_START = time.perf_counter()
+
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.routing import Match
 import os
-import shutil
 from pathlib import Path
 from dotenv import load_dotenv
 
@@ -15,32 +21,59 @@ load_dotenv()
 
 from app.api import upload, settings
 from app.api import feedback
+from app.api import admin
+from app.api import ws
+from app.api import classroom
+from app.core import history_log, metrics, tracing
+from app.core.profiler import profiling_session
+from app.core.classroom import classroom_store
+from app.core.deck_manifest import deck_manifest
+from app.core.settings_store import settings_store
+from app.core.slide_store import slide_store
+from app.core.startup import StartupTimer, prepare_data_dir
+from app.core.static_files import ImmutableStaticFiles
 
+DATA_DIR = Path(__file__).parent.parent / "data"
 
-def reset_data_folder():
-    """Clear the data folder on server startup."""
-    data_dir = Path(__file__).parent.parent / "data"
-
-    if data_dir.exists():
-        print(f"Resetting data folder: {data_dir}")
-        shutil.rmtree(data_dir)
+startup_timer = StartupTimer()
+startup_timer.record("imports", time.perf_counter() - _IMPORT_START)
 
-    # Recreate the directory structure
-    images_dir = data_dir / "images"
-    uploads_dir = data_dir / "uploads"
-    images_dir.mkdir(parents=True, exist_ok=True)
-    uploads_dir.mkdir(parents=True, exist_ok=True)
-    print(f"Data folder reset complete")
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Per-worker startup/shutdown.
+    Data-dir housekeeping runs once per launch under a file lock, so scaling
+    out to several workers never deletes slides another worker is serving.
+    Heavy dependencies (document tooling, boto3, openai) load on first use.
+    """
+    started = time.perf_counter()
+    app.state.data_reset = prepare_data_dir(DATA_DIR, startup_timer)
+    with startup_timer.phase("deck_manifest"):
+        # Decks converted ahead of time by tools/ingest_decks.py
+        seeded = deck_manifest.load_and_seed(DATA_DIR / "images")
+    if deck_manifest.decks:
+        print(f"Deck manifest: {len(deck_manifest.decks)} pre-ingested decks ({seeded} linked)")
+    startup_timer.record("lifespan", time.perf_counter() - started)
+    print(f"Startup phases (s): {startup_timer.phases}")
+    # Write-behind S3 replication of uploaded slides (idle without S3)
+    slide_store.start(upload.get_s3_uploader)
+    yield
+    await slide_store.stop()
+    # Sync history appends still waiting for their batched fsync
+    history_log.sync()
+    # Make sure background profile writes reach disk before exiting
+    await settings_store.flush()
+    await classroom_store.flush()
+    await asyncio.to_thread(tracing.shutdown)
 
-# Reset data folder on startup
-reset_data_folder()
 
 # Create FastAPI app
 app = FastAPI(
     title="Teaching Simulation API",
     description="Stateless API for teaching simulation with AI-generated student feedback",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS middleware for frontend communication
@@ -52,14 +85,69 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+
+def _route_label(request: Request) -> str:
+    """Resolve the route template for a request so metric labels stay low-cardinality."""
+    for route in request.app.router.routes:
+        match, _ = route.matches(request.scope)
+        if match == Match.FULL:
+            return getattr(route, "path", request.url.path)
+    return "unmatched"
+
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    """Track in-flight requests, latency per route and server errors."""
+    route = _route_label(request)
+    in_flight = metrics.HTTP_IN_FLIGHT.labels(route=route)
+    in_flight.inc()
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        in_flight.dec()
+        metrics.HTTP_REQUEST_SECONDS.labels(method=request.method, route=route).observe(
+            time.perf_counter() - start
+        )
+        if status_code >= 500:
+            metrics.record_error(f"http:{route}")
+
+
+@app.middleware("http")
+async def tracing_middleware(request: Request, call_next):
+    """Open a root span per request and attach the profiler when it is armed."""
+    if request.url.path == "/metrics":
+        return await call_next(request)
+    profiled = not request.url.path.startswith("/api/admin") and profiling_session.begin_request()
+    try:
+        with tracing.span(f"{request.method} {request.url.path}", method=request.method) as root:
+            if profiled:
+                root.set_attribute("profiled", True)
+            response = await call_next(request)
+            root.set_attribute("status_code", response.status_code)
+            response.headers["X-Trace-Id"] = root.trace_id
+            return response
+    finally:
+        if profiled:
+            # Stopping the sampler joins its thread, which can take an interval
+            await asyncio.to_thread(profiling_session.end_request)
+
 # Include routers
 app.include_router(upload.router, prefix="/api", tags=["upload"])
 app.include_router(settings.router, prefix="/api", tags=["settings"])
 app.include_router(feedback.router, prefix="/api", tags=["feedback"])
+app.include_router(admin.router, prefix="/api", tags=["admin"])
+app.include_router(ws.router, prefix="/api", tags=["ws"])
+app.include_router(classroom.router, prefix="/api", tags=["classroom"])
 
-# Mount static files for serving slide images
-images_dir = Path(__file__).parent.parent / "data" / "images"
-app.mount("/images", StaticFiles(directory=str(images_dir)), name="images")
+# Mount static files for serving slide images. Paths are content-addressed
+# (/images/<namespace>/slide_000_<hash>.png), so they are cached as immutable.
+# The directory is created by the lifespan, so skip the import-time check.
+images_dir = DATA_DIR / "images"
+app.mount("/images", ImmutableStaticFiles(directory=str(images_dir), check_dir=False), name="images")
 
 @app.get("/")
 async def root():
@@ -76,5 +164,12 @@ async def health_check():
     return {
         "status": "healthy",
         "images_dir_exists": images_dir.exists(),
-        "images_dir_path": str(images_dir)
+        "images_dir_path": str(images_dir),
+        "worker_pid": os.getpid(),
+        "startup_phases_s": startup_timer.phases
     }
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus scrape endpoint."""
+    return Response(content=metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE_LATEST)
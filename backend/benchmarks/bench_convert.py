@@ -0,0 +1,335 @@
+"""
+Slide conversion micro-benchmark and regression tracker.
+
+Generates a synthetic corpus of PDF and PPTX decks of varying page count
+and complexity, runs SlideConverter.convert_file on each deck under each
+rendering profile, and records pages/second, peak RSS and output bytes.
+Every case runs in a fresh subprocess so peak RSS is not polluted by
+earlier cases. Peak RSS is the combined RSS of the process tree
+(the benchmark process plus its concurrent poppler/LibreOffice children),
+sampled every few milliseconds from /proc while the conversion runs. Where
+/proc is not available it falls back to the largest single process.
+
+Run from the backend directory:
+    python -m benchmarks.bench_convert --output bench_convert.json
+    python -m benchmarks.bench_convert --compare bench_convert.json
+
+--compare exits non-zero when any shared case regresses in pages/second
+or peak RSS by more than --threshold (default 10%).
+"""
+import argparse
+import io
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+
+BACKEND_DIR = Path(__file__).parent.parent
+
+# Rendering configurations passed to SlideConverter
+PROFILES: Dict[str, Dict] = {
+    "baseline": {"dpi": 300, "thread_count": 1, "png_compress_level": 6},
+    "dpi200": {"dpi": 200, "thread_count": 1, "png_compress_level": 6},
+    "dpi150-fastpng": {"dpi": 150, "thread_count": 1, "png_compress_level": 1},
+    "dpi150-threads4": {"dpi": 150, "thread_count": 4, "png_compress_level": 6},
+    "dpi150-pdftocairo": {"dpi": 150, "thread_count": 1, "png_compress_level": 6, "use_pdftocairo": True},
+}
+
+# (kind, pages, complexity)
+DEFAULT_CORPUS: List[Tuple[str, int, str]] = [
+    ("pdf", 1, "text"),
+    ("pdf", 10, "text"),
+    ("pdf", 10, "images"),
+    ("pdf", 40, "text"),
+    ("pptx", 10, "simple"),
+    ("pptx", 10, "complex"),
+]
+
+
+def _noise_image(width: int, height: int, seed: int):
+    """Photo-like, poorly compressible image."""
+    from PIL import Image
+
+    rng = random.Random(seed)
+    return Image.frombytes("RGB", (width, height), bytes(rng.getrandbits(8) for _ in range(width * height * 3)))
+
+
+def make_pdf(pages: int, complexity: str) -> bytes:
+    from PIL import Image, ImageDraw
+
+    slides = []
+    for i in range(pages):
+        img = Image.new("RGB", (1600, 900), (250, 250, 252))
+        draw = ImageDraw.Draw(img)
+        draw.rectangle([60, 50, 1540, 150], fill=(30, 64, 175))
+        draw.text((80, 90), f"Slide {i + 1}", fill=(255, 255, 255))
+        for line in range(10):
+            draw.text((80, 200 + line * 55), f"Bullet {line + 1}: synthetic benchmark content", fill=(15, 15, 15))
+        if complexity == "images":
+            img.paste(_noise_image(600, 450, seed=i), (900, 250))
+        slides.append(img)
+    buf = io.BytesIO()
+    slides[0].save(buf, "PDF", save_all=True, append_images=slides[1:], resolution=150)
+    return buf.getvalue()
+
+
+def make_pptx(slides: int, complexity: str) -> bytes:
+    from pptx import Presentation
+    from pptx.util import Inches, Pt
+
+    prs = Presentation()
+    picture = None
+    if complexity == "complex":
+        picture = io.BytesIO()
+        _noise_image(400, 300, seed=7).save(picture, "PNG")
+
+    for i in range(slides):
+        slide = prs.slides.add_slide(prs.slide_layouts[1])
+        slide.shapes.title.text = f"Slide {i + 1}"
+        body = slide.placeholders[1].text_frame
+        body.text = "Synthetic benchmark content"
+        for line in range(5):
+            body.add_paragraph().text = f"Bullet {line + 1}"
+        if complexity == "complex":
+            rows, cols = 6, 4
+            table = slide.shapes.add_table(rows, cols, Inches(5), Inches(4.5), Inches(4.5), Inches(2.5)).table
+            for r in range(rows):
+                for c in range(cols):
+                    table.cell(r, c).text = f"{r}.{c}"
+            for s in range(20):
+                box = slide.shapes.add_textbox(Inches(0.2 + (s % 10) * 0.9), Inches(6.6 + (s // 10) * 0.4),
+                                               Inches(0.8), Inches(0.3))
+                box.text_frame.text = f"shape {s}"
+                box.text_frame.paragraphs[0].runs[0].font.size = Pt(8)
+            picture.seek(0)
+            slide.shapes.add_picture(picture, Inches(6), Inches(1.5), width=Inches(3))
+    buf = io.BytesIO()
+    prs.save(buf)
+    return buf.getvalue()
+
+
+def build_corpus(corpus_dir: Path, cases: List[Tuple[str, int, str]]) -> List[Path]:
+    """Write the synthetic decks (reused across runs when already present)."""
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for kind, pages, complexity in cases:
+        path = corpus_dir / f"{kind}_{pages:03d}p_{complexity}.{kind}"
+        if not path.exists():
+            data = make_pdf(pages, complexity) if kind == "pdf" else make_pptx(pages, complexity)
+            path.write_bytes(data)
+        paths.append(path)
+    return paths
+
+
+def _peak_rss_mb() -> float:
+    """Peak RSS of the largest single process: this one or one waited-for child."""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is bytes on macOS and KiB on Linux
+    scale = 2**20 if sys.platform == "darwin" else 2**10
+    return round(max(own, children) / scale, 1)
+
+
+def _tree_rss_bytes(root: int) -> int:
+    """Current RSS of a process and all its descendants, from /proc."""
+    parents: Dict[int, List[int]] = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # Field 4 (ppid), counted after the parenthesised command name
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        parents.setdefault(ppid, []).append(int(entry))
+    total, stack = 0, [root]
+    page_size = os.sysconf("SC_PAGE_SIZE")
+    while stack:
+        pid = stack.pop()
+        stack.extend(parents.get(pid, ()))
+        try:
+            with open(f"/proc/{pid}/statm") as f:
+                total += int(f.read().split()[1]) * page_size
+        except (OSError, IndexError, ValueError):
+            continue
+    return total
+
+
+class TreeRssSampler:
+    """Samples the combined RSS of this process tree in a background thread."""
+
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self.peak = 0
+        self.available = os.path.exists(f"/proc/{os.getpid()}/statm")
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while True:
+            self.peak = max(self.peak, _tree_rss_bytes(os.getpid()))
+            if self._stop.wait(self.interval):
+                return
+
+    def __enter__(self) -> "TreeRssSampler":
+        if self.available:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        if self.available:
+            self._stop.set()
+            self._thread.join()
+
+    def peak_mb(self) -> float:
+        """Sampled peak of the tree, or the largest single process without /proc."""
+        if not self.available:
+            return _peak_rss_mb()
+        return round(self.peak / 2**20, 1)
+
+
+def run_one(deck: Path, profile: Dict) -> Dict:
+    """Convert one deck with one profile in this process and report the measurements."""
+    from app.core.slide_converter import SlideConverter
+
+    content = deck.read_bytes()
+    with tempfile.TemporaryDirectory(prefix="snail-convert-") as out:
+        converter = SlideConverter(Path(out), **profile)
+        with TreeRssSampler() as sampler:
+            start = time.perf_counter()
+            image_paths = converter.convert_file(content, deck.name)
+            elapsed = time.perf_counter() - start
+        output_bytes = sum(p.stat().st_size for p in image_paths)
+    pages = len(image_paths)
+    return {
+        "pages": pages,
+        "seconds": round(elapsed, 4),
+        "pages_per_sec": round(pages / elapsed, 3) if elapsed else 0.0,
+        "peak_rss_mb": sampler.peak_mb(),
+        "output_bytes": output_bytes,
+    }
+
+
+def run_case(deck: Path, profile_name: str, profile: Dict, repeat: int) -> Dict:
+    """Run a case `repeat` times in fresh subprocesses and keep the fastest run."""
+    best = None
+    error = None
+    for _ in range(repeat):
+        proc = subprocess.run(
+            [sys.executable, "-m", "benchmarks.bench_convert", "--run-one",
+             json.dumps({"deck": str(deck), "profile": profile})],
+            cwd=str(BACKEND_DIR), capture_output=True, text=True,
+        )
+        if proc.returncode != 0:
+            error = (proc.stderr.strip().splitlines() or ["unknown error"])[-1]
+            break
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        if best is None or result["seconds"] < best["seconds"]:
+            best = result
+    row = {"deck": deck.name, "profile": profile_name, "settings": profile}
+    if best is None:
+        row["error"] = error
+    else:
+        row.update(best)
+    return row
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=str(BACKEND_DIR),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> List[str]:
+    """Return human-readable regressions of `current` against `baseline`."""
+    base_rows = {(r["deck"], r["profile"]): r for r in baseline["results"] if "error" not in r}
+    regressions = []
+    print(f"\n{'deck':<28}{'profile':<20}{'pages/s':>18}{'peak RSS MB':>20}")
+    for row in current["results"]:
+        key = (row["deck"], row["profile"])
+        base = base_rows.get(key)
+        if base is None or "error" in row:
+            continue
+        speed = (row["pages_per_sec"] - base["pages_per_sec"]) / base["pages_per_sec"] if base["pages_per_sec"] else 0.0
+        rss = (row["peak_rss_mb"] - base["peak_rss_mb"]) / base["peak_rss_mb"] if base["peak_rss_mb"] else 0.0
+        print(f"{row['deck']:<28}{row['profile']:<20}{row['pages_per_sec']:>10} ({speed:+.0%})"
+              f"{row['peak_rss_mb']:>12} ({rss:+.0%})")
+        if speed < -threshold:
+            regressions.append(f"{key}: pages/s {base['pages_per_sec']} -> {row['pages_per_sec']}")
+        if rss > threshold:
+            regressions.append(f"{key}: peak RSS {base['peak_rss_mb']} MB -> {row['peak_rss_mb']} MB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--corpus-dir", default=str(Path(tempfile.gettempdir()) / "snail-convert-corpus"),
+                        help="Where synthetic decks are generated and cached")
+    parser.add_argument("--profiles", default=",".join(PROFILES),
+                        help=f"Comma-separated rendering profiles (available: {', '.join(PROFILES)})")
+    parser.add_argument("--kinds", default="pdf,pptx", help="Deck kinds to include")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case; the fastest is kept")
+    parser.add_argument("--output", help="Write results JSON to this file")
+    parser.add_argument("--compare", help="Baseline results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.10, help="Allowed relative regression")
+    parser.add_argument("--run-one", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_one:
+        spec = json.loads(args.run_one)
+        print(json.dumps(run_one(Path(spec["deck"]), spec["profile"])))
+        return
+
+    kinds = {k.strip() for k in args.kinds.split(",")}
+    decks = build_corpus(Path(args.corpus_dir), [c for c in DEFAULT_CORPUS if c[0] in kinds])
+    profile_names = [p.strip() for p in args.profiles.split(",") if p.strip()]
+    unknown = [p for p in profile_names if p not in PROFILES]
+    if unknown:
+        parser.error(f"Unknown profiles: {', '.join(unknown)}")
+
+    results = []
+    print(f"{'deck':<28}{'profile':<20}{'pages':>6}{'pages/s':>10}{'RSS MB':>9}{'out KB':>10}")
+    for deck in decks:
+        for name in profile_names:
+            row = run_case(deck, name, PROFILES[name], args.repeat)
+            results.append(row)
+            if "error" in row:
+                print(f"{deck.name:<28}{name:<20} error: {row['error']}")
+            else:
+                print(f"{deck.name:<28}{name:<20}{row['pages']:>6}{row['pages_per_sec']:>10}"
+                      f"{row['peak_rss_mb']:>9}{row['output_bytes'] // 1024:>10}")
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": sys.version.split()[0],
+        "results": results,
+    }
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        regressions = compare(baseline, report, args.threshold)
+        if regressions:
+            print("\nRegressions:")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print("\nNo regressions beyond threshold.")
+
+
+if __name__ == "__main__":
+    main()
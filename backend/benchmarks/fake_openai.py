@@ -0,0 +1,143 @@
+"""
+Local OpenAI-compatible chat completions server for benchmarks.
+
+Serves POST /v1/chat/completions (streaming and non-streaming) with a
+configurable time to first token and token rate so the backend can be
+load-tested without calling the real API.
+
+Usage:
+    python -m benchmarks.fake_openai --port 9100 --ttft-ms 300 --tokens-per-sec 60
+"""
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+CONFIG = {
+    "ttft_ms": float(os.getenv("FAKE_OPENAI_TTFT_MS", "300")),
+    "tokens_per_sec": float(os.getenv("FAKE_OPENAI_TOKENS_PER_SEC", "60")),
+    "reply_tokens": int(os.getenv("FAKE_OPENAI_REPLY_TOKENS", "40")),
+}
+
+REPLY_WORDS = (
+    "Wait so what does that part of the slide mean and how does it connect "
+    "to what you said before about the main idea could you give an example "
+    "please I think I get it but I am not totally sure yet"
+).split()
+
+app = FastAPI(title="Fake OpenAI")
+
+
+def _reply_tokens(max_tokens: int):
+    count = min(CONFIG["reply_tokens"], max_tokens)
+    return [REPLY_WORDS[i % len(REPLY_WORDS)] + " " for i in range(count)]
+
+
+def _prompt_tokens(messages) -> int:
+    # Rough estimate: ~4 characters per token, images counted as a flat 85
+    total = 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            total += max(1, len(content) // 4)
+        elif isinstance(content, list):
+            total += 85 * len(content)
+    return total
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    model = body.get("model") or "fake-model"
+    tokens = _reply_tokens(int(body.get("max_tokens") or 100))
+    prompt_tokens = _prompt_tokens(body.get("messages", []))
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+    created = int(time.time())
+    ttft = CONFIG["ttft_ms"] / 1000.0
+    rate = CONFIG["tokens_per_sec"]
+    delay = 1.0 / rate if rate > 0 else 0.0
+
+    if not body.get("stream"):
+        await asyncio.sleep(ttft + delay * len(tokens))
+        return JSONResponse({
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(tokens).strip()},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(tokens),
+                "total_tokens": prompt_tokens + len(tokens),
+            },
+        })
+
+    include_usage = bool((body.get("stream_options") or {}).get("include_usage"))
+
+    async def events():
+        def chunk(delta, finish_reason=None):
+            return {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }
+
+        await asyncio.sleep(ttft)
+        yield f"data: {json.dumps(chunk({'role': 'assistant', 'content': ''}))}\n\n"
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(delay)
+            yield f"data: {json.dumps(chunk({'content': token}))}\n\n"
+        yield f"data: {json.dumps(chunk({}, 'stop'))}\n\n"
+        if include_usage:
+            usage = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(tokens),
+                    "total_tokens": prompt_tokens + len(tokens),
+                },
+            }
+            yield f"data: {json.dumps(usage)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--ttft-ms", type=float, default=CONFIG["ttft_ms"])
+    parser.add_argument("--tokens-per-sec", type=float, default=CONFIG["tokens_per_sec"])
+    parser.add_argument("--reply-tokens", type=int, default=CONFIG["reply_tokens"])
+    args = parser.parse_args()
+
+    CONFIG.update(
+        ttft_ms=args.ttft_ms,
+        tokens_per_sec=args.tokens_per_sec,
+        reply_tokens=args.reply_tokens,
+    )
+
+    import uvicorn
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,403 @@
+"""
+End-to-end load test for the FastAPI backend.
+
+Starts the app under uvicorn against a local fake OpenAI server
+(benchmarks.fake_openai) and a local S3 stand-in (moto's server mode, or
+any S3-compatible endpoint such as MinIO via --s3-endpoint), then drives
+concurrent /api/upload, /api/slide_change and /api/feedback traffic and
+reports throughput, p50/p95/p99 latency and server memory.
+
+Run from the backend directory:
+    python -m benchmarks.load_test --users 20 --duration 60 --output results.json
+
+Requires httpx (already a dependency) and, unless --s3-endpoint is given,
+moto[server].
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import httpx
+
+
+BACKEND_DIR = Path(__file__).parent.parent
+BUCKET = "snail-bench"
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an unsorted list (0 for an empty list)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, math.ceil(pct / 100.0 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+def make_synthetic_pdf(pages: int) -> bytes:
+    """Build a simple multi-page PDF deck with Pillow."""
+    from PIL import Image, ImageDraw
+
+    images = []
+    for i in range(pages):
+        img = Image.new("RGB", (1280, 720), (245, 245, 250))
+        draw = ImageDraw.Draw(img)
+        draw.rectangle([60, 60, 1220, 160], fill=(30, 64, 175))
+        draw.text((80, 95), f"Benchmark slide {i + 1}", fill=(255, 255, 255))
+        for line in range(8):
+            draw.text((80, 220 + line * 50), f"- Bullet point {line + 1} on slide {i + 1}", fill=(20, 20, 20))
+        images.append(img)
+    buf = io.BytesIO()
+    images[0].save(buf, "PDF", save_all=True, append_images=images[1:])
+    return buf.getvalue()
+
+
+def _rss_bytes(pid: int) -> int:
+    """Resident set size of a process and its children (Linux /proc, psutil if available)."""
+    try:
+        import psutil  # type: ignore
+
+        proc = psutil.Process(pid)
+        procs = [proc] + proc.children(recursive=True)
+        return sum(p.memory_info().rss for p in procs if p.is_running())
+    except ImportError:
+        pass
+    except Exception:
+        return 0
+    total = 0
+    pids = [pid]
+    try:
+        children = Path(f"/proc/{pid}/task/{pid}/children").read_text().split()
+        pids.extend(int(c) for c in children)
+    except OSError:
+        pass
+    for p in pids:
+        try:
+            for line in Path(f"/proc/{p}/status").read_text().splitlines():
+                if line.startswith("VmRSS:"):
+                    total += int(line.split()[1]) * 1024
+        except OSError:
+            continue
+    return total
+
+
+class Services:
+    """Starts and stops the fake OpenAI server, the S3 stand-in and the app."""
+
+    def __init__(self, args):
+        self.args = args
+        self.procs: List[subprocess.Popen] = []
+        self.moto_server = None
+        self.app_proc: Optional[subprocess.Popen] = None
+        self.app_url = ""
+        self.s3_endpoint = args.s3_endpoint
+        # The workflow keeps its history logs and context.txt relative to the working
+        # directory, so the app runs from a scratch copy to leave the tree untouched
+        self.workdir = Path(tempfile.mkdtemp(prefix="snail-bench-"))
+
+    def _spawn(self, cmd: List[str], env: Dict[str, str], cwd: Path = BACKEND_DIR) -> subprocess.Popen:
+        proc = subprocess.Popen(cmd, cwd=str(cwd), env=env, start_new_session=True)
+        self.procs.append(proc)
+        return proc
+
+    async def _wait_http(self, url: str, timeout: float = 30.0) -> None:
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as client:
+            while time.monotonic() < deadline:
+                try:
+                    await client.get(url, timeout=1.0)
+                    return
+                except httpx.HTTPError:
+                    await asyncio.sleep(0.2)
+        raise RuntimeError(f"Service at {url} did not become ready within {timeout}s")
+
+    def _start_s3(self) -> None:
+        if not self.s3_endpoint:
+            try:
+                from moto.server import ThreadedMotoServer  # type: ignore
+            except ImportError:
+                raise SystemExit("moto[server] is required for the S3 stand-in (or pass --s3-endpoint)")
+            port = _free_port()
+            self.moto_server = ThreadedMotoServer(ip_address="127.0.0.1", port=port)
+            self.moto_server.start()
+            self.s3_endpoint = f"http://127.0.0.1:{port}"
+
+        import boto3
+
+        client = boto3.client(
+            "s3",
+            endpoint_url=self.s3_endpoint,
+            aws_access_key_id="bench",
+            aws_secret_access_key="bench",
+            region_name="us-east-1",
+        )
+        try:
+            client.create_bucket(Bucket=BUCKET)
+        except Exception as e:
+            if "BucketAlready" not in str(e):
+                raise
+
+    async def start(self) -> None:
+        args = self.args
+        base_env = dict(os.environ)
+
+        openai_port = _free_port()
+        self._spawn(
+            [
+                sys.executable, "-m", "benchmarks.fake_openai",
+                "--port", str(openai_port),
+                "--ttft-ms", str(args.ttft_ms),
+                "--tokens-per-sec", str(args.tokens_per_sec),
+                "--reply-tokens", str(args.reply_tokens),
+            ],
+            base_env,
+        )
+        self._start_s3()
+
+        app_port = _free_port()
+        env = dict(base_env)
+        env.update({
+            "OPENAI_BASE_URL": f"http://127.0.0.1:{openai_port}/v1",
+            "OPENAI_API_KEY": "bench",
+            "OPENAI_MODEL": env.get("OPENAI_MODEL") or "fake-model",
+            "AWS_S3_BUCKET": BUCKET,
+            "AWS_S3_ENDPOINT_URL": self.s3_endpoint,
+            "AWS_ACCESS_KEY_ID": "bench",
+            "AWS_SECRET_ACCESS_KEY": "bench",
+            "AWS_REGION": "us-east-1",
+        })
+        shutil.copy(BACKEND_DIR / "context.txt", self.workdir / "context.txt")
+        self.app_proc = self._spawn(
+            [
+                sys.executable, "-m", "uvicorn", "app.main:app",
+                "--app-dir", str(BACKEND_DIR),
+                "--host", "127.0.0.1",
+                "--port", str(app_port),
+                "--workers", str(args.workers),
+                "--log-level", "warning",
+            ],
+            env,
+            cwd=self.workdir,
+        )
+        self.app_url = f"http://127.0.0.1:{app_port}"
+        await self._wait_http(f"http://127.0.0.1:{openai_port}/docs")
+        await self._wait_http(f"{self.app_url}/health")
+
+    def stop(self) -> None:
+        for proc in reversed(self.procs):
+            if proc.poll() is None:
+                os.killpg(proc.pid, signal.SIGTERM)
+        for proc in self.procs:
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                os.killpg(proc.pid, signal.SIGKILL)
+        if self.moto_server is not None:
+            self.moto_server.stop()
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+
+class LoadRunner:
+    """Drives a weighted mix of requests from concurrent virtual users."""
+
+    def __init__(self, base_url: str, deck: bytes, deck_name: str, mix: Dict[str, int], fallback_slide_url: str):
+        self.base_url = base_url
+        self.deck = deck
+        self.deck_name = deck_name
+        self.mix = mix
+        self.slide_urls: List[str] = [fallback_slide_url]
+        self.latencies: Dict[str, List[float]] = {name: [] for name in mix}
+        self.errors: Dict[str, int] = {name: 0 for name in mix}
+
+    async def upload(self, client: httpx.AsyncClient) -> None:
+        files = {"file": (self.deck_name, self.deck, "application/pdf")}
+        data = {"gradeLevel": "middle", "subject": "science", "studentLevel": "on-level",
+                "explanationStyle": "step-by-step", "studentPersona": "curious"}
+        resp = await client.post("/api/upload", files=files, data=data)
+        resp.raise_for_status()
+        urls = [s["s3_url"] for s in resp.json().get("slides", []) if s.get("s3_url")]
+        if urls:
+            self.slide_urls = urls
+
+    async def slide_change(self, client: httpx.AsyncClient) -> None:
+        idx = random.randrange(len(self.slide_urls))
+        resp = await client.post("/api/slide_change", json={"slide_index": idx, "slide_url": self.slide_urls[idx]})
+        resp.raise_for_status()
+
+    async def feedback(self, client: httpx.AsyncClient) -> None:
+        idx = random.randrange(len(self.slide_urls))
+        resp = await client.post("/api/feedback", json={
+            "teacher_text": "Photosynthesis turns light, water and carbon dioxide into sugar and oxygen.",
+            "slide_index": idx,
+            "slide_url": self.slide_urls[idx],
+        })
+        resp.raise_for_status()
+
+    async def _timed(self, name: str, client: httpx.AsyncClient) -> None:
+        start = time.perf_counter()
+        try:
+            await getattr(self, name)(client)
+        except Exception:
+            self.errors[name] += 1
+        finally:
+            self.latencies[name].append(time.perf_counter() - start)
+
+    async def _user(self, deadline: float, timeout: float) -> None:
+        names = list(self.mix)
+        weights = [self.mix[n] for n in names]
+        async with httpx.AsyncClient(base_url=self.base_url, timeout=timeout) as client:
+            while time.monotonic() < deadline:
+                await self._timed(random.choices(names, weights)[0], client)
+
+    async def run(self, users: int, duration: float, timeout: float) -> float:
+        deadline = time.monotonic() + duration
+        start = time.perf_counter()
+        await asyncio.gather(*(self._user(deadline, timeout) for _ in range(users)))
+        return time.perf_counter() - start
+
+
+def build_report(runner: LoadRunner, elapsed: float, memory: Dict[str, int], args) -> Dict:
+    endpoints = {}
+    total = 0
+    for name, values in runner.latencies.items():
+        total += len(values)
+        endpoints[name] = {
+            "requests": len(values),
+            "errors": runner.errors[name],
+            "throughput_rps": round(len(values) / elapsed, 3) if elapsed else 0.0,
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+            "max_ms": round(max(values) * 1000, 2) if values else 0.0,
+        }
+    return {
+        "config": {
+            "users": args.users,
+            "duration_s": args.duration,
+            "workers": args.workers,
+            "mix": runner.mix,
+            "ttft_ms": args.ttft_ms,
+            "tokens_per_sec": args.tokens_per_sec,
+            "reply_tokens": args.reply_tokens,
+        },
+        "elapsed_s": round(elapsed, 3),
+        "total_requests": total,
+        "throughput_rps": round(total / elapsed, 3) if elapsed else 0.0,
+        "endpoints": endpoints,
+        "memory": memory,
+    }
+
+
+def print_report(report: Dict) -> None:
+    print(f"\n{'endpoint':<14}{'reqs':>8}{'errs':>6}{'rps':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, row in report["endpoints"].items():
+        print(f"{name:<14}{row['requests']:>8}{row['errors']:>6}{row['throughput_rps']:>9}"
+              f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}")
+    mem = report["memory"]
+    print(f"\ntotal: {report['total_requests']} requests in {report['elapsed_s']}s "
+          f"({report['throughput_rps']} req/s)")
+    print(f"server RSS: start {mem['start_rss_mb']} MB, peak {mem['peak_rss_mb']} MB, end {mem['end_rss_mb']} MB")
+
+
+def parse_mix(value: str) -> Dict[str, int]:
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ("upload", "slide_change", "feedback"):
+            raise argparse.ArgumentTypeError(f"Unknown request type in mix: {name}")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+async def main_async(args) -> Dict:
+    if args.deck:
+        deck_path = Path(args.deck)
+        deck, deck_name = deck_path.read_bytes(), deck_path.name
+    else:
+        deck, deck_name = make_synthetic_pdf(args.pages), "bench.pdf"
+
+    services = Services(args)
+    try:
+        await services.start()
+        pid = services.app_proc.pid  # type: ignore[union-attr]
+        runner = LoadRunner(
+            services.app_url, deck, deck_name, args.mix,
+            fallback_slide_url=f"{services.s3_endpoint}/{BUCKET}/slides/placeholder.png",
+        )
+
+        # Warm up with one upload so the slide URLs exist before traffic starts
+        async with httpx.AsyncClient(base_url=services.app_url, timeout=args.timeout) as client:
+            try:
+                await runner.upload(client)
+            except Exception as e:
+                print(f"Warning: warm-up upload failed ({e}); using placeholder slide URLs")
+
+        peak = start_rss = _rss_bytes(pid)
+        stop = asyncio.Event()
+
+        async def sample_memory():
+            nonlocal peak
+            while not stop.is_set():
+                peak = max(peak, _rss_bytes(pid))
+                await asyncio.sleep(0.5)
+
+        sampler = asyncio.create_task(sample_memory())
+        elapsed = await runner.run(args.users, args.duration, args.timeout)
+        stop.set()
+        await sampler
+        end_rss = _rss_bytes(pid)
+        memory = {
+            "start_rss_mb": round(start_rss / 2**20, 1),
+            "peak_rss_mb": round(max(peak, end_rss) / 2**20, 1),
+            "end_rss_mb": round(end_rss / 2**20, 1),
+        }
+        return build_report(runner, elapsed, memory, args)
+    finally:
+        services.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=10, help="Concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="Test duration in seconds")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix("upload=1,slide_change=5,feedback=5"),
+                        help="Weighted request mix, e.g. upload=1,slide_change=5,feedback=5")
+    parser.add_argument("--deck", help="PDF/PPTX deck to upload (default: synthetic PDF)")
+    parser.add_argument("--pages", type=int, default=10, help="Pages in the synthetic deck")
+    parser.add_argument("--ttft-ms", type=float, default=300.0, help="Fake OpenAI time to first token")
+    parser.add_argument("--tokens-per-sec", type=float, default=60.0, help="Fake OpenAI streaming token rate")
+    parser.add_argument("--reply-tokens", type=int, default=40, help="Fake OpenAI reply length in tokens")
+    parser.add_argument("--s3-endpoint", help="Existing S3-compatible endpoint (default: start moto)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Per-request timeout in seconds")
+    parser.add_argument("--output", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    print_report(report)
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2))
+        print(f"Report written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,279 @@
+"""
+Offline batch replay of recorded lessons.
+
+Replays lesson transcripts (slides + teacher utterances) through the same
+conversation engine /api/feedback uses (workflow.stream_feedback, the model
+router and the scheduler), many lessons at once with bounded parallelism,
+and writes every reply with its latency and token usage to a JSONL file.
+Use it to check persona or prompt changes across many lessons, or to
+measure throughput against a real or fake (benchmarks.fake_openai) provider.
+
+Run from the backend directory:
+    python -m benchmarks.replay_lessons lessons/ --concurrency 16 --output replay.jsonl
+    python -m benchmarks.replay_lessons --profile profile.json
+
+Without lesson arguments the sample lessons in benchmarks/lessons are
+replayed (sharks.txt is the quick single-utterance smoke check).
+
+Lesson formats:
+    *.jsonl Session history log (histories/<id>.jsonl, see app.core.history_log):
+            slide records show a slide, user records are teacher utterances,
+            assistant records are the recorded replies (kept as "reference"), the
+            deck record is the deck outline; system records are ignored (the
+            profile decides the prompt).
+    *.txt   The same in the older "role:::content" line format.
+    *.json  {"name": ..., "profile": {...}, "deck_outline": [...],
+             "turns": [{"slide_url": ...}, {"teacher_text": ..., "reference": ...}]}
+            or a list of such lessons.
+
+Output: one JSON line per utterance with lesson, turn, teacher_text, reply,
+reference, latency_ms, ttft_ms, model, prompt/cached_prompt/completion tokens
+and error. A summary is printed at the end.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from benchmarks.load_test import percentile
+
+
+BACKEND_DIR = Path(__file__).parent.parent
+SAMPLE_LESSONS_DIR = Path(__file__).parent / "lessons"
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+
+class Lesson:
+    """A recorded lesson: profile, deck outline and turns in order."""
+
+    def __init__(self, name: str, turns: List[Dict[str, Any]], profile: Optional[dict] = None,
+                 deck_outline: Optional[List[str]] = None):
+        self.name = name
+        self.turns = turns
+        self.profile = profile
+        self.deck_outline = deck_outline or []
+
+    @property
+    def utterances(self) -> int:
+        return sum(1 for t in self.turns if "teacher_text" in t)
+
+
+def parse_history(path: Path) -> Lesson:
+    """Read a lesson from a session history (JSONL log or the older text format)."""
+    from app.core.history_log import iter_records, read_legacy_history
+
+    records = read_legacy_history(path) if path.suffix == ".txt" else iter_records(path)
+    turns: List[Dict[str, Any]] = []
+    outline: List[str] = []
+    for record in records:
+        role, content = record["role"], record.get("content")
+        if role == "slide":
+            turns.append({"slide_url": content})
+        elif role == "user":
+            turns.append({"teacher_text": content})
+        elif role == "assistant":
+            # Recorded reply to the preceding utterance
+            if turns and "teacher_text" in turns[-1] and "reference" not in turns[-1]:
+                turns[-1]["reference"] = content
+        elif role == "deck":
+            outline = content
+    return Lesson(path.stem, turns, deck_outline=outline)
+
+
+def parse_json(path: Path) -> List[Lesson]:
+    """Read one lesson or a list of lessons from a JSON file."""
+    data = json.loads(path.read_text())
+    items = data if isinstance(data, list) else [data]
+    lessons = []
+    for i, item in enumerate(items):
+        default_name = path.stem if len(items) == 1 else f"{path.stem}[{i}]"
+        lessons.append(Lesson(
+            item.get("name") or default_name,
+            item.get("turns", []),
+            profile=item.get("profile"),
+            deck_outline=item.get("deck_outline"),
+        ))
+    return lessons
+
+
+def load_lessons(paths: List[str]) -> List[Lesson]:
+    """Collect lessons from files and directories (*.jsonl, *.txt and *.json, sorted)."""
+    files: List[Path] = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            files.extend(sorted(f for f in p.rglob("*") if f.suffix in (".jsonl", ".txt", ".json")))
+        else:
+            files.append(p)
+    lessons: List[Lesson] = []
+    for f in files:
+        lessons.extend(parse_json(f) if f.suffix == ".json" else [parse_history(f)])
+    return lessons
+
+
+class Replayer:
+    """Replays lessons concurrently and streams per-turn results to a JSONL file."""
+
+    def __init__(self, output, concurrency: int, default_profile: dict):
+        from app.core.context_helper import render_system_prompt
+        from app.core.workflow_loader import load_workflow_module
+
+        self.wf = load_workflow_module()
+        if self.wf is None or not hasattr(self.wf, "stream_feedback"):
+            raise RuntimeError("workflow.stream_feedback is not available.")
+        self.render_system_prompt = render_system_prompt
+        self.output = output
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.default_profile = default_profile
+        self.results: List[Dict[str, Any]] = []
+
+    async def run(self, lessons: List[Lesson]) -> float:
+        start = time.perf_counter()
+        await asyncio.gather(*(self.replay(i, lesson) for i, lesson in enumerate(lessons)))
+        return time.perf_counter() - start
+
+    async def replay(self, index: int, lesson: Lesson) -> None:
+        async with self.semaphore:
+            session_id = f"replay-{index:05d}"
+            profile = lesson.profile or self.default_profile
+            system_prompt = self.render_system_prompt(profile)
+            await asyncio.to_thread(self.wf.begin_conversation, {}, session_id=session_id,
+                                    deck_outline=lesson.deck_outline)
+            turn = 0
+            for step in lesson.turns:
+                if "slide_url" in step:
+                    await asyncio.to_thread(self.wf.add_slide, step["slide_url"], session_id=session_id)
+                if "teacher_text" in step:
+                    turn += 1
+                    await self.replay_turn(lesson, turn, session_id, system_prompt, step)
+
+    async def replay_turn(self, lesson: Lesson, turn: int, session_id: str,
+                          system_prompt: str, step: Dict[str, Any]) -> None:
+        from app.core import tracing
+
+        result: Dict[str, Any] = {
+            "lesson": lesson.name,
+            "turn": turn,
+            "teacher_text": step["teacher_text"],
+            "reference": step.get("reference"),
+        }
+        parts: List[str] = []
+        ttft = None
+        start = time.perf_counter()
+        with tracing.span("replay.turn", lesson=lesson.name, turn=turn) as root:
+            try:
+                async for delta in self.wf.stream_feedback(
+                    step["teacher_text"], session_id=session_id, system_prompt=system_prompt
+                ):
+                    if ttft is None:
+                        ttft = time.perf_counter() - start
+                    parts.append(delta)
+                result["error"] = None
+            except Exception as e:
+                result["error"] = f"{type(e).__name__}: {e}"
+        result["reply"] = "".join(parts).strip()
+        result["latency_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        result["ttft_ms"] = round(ttft * 1000, 1) if ttft is not None else None
+        # Usage comes from the LLM span(s) of the turn
+        llm_spans = [s for s in root.finished_spans if s.name == "llm.stream"]
+        result["model"] = llm_spans[-1].attributes.get("model") if llm_spans else None
+        for key in ("prompt_tokens", "cached_prompt_tokens", "completion_tokens"):
+            result[key] = sum(s.attributes.get(key, 0) for s in llm_spans)
+        self.results.append(result)
+        self.output.write(json.dumps(result) + "\n")
+        self.output.flush()
+
+
+def build_report(results: List[Dict[str, Any]], lessons: int, elapsed: float) -> Dict[str, Any]:
+    ok = [r for r in results if r["error"] is None]
+    latencies = [r["latency_ms"] for r in ok]
+    ttfts = [r["ttft_ms"] for r in ok if r["ttft_ms"] is not None]
+    prompt = sum(r["prompt_tokens"] for r in results)
+    cached = sum(r["cached_prompt_tokens"] for r in results)
+    return {
+        "lessons": lessons,
+        "turns": len(results),
+        "errors": len(results) - len(ok),
+        "elapsed_s": round(elapsed, 2),
+        "turns_per_s": round(len(results) / elapsed, 2) if elapsed > 0 else 0.0,
+        "latency_p50_ms": percentile(latencies, 50),
+        "latency_p95_ms": percentile(latencies, 95),
+        "ttft_p50_ms": percentile(ttfts, 50),
+        "ttft_p95_ms": percentile(ttfts, 95),
+        "prompt_tokens": prompt,
+        "cached_prompt_tokens": cached,
+        "completion_tokens": sum(r["completion_tokens"] for r in results),
+        "prompt_cache_hit_ratio": round(cached / prompt, 3) if prompt else 0.0,
+    }
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    print(f"\n{report['lessons']} lessons, {report['turns']} turns ({report['errors']} errors) "
+          f"in {report['elapsed_s']}s ({report['turns_per_s']} turns/s)")
+    print(f"latency p50 {report['latency_p50_ms']} ms, p95 {report['latency_p95_ms']} ms; "
+          f"ttft p50 {report['ttft_p50_ms']} ms, p95 {report['ttft_p95_ms']} ms")
+    print(f"tokens: prompt {report['prompt_tokens']} (cached {report['cached_prompt_tokens']}, "
+          f"ratio {report['prompt_cache_hit_ratio']}), completion {report['completion_tokens']}")
+
+
+async def main_async(args, lessons: List[Lesson], default_profile: dict) -> Dict[str, Any]:
+    with open(args.output, "w") as output:
+        replayer = Replayer(output, args.concurrency, default_profile)
+        elapsed = await replayer.run(lessons)
+    return build_report(replayer.results, len(lessons), elapsed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("lessons", nargs="*", default=[str(SAMPLE_LESSONS_DIR)],
+                        help="Lesson files or directories (default: benchmarks/lessons)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Lessons replayed at once")
+    parser.add_argument("--profile", help="JSON student profile for lessons without one (default: template defaults)")
+    parser.add_argument("--model", help="Override OPENAI_MODEL")
+    parser.add_argument("--output", default="replay.jsonl", help="JSONL results file")
+    parser.add_argument("--summary", help="Also write the summary as JSON to this file")
+    args = parser.parse_args()
+
+    lessons = load_lessons(args.lessons)
+    if not lessons:
+        parser.error("no lessons found")
+    if args.profile:
+        default_profile = json.loads(Path(args.profile).read_text())
+    else:
+        from app.core.context_helper import PROMPT_DEFAULTS
+        default_profile = dict(PROMPT_DEFAULTS)
+    args.output = str(Path(args.output).resolve())
+
+    # Set before the engine is imported: the scheduler and tracing read these once
+    if args.model:
+        os.environ["OPENAI_MODEL"] = args.model
+    os.environ.setdefault("LLM_MAX_CONCURRENCY", str(args.concurrency))
+    os.environ.setdefault("TRACING_ENABLED", "0")
+    os.environ.setdefault("SPECULATION_ENABLED", "0")
+
+    # The workflow keeps histories relative to the working directory, so the
+    # replay runs in a scratch directory to leave the real sessions untouched
+    workdir = Path(tempfile.mkdtemp(prefix="snail-replay-"))
+    shutil.copy(BACKEND_DIR / "context.txt", workdir / "context.txt")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        report = asyncio.run(main_async(args, lessons, default_profile))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    print(f"Results written to {args.output}")
+    if args.summary:
+        Path(args.summary).write_text(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,183 @@
+import asyncio
+import math
 import os
-from openai import OpenAI
+import time
+from openai import APIConnectionError, AsyncOpenAI, OpenAI, RateLimitError
 from dotenv import load_dotenv
 
+from app.core import metrics, tracing
+from app.core.model_router import model_router
+from app.core.scheduler import Overloaded, estimate_tokens, scheduler
+
+# Provider 429s (after the scheduler's pause) and connection errors retried before a call gives up
+RATE_LIMIT_RETRIES = int(os.getenv("LLM_RATE_LIMIT_RETRIES", "3"))
+
+
+def _retry_after(error):
+    """Seconds the provider asked to wait in a 429 response, if it said."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def cached_prompt_tokens(usage):
+    """Prompt tokens served from the provider's prompt cache (0 if not reported)."""
+    details = getattr(usage, "prompt_tokens_details", None)
+    if isinstance(details, dict):
+        # Older client versions keep unknown usage fields as plain dicts
+        return details.get("cached_tokens") or 0
+    return getattr(details, "cached_tokens", None) or 0
+
+
+def _record_usage(model, usage, sp):
+    """Token metrics and span attributes of a completed call."""
+    cached = cached_prompt_tokens(usage)
+    sp.set_attribute("prompt_tokens", usage.prompt_tokens)
+    sp.set_attribute("cached_prompt_tokens", cached)
+    sp.set_attribute("completion_tokens", usage.completion_tokens)
+    metrics.LLM_TOKENS.labels(model=model, direction="prompt").observe(usage.prompt_tokens)
+    metrics.LLM_TOKENS.labels(model=model, direction="completion").observe(usage.completion_tokens)
+    metrics.LLM_PROMPT_TOKENS.labels(model=model, cache="hit").inc(cached)
+    metrics.LLM_PROMPT_TOKENS.labels(model=model, cache="miss").inc(max(usage.prompt_tokens - cached, 0))
+
+
 class Chatbot:
     def __init__(self):
         load_dotenv()
         self.client = OpenAI()
         self.model_version = os.getenv("OPENAI_MODEL")
+        self._async_client = None
 
-    def response(self, conversation, temperature=0.7, max_tokens=100):
+    @property
+    def async_client(self):
+        # Only created for callers of astream(). Retries are left to astream():
+        # a 429 pauses every session's calls through the scheduler instead
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(max_retries=0)
+        return self._async_client
+
+    def _messages(self, conversation):
         messages = []
         for role, message in conversation:
             messages.append({"role": role, "content": message})
-        response = self.client.chat.completions.create(
-            model       = self.model_version,
-            messages    = messages,
-            temperature = temperature,
-            max_tokens  = max_tokens,
-        )
-        return response.choices[0].message.content.strip()
\ No newline at end of file
+        return messages
+
+    def response(self, conversation, temperature=0.7, max_tokens=100):
+        messages = self._messages(conversation)
+        model = model_router.choose(conversation).model
+        start = time.perf_counter()
+        with metrics.LLM_IN_FLIGHT.track_inprogress(), tracing.span("llm.response", model=model) as sp:
+            try:
+                # Bounded by the router's deadline instead of the client's 10 minute default
+                response = self.client.with_options(timeout=model_router.deadline).chat.completions.create(
+                    model       = model,
+                    messages    = messages,
+                    temperature = temperature,
+                    max_tokens  = max_tokens,
+                )
+            except Exception:
+                metrics.record_error("llm")
+                raise
+            usage = getattr(response, "usage", None)
+            if usage is not None:
+                _record_usage(model, usage, sp)
+        metrics.LLM_TOTAL_SECONDS.labels(model=model).observe(time.perf_counter() - start)
+        return response.choices[0].message.content.strip()
+
+    async def astream(self, conversation, temperature=0.7, max_tokens=100, session_id=None):
+        """
+        Async variant of stream() for the event loop (WebSocket channel).
+        The model is picked per turn by the model router, and the call is
+        deadline-bounded and hedged when the first token is late.
+        Each call waits for a slot from the scheduler (fair across sessions,
+        within the provider's rate limits); a provider 429 before the first
+        token pauses the scheduler and the call is retried, and so is a
+        connection error.
+        Closing the generator early closes the provider stream as well.
+        """
+        messages = self._messages(conversation)
+        model = model_router.choose(conversation).model
+        tokens = estimate_tokens(messages, max_tokens)
+        seen = 0
+        for attempt in range(RATE_LIMIT_RETRIES + 1):
+            backoff = 0
+            async with scheduler.admit(session_id or "default", tokens) as slot:
+                try:
+                    async for delta in self._astream(messages, model, temperature, max_tokens, slot):
+                        seen += 1
+                        yield delta
+                    return
+                except RateLimitError as e:
+                    retry_after = _retry_after(e) or 2 ** attempt
+                    scheduler.rate_limited(retry_after)
+                    if seen or attempt == RATE_LIMIT_RETRIES:
+                        raise Overloaded("The model provider is rate limiting requests", math.ceil(retry_after)) from e
+                except APIConnectionError:
+                    # The client does not retry on its own (see async_client)
+                    if seen or attempt == RATE_LIMIT_RETRIES:
+                        raise
+                    backoff = 0.5 * 2 ** attempt
+            # Back off without holding the slot
+            await asyncio.sleep(backoff)
+
+    async def _astream(self, messages, model, temperature, max_tokens, slot):
+        start = time.perf_counter()
+        first_token = True
+        usage = None
+        seen = 0
+
+        def open_stream(model):
+            return self.async_client.chat.completions.create(
+                model          = model,
+                messages       = messages,
+                temperature    = temperature,
+                max_tokens     = max_tokens,
+                stream         = True,
+                stream_options = {"include_usage": True},
+            )
+
+        def admit_hedge():
+            # A hedged request is a second provider call: it needs its own slot and budget
+            hedge = scheduler.try_admit(slot.session_id, slot.reserved_tokens)
+            return None if hedge is None else (lambda: scheduler.release(hedge))
+
+        with metrics.LLM_IN_FLIGHT.track_inprogress(), tracing.span("llm.stream", activate=False, model=model) as sp:
+            chunks = model_router.stream(open_stream, model, admit_hedge=admit_hedge, max_tokens=max_tokens)
+            try:
+                async for chunk in chunks:
+                    if chunk.usage is not None:
+                        usage = chunk.usage
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if not delta:
+                        continue
+                    if first_token:
+                        ttft = time.perf_counter() - start
+                        metrics.LLM_TTFT_SECONDS.labels(model=model).observe(ttft)
+                        model_router.observe_ttft(model, ttft)
+                        sp.set_attribute("ttft_ms", round(ttft * 1000, 3))
+                        first_token = False
+                    seen += 1
+                    yield delta
+            except (asyncio.CancelledError, GeneratorExit):
+                # Superseded or abandoned: the rest of the completion is never generated
+                # (content deltas are roughly one token each)
+                sp.set_attribute("cancelled_after_tokens", seen)
+                metrics.LLM_TOKENS_SAVED.labels(model=model).inc(max(max_tokens - seen, 0))
+                raise
+            except Exception:
+                metrics.record_error("llm")
+                raise
+            finally:
+                await chunks.aclose()
+            if usage is not None:
+                slot.actual_tokens = usage.total_tokens
+                _record_usage(model, usage, sp)
+        metrics.LLM_TOTAL_SECONDS.labels(model=model).observe(time.perf_counter() - start)
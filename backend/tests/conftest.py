@@ -0,0 +1,10 @@
+"""
+Unit tests for the backend. Run from the backend directory:
+    python -m pytest -q tests
+"""
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
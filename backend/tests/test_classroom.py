@@ -0,0 +1,41 @@
+from app.core.classroom import ClassroomStore, select_hands
+
+STUDENTS = [{"name": "Ann"}, {"name": "Bo"}, {"name": "Cy"}, {"name": "Dee"}]
+
+
+def names(students):
+    return [s["name"] for s in students]
+
+
+def test_addressed_students_always_answer():
+    assert names(select_hands(STUDENTS, "Cy, and you Bo?", {}, hands=1)) == ["Bo", "Cy"]
+
+
+def test_names_match_whole_words_only():
+    # "Bob" and "Annual" do not address Bo or Ann
+    assert names(select_hands(STUDENTS, "Bob's annual report", {}, hands=0)) == names(STUDENTS)
+
+
+def test_no_limit_means_everyone():
+    assert names(select_hands(STUDENTS, "any questions?", {"Ann": 3}, hands=0)) == names(STUDENTS)
+    assert names(select_hands(STUDENTS, "any questions?", {}, hands=10)) == names(STUDENTS)
+
+
+def test_least_recently_heard_raise_their_hands():
+    last_spoke = {"Ann": 3, "Bo": 1, "Cy": 2}
+    # Dee never spoke, then Bo; returned in roster order
+    assert names(select_hands(STUDENTS, "any questions?", last_spoke, hands=2)) == ["Bo", "Dee"]
+
+
+def test_roster_order_breaks_ties():
+    assert names(select_hands(STUDENTS, "any questions?", {}, hands=2)) == ["Ann", "Bo"]
+
+
+def test_recorded_turns_rotate_the_hands(tmp_path):
+    store = ClassroomStore(tmp_path)
+    picked = []
+    for _ in range(3):
+        hands = select_hands(STUDENTS, "next?", store.last_spoke("s"), hands=2)
+        store.record_turn("s", names(hands))
+        picked.append(names(hands))
+    assert picked == [["Ann", "Bo"], ["Cy", "Dee"], ["Ann", "Bo"]]
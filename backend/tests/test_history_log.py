@@ -0,0 +1,102 @@
+import os
+
+from app.core.history_log import ENTRY, HistoryLog, read_legacy_history
+
+
+def turn(i):
+    return [{"role": "user", "content": f"q{i}"}, {"role": "assistant", "content": f"a{i}"}]
+
+
+def new_log(tmp_path, *records):
+    log = HistoryLog(tmp_path / "history.jsonl")
+    log.reset([{"role": "system", "content": "prompt"}, {"role": "deck", "content": ["s1", "s2"]}])
+    for batch in records:
+        log.append(batch)
+    return log
+
+
+def test_round_trip_keeps_newlines_in_replies(tmp_path):
+    log = new_log(tmp_path, [{"role": "assistant", "content": "line one\nline two"}])
+    assert log.read_all()[-1]["content"] == "line one\nline two"
+
+
+def test_missing_log_reads_empty(tmp_path):
+    assert HistoryLog(tmp_path / "none.jsonl").read_window() == ([], [])
+
+
+def test_torn_last_record_is_truncated(tmp_path):
+    log = new_log(tmp_path, turn(1))
+    size = os.path.getsize(log.path)
+    with open(log.path, "ab") as f:
+        f.write(b'{"role":"user","content":"half a rec')
+    assert [r["content"] for r in log.read_all()[2:]] == ["q1", "a1"]
+    assert os.path.getsize(log.path) == size
+    # The repaired log accepts appends again
+    log.append(turn(2))
+    assert [r["content"] for r in log.read_all()[2:]] == ["q1", "a1", "q2", "a2"]
+
+
+def test_index_behind_the_log_is_rebuilt(tmp_path):
+    log = new_log(tmp_path, turn(1), turn(2))
+    # Crash after the log write but before the index write
+    with open(log.index_path, "r+b") as idx:
+        idx.truncate(3 * ENTRY.size)
+    assert [r["content"] for r in log.read_all()[2:]] == ["q1", "a1", "q2", "a2"]
+    assert os.path.getsize(log.index_path) == 6 * ENTRY.size
+
+
+def test_missing_index_is_rebuilt(tmp_path):
+    log = new_log(tmp_path, turn(1))
+    log.index_path.unlink()
+    header, window = log.read_window()
+    assert [r["role"] for r in header] == ["system", "deck"]
+    assert [r["content"] for r in window] == ["q1", "a1"]
+
+
+def test_window_returns_header_and_latest_records(tmp_path):
+    log = new_log(tmp_path, *[turn(i) for i in range(10)])
+    header, window = log.read_window(max_records=4)
+    assert [r["role"] for r in header] == ["system", "deck"]
+    assert 4 <= len(window) < 4 + 2
+    assert window[-1]["content"] == "a9"
+
+
+def test_window_start_advances_in_steps(tmp_path):
+    log = new_log(tmp_path, *[turn(i) for i in range(5)])
+    starts = []
+    for i in range(5, 9):
+        log.append(turn(i))
+        starts.append(log.read_window(max_records=8)[1][0]["content"])
+    # With a window of 8 the start moves by 4 records (two turns) at a time
+    assert starts == ["q2", "q4", "q4", "q6"]
+
+
+def test_window_keeps_the_slide_on_screen(tmp_path):
+    slide = [{"role": "slide", "content": "/slides/1.png"}]
+    log = new_log(tmp_path, slide, *[turn(i) for i in range(10)])
+    window = log.read_window(max_records=4)[1]
+    assert window[0] == slide[0]
+    assert window[-1]["content"] == "a9"
+
+
+def test_legacy_history_keeps_multiline_replies(tmp_path):
+    legacy = tmp_path / "history.txt"
+    legacy.write_text(
+        'system:::prompt\ndeck:::["s1"]\nuser:::hi\nassistant:::one\n\ntwo\n'
+    )
+    assert read_legacy_history(legacy) == [
+        {"role": "system", "content": "prompt"},
+        {"role": "deck", "content": ["s1"]},
+        {"role": "user", "content": "hi"},
+        {"role": "assistant", "content": "one\n\ntwo"},
+    ]
+
+
+def test_legacy_history_skips_malformed_deck_lines(tmp_path):
+    legacy = tmp_path / "history.txt"
+    legacy.write_text('system:::prompt\ndeck:::["s1",\n  "s2"]\nuser:::hi\nassistant:::hello\n')
+    assert read_legacy_history(legacy) == [
+        {"role": "system", "content": "prompt"},
+        {"role": "user", "content": "hi"},
+        {"role": "assistant", "content": "hello"},
+    ]
@@ -0,0 +1,110 @@
+import asyncio
+
+import pytest
+
+from app.core import metrics
+from app.core.inflight import InflightReplies, Superseded
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_run_returns_the_reply():
+    async def main():
+        replies = InflightReplies()
+
+        async def reply():
+            return "hello"
+        return await replies.run("s", reply())
+
+    assert run(main()) == "hello"
+
+
+def test_supersede_cancels_the_running_reply():
+    async def main():
+        replies = InflightReplies()
+        started = asyncio.Event()
+        cancelled = []
+
+        async def reply():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        waiter = asyncio.ensure_future(replies.run("s", reply()))
+        await started.wait()
+        before = metrics.LLM_SUPERSEDED.labels(reason="slide_change").value
+        assert replies.supersede("s", "slide_change")
+        with pytest.raises(Superseded):
+            await waiter
+        assert cancelled == [True]
+        assert metrics.LLM_SUPERSEDED.labels(reason="slide_change").value == before + 1
+        # Nothing left to supersede
+        assert not replies.supersede("s", "slide_change")
+
+    run(main())
+
+
+def test_a_new_reply_replaces_the_old_one():
+    async def main():
+        replies = InflightReplies()
+
+        async def reply(text, delay):
+            await asyncio.sleep(delay)
+            return text
+
+        old = asyncio.ensure_future(replies.run("s", reply("old", 10)))
+        await asyncio.sleep(0)
+        new = await replies.run("s", reply("new", 0))
+        with pytest.raises(Superseded):
+            await old
+        return new
+
+    assert run(main()) == "new"
+
+
+def test_sessions_do_not_supersede_each_other():
+    async def main():
+        replies = InflightReplies()
+
+        async def reply(text):
+            await asyncio.sleep(0.01)
+            return text
+        return await asyncio.gather(replies.run("a", reply("a")), replies.run("b", reply("b")))
+
+    assert run(main()) == ["a", "b"]
+
+
+def test_finished_replies_are_forgotten():
+    async def main():
+        replies = InflightReplies()
+
+        async def reply():
+            return "done"
+
+        async def failing():
+            raise RuntimeError("provider down")
+
+        await replies.run("a", reply())
+        with pytest.raises(RuntimeError):
+            await replies.run("b", failing())
+        # Done callbacks run on the next loop iteration
+        await asyncio.sleep(0)
+        return replies._tasks
+
+    assert run(main()) == {}
+
+
+def test_cancellation_by_the_caller_is_not_superseded():
+    async def main():
+        replies = InflightReplies()
+        task = replies.start("s", asyncio.sleep(10))
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await replies.result(task)
+
+    run(main())
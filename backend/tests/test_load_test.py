@@ -0,0 +1,19 @@
+import pytest
+
+from benchmarks.load_test import percentile
+
+
+def test_percentile_of_empty_list_is_zero():
+    assert percentile([], 95) == 0.0
+
+
+@pytest.mark.parametrize("pct, expected", [(50, 10), (90, 18), (95, 19), (99, 20), (100, 20)])
+def test_percentile_is_nearest_rank(pct, expected):
+    # ceil(pct/100 * n)-th smallest value of 1..20
+    assert percentile(list(range(20, 0, -1)), pct) == expected
+
+
+def test_percentile_clamps_to_the_sample():
+    values = [3.0, 1.0, 2.0]
+    assert percentile(values, 0) == 1.0
+    assert percentile(values, 150) == 3.0
@@ -0,0 +1,46 @@
+from app.core.metrics import Registry
+
+
+def test_render_golden():
+    registry = Registry()
+    requests = registry.counter("app_requests", "Requests by route", labelnames=("route",))
+    requests.labels(route="/b").inc()
+    requests.labels(route='/a "quoted" \\ path\nnext').inc(2)
+    registry.gauge("app_open_total_connections", "Open connections").set(1.5)
+    latency = registry.histogram("app_latency_seconds", "Latency", labelnames=("model",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.labels(model="m").observe(value)
+
+    assert registry.render() == (
+        "# HELP app_requests Requests by route\n"
+        "# TYPE app_requests counter\n"
+        'app_requests_total{route="/a \\"quoted\\" \\\\ path\\nnext"} 2\n'
+        'app_requests_total{route="/b"} 1\n'
+        "# HELP app_open_total_connections Open connections\n"
+        "# TYPE app_open_total_connections gauge\n"
+        "app_open_total_connections 1.5\n"
+        "# HELP app_latency_seconds Latency\n"
+        "# TYPE app_latency_seconds histogram\n"
+        'app_latency_seconds_bucket{model="m",le="0.1"} 2\n'
+        'app_latency_seconds_bucket{model="m",le="1"} 3\n'
+        'app_latency_seconds_bucket{model="m",le="+Inf"} 4\n'
+        'app_latency_seconds_sum{model="m"} 3.65\n'
+        'app_latency_seconds_count{model="m"} 4\n'
+    )
+
+
+def test_counter_name_ending_in_total_is_not_suffixed_twice():
+    registry = Registry()
+    registry.counter("app_errors_total", "Errors").inc()
+    assert "app_errors_total 1\n" in registry.render()
+
+
+def test_histogram_without_observations():
+    registry = Registry()
+    registry.histogram("app_wait_seconds", "Wait", buckets=(1.0,))
+    assert registry.render().splitlines()[2:] == [
+        'app_wait_seconds_bucket{le="1"} 0',
+        'app_wait_seconds_bucket{le="+Inf"} 0',
+        "app_wait_seconds_sum 0",
+        "app_wait_seconds_count 0",
+    ]
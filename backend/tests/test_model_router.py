@@ -0,0 +1,190 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.core import metrics
+from app.core.model_router import MIN_SAMPLES, DeadlineExceeded, ModelRouter
+
+
+def chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))], usage=None)
+
+
+class FakeStream:
+    """Provider stream yielding one chunk per delay, each after sleeping that long."""
+
+    def __init__(self, name, delays):
+        self.name = name
+        self.delays = list(delays)
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.delays:
+            raise StopAsyncIteration
+        await asyncio.sleep(self.delays.pop(0))
+        return chunk(self.name)
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeProvider:
+    """open_stream returning scripted streams: the first call gets the first script."""
+
+    def __init__(self, *scripts):
+        self.scripts = list(scripts)
+        self.streams = []
+
+    async def open_stream(self, model):
+        stream = FakeStream(f"s{len(self.streams)}", self.scripts[len(self.streams)])
+        self.streams.append(stream)
+        return stream
+
+
+class Admission:
+    """admit_hedge hook granting or refusing one slot, recording its release."""
+
+    def __init__(self, grant=True):
+        self.grant = grant
+        self.asked = 0
+        self.released = 0
+
+    def __call__(self):
+        self.asked += 1
+        if not self.grant:
+            return None
+        return self.release
+
+    def release(self):
+        self.released += 1
+
+
+def make_router(deadline=5.0, hedge_after=0.05):
+    router = ModelRouter()
+    router.deadline = deadline
+    router.hedge_enabled = True
+    router.hedge_after = hedge_after
+    router.hedge_min = 0.01
+    return router
+
+
+def collect(router, provider, admit=None, max_tokens=100):
+    async def main():
+        stream = router.stream(provider.open_stream, "m", admit_hedge=admit, max_tokens=max_tokens)
+        return [c.choices[0].delta.content async for c in stream]
+    return asyncio.run(main())
+
+
+def hedges(outcome):
+    return metrics.LLM_HEDGES.labels(outcome=outcome).value
+
+
+def saved():
+    return metrics.LLM_TOKENS_SAVED.labels(model="m").value
+
+
+def test_choose_uses_the_strong_model_without_a_fast_one(monkeypatch):
+    monkeypatch.setenv("OPENAI_MODEL", "strong")
+    monkeypatch.delenv("OPENAI_FAST_MODEL", raising=False)
+    route = ModelRouter().choose([("user", "hi")])
+    assert (route.model, route.reason) == ("strong", "default")
+
+
+def test_choose_routes_by_slide_and_turn_length(monkeypatch):
+    monkeypatch.setenv("OPENAI_MODEL", "strong")
+    monkeypatch.setenv("OPENAI_FAST_MODEL", "fast")
+    router = ModelRouter()
+    router.fast_max_words = 3
+    slide = ("user", [{"type": "image_url"}])
+    assert router.choose([slide, ("user", "hi")]).reason == "new_slide"
+    assert router.choose([slide, ("assistant", "ok"), ("user", "one two three four")]).reason == "long_turn"
+    route = router.choose([slide, ("assistant", "ok"), ("user", "hi")])
+    assert (route.model, route.reason) == ("fast", "short_turn")
+
+
+def test_hedge_delay_is_the_recent_p95():
+    router = make_router(hedge_after=2.0)
+    for i in range(MIN_SAMPLES - 1):
+        router.observe_ttft("m", 0.01 * (i + 1))
+    # Too few samples: the configured delay
+    assert router.hedge_delay("m") == 2.0
+    router.observe_ttft("m", 0.2)
+    assert router.hedge_delay("m") == pytest.approx(0.19)
+
+
+def test_hedge_delay_has_a_lower_bound():
+    router = make_router()
+    router.hedge_min = 0.3
+    for _ in range(MIN_SAMPLES):
+        router.observe_ttft("m", 0.001)
+    assert router.hedge_delay("m") == 0.3
+
+
+def test_stream_without_a_hedge_hook_never_hedges():
+    provider = FakeProvider([0.1, 0])
+    assert collect(make_router(hedge_after=0.01), provider) == ["s0", "s0"]
+    assert len(provider.streams) == 1 and provider.streams[0].closed
+
+
+def test_first_token_deadline():
+    provider = FakeProvider([1.0])
+    with pytest.raises(DeadlineExceeded):
+        collect(make_router(deadline=0.05), provider)
+    assert provider.streams[0].closed
+
+
+def test_deadline_applies_to_the_whole_stream():
+    provider = FakeProvider([0, 0, 1.0])
+    with pytest.raises(DeadlineExceeded):
+        collect(make_router(deadline=0.1), provider)
+    assert provider.streams[0].closed
+
+
+def test_hedge_is_skipped_when_admission_refuses():
+    provider = FakeProvider([0.1, 0], [0])
+    admit = Admission(grant=False)
+    skipped = hedges("skipped")
+    assert collect(make_router(hedge_after=0.02), provider, admit) == ["s0", "s0"]
+    assert admit.asked == 1
+    assert len(provider.streams) == 1
+    assert hedges("skipped") == skipped + 1
+
+
+def test_hedge_wins_and_the_primary_is_cancelled():
+    provider = FakeProvider([1.0], [0, 0])
+    admit = Admission()
+    won, tokens_saved = hedges("won"), saved()
+    assert collect(make_router(hedge_after=0.02), provider, admit, max_tokens=100) == ["s1", "s1"]
+    primary, hedge = provider.streams
+    assert primary.closed and hedge.closed
+    assert hedges("won") == won + 1
+    # The primary is cancelled before its first token
+    assert saved() == tokens_saved + 100
+    # The hedge's slot is held until its stream ends, then released once
+    assert admit.released == 1
+
+
+def test_hedge_loses_and_its_slot_is_released():
+    provider = FakeProvider([0.06, 0], [1.0])
+    admit = Admission()
+    lost, tokens_saved = hedges("lost"), saved()
+
+    async def main():
+        router = make_router(hedge_after=0.02)
+        stream = router.stream(provider.open_stream, "m", admit_hedge=admit, max_tokens=100)
+        first = await stream.__anext__()
+        # Released as soon as the race is decided, not when the reply ends
+        released_early = admit.released
+        rest = [c async for c in stream]
+        return [first, *rest], released_early
+
+    chunks, released_early = asyncio.run(main())
+    assert [c.choices[0].delta.content for c in chunks] == ["s0", "s0"]
+    assert released_early == 1 and admit.released == 1
+    assert provider.streams[1].closed
+    assert hedges("lost") == lost + 1
+    assert saved() == tokens_saved + 100
@@ -0,0 +1,158 @@
+import asyncio
+import time
+
+import pytest
+
+from app.core.scheduler import LLMScheduler, Overloaded, TokenBucket, estimate_tokens
+
+
+def make_scheduler(concurrency=1, max_queue=64, timeout=5.0, rpm=0, tpm=0):
+    scheduler = LLMScheduler()
+    scheduler.max_concurrency = concurrency
+    scheduler.max_queue = max_queue
+    scheduler.queue_timeout = timeout
+    scheduler.requests = TokenBucket(rpm)
+    scheduler.tokens = TokenBucket(tpm)
+    return scheduler
+
+
+def test_unlimited_bucket_never_waits():
+    bucket = TokenBucket(0)
+    bucket.take(10 ** 6)
+    assert bucket.unlimited and bucket.wait_time(10 ** 6) == 0.0
+
+
+def test_bucket_wait_time_follows_the_refill_rate():
+    bucket = TokenBucket(60)  # one token per second
+    assert bucket.wait_time(60) == 0.0
+    bucket.take(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0, abs=0.05)
+    bucket.give(30)
+    assert bucket.wait_time(30) == 0.0
+    # Amounts above capacity wait for a full bucket rather than forever
+    assert bucket.wait_time(1000) == pytest.approx(30.0, abs=0.05)
+
+
+def test_bucket_refills_up_to_capacity():
+    bucket = TokenBucket(60)
+    bucket.updated = time.monotonic() - 3600
+    bucket.give(0)
+    assert bucket.tokens == 60
+
+
+def test_waiters_are_served_round_robin_across_sessions():
+    scheduler = make_scheduler(concurrency=1)
+    order = []
+
+    async def call(session_id, name):
+        async with scheduler.admit(session_id, 10):
+            order.append(name)
+            await asyncio.sleep(0)
+
+    async def scenario():
+        async with scheduler.admit("x", 10):
+            tasks = [asyncio.create_task(call(s, n)) for s, n in
+                     [("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1")]]
+            await asyncio.sleep(0)
+            assert scheduler.waiting == 4
+            assert [w.slot.session_id for w in scheduler._fair_order()] == ["a", "b", "a", "a"]
+        await asyncio.gather(*tasks)
+
+    asyncio.run(scenario())
+    assert order == ["a1", "b1", "a2", "a3"]
+    assert scheduler.active == 0
+
+
+def test_full_queue_rejects_with_retry_after():
+    scheduler = make_scheduler(concurrency=1, max_queue=1)
+
+    async def scenario():
+        async with scheduler.admit("a", 10):
+            waiting = asyncio.create_task(scheduler.admit("a", 10).__aenter__())
+            await asyncio.sleep(0)
+            with pytest.raises(Overloaded) as e:
+                await scheduler.admit("b", 10).__aenter__()
+            assert e.value.retry_after >= 1
+            waiting.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_queue_timeout_raises_overloaded():
+    scheduler = make_scheduler(concurrency=1, timeout=0.01)
+
+    async def scenario():
+        async with scheduler.admit("a", 10):
+            with pytest.raises(Overloaded):
+                async with scheduler.admit("b", 10):
+                    pass
+        assert scheduler.waiting == 0
+
+    asyncio.run(scenario())
+
+
+def test_token_budget_delays_admission():
+    scheduler = make_scheduler(concurrency=4, tpm=60 * 50)  # 50 tokens per second
+
+    async def scenario():
+        async with scheduler.admit("a", 60 * 50):
+            pass
+        start = time.monotonic()
+        async with scheduler.admit("b", 5):
+            return time.monotonic() - start
+
+    assert asyncio.run(scenario()) >= 0.05
+
+
+def test_actual_usage_settles_the_estimate():
+    scheduler = make_scheduler(tpm=6000)
+
+    async def scenario():
+        async with scheduler.admit("a", 1000) as slot:
+            slot.actual_tokens = 200
+
+    asyncio.run(scenario())
+    assert scheduler.tokens.tokens == pytest.approx(5800, abs=5)
+
+
+def test_try_admit_takes_a_slot_of_its_own():
+    scheduler = make_scheduler(concurrency=2, tpm=6000)
+
+    async def scenario():
+        async with scheduler.admit("a", 1000):
+            hedge = scheduler.try_admit("a", 1000)
+            assert hedge is not None and scheduler.active == 2
+            assert scheduler.tokens.tokens == pytest.approx(4000, abs=5)
+            # Both slots are taken now
+            assert scheduler.try_admit("a", 1000) is None
+            scheduler.release(hedge)
+            assert scheduler.active == 1
+
+    asyncio.run(scenario())
+
+
+def test_try_admit_is_refused_while_paused_or_queued():
+    scheduler = make_scheduler(concurrency=1)
+
+    async def scenario():
+        scheduler.rate_limited(0.5)
+        assert scheduler.try_admit("a", 10) is None
+        scheduler.paused_until = 0.0
+        async with scheduler.admit("a", 10):
+            waiting = asyncio.create_task(scheduler.admit("b", 10).__aenter__())
+            await asyncio.sleep(0)
+            scheduler.max_concurrency = 2
+            # A free slot, but another call is waiting for it
+            assert scheduler.try_admit("a", 10) is None
+            waiting.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_estimate_tokens_counts_text_and_images():
+    messages = [
+        {"role": "system", "content": "x" * 400},
+        {"role": "user", "content": [{"type": "text", "text": "y" * 40},
+                                     {"type": "image_url", "image_url": {"url": "data:"}}]},
+    ]
+    assert estimate_tokens(messages, max_tokens=100) == 100 + 104 + 10 + 765
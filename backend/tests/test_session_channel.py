@@ -0,0 +1,130 @@
+import asyncio
+
+from app.core.session_channel import CLOSE_REPLACED, ChannelRegistry, SessionChannel
+
+
+class FakeWebSocket:
+    def __init__(self, fail=False):
+        self.sent = []
+        self.closed_with = None
+        self.fail = fail
+
+    async def send_json(self, event):
+        if self.fail:
+            raise RuntimeError("connection closed")
+        self.sent.append(event)
+
+    async def close(self, code=1000):
+        self.closed_with = code
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def emit_durable(channel, count):
+    async def emit():
+        for i in range(count):
+            await channel.emit("reply", text=str(i))
+    run(emit())
+
+
+def test_transient_events_have_no_sequence_number():
+    channel = SessionChannel("s")
+    assert run(channel.emit("delta", durable=False, text="a")) is None
+    assert run(channel.emit("reply", text="a")) == 1
+
+
+def test_fresh_client_gets_welcome_without_replay():
+    channel = SessionChannel("s")
+    emit_durable(channel, 3)
+    ws = FakeWebSocket()
+    run(channel.attach(ws))
+    assert ws.sent == [{"type": "welcome", "session_id": "s", "seq": 3, "gap": False}]
+
+
+def test_resume_replays_missed_events():
+    channel = SessionChannel("s")
+    emit_durable(channel, 5)
+    ws = FakeWebSocket()
+    run(channel.attach(ws, last_seq=3))
+    assert ws.sent[0]["gap"] is False
+    assert [event["seq"] for event in ws.sent[1:]] == [4, 5]
+
+
+def test_up_to_date_client_gets_nothing_to_replay():
+    channel = SessionChannel("s")
+    emit_durable(channel, 2)
+    ws = FakeWebSocket()
+    run(channel.attach(ws, last_seq=2))
+    assert len(ws.sent) == 1 and ws.sent[0]["gap"] is False
+
+
+def test_events_older_than_the_buffer_are_a_gap():
+    channel = SessionChannel("s", buffer_size=3)
+    emit_durable(channel, 6)
+    ws = FakeWebSocket()
+    run(channel.attach(ws, last_seq=1))
+    assert ws.sent[0]["gap"] is True
+    # What is still buffered is replayed anyway
+    assert [event["seq"] for event in ws.sent[1:]] == [4, 5, 6]
+
+
+def test_sequence_ahead_of_the_channel_is_a_gap():
+    channel = SessionChannel("s")
+    emit_durable(channel, 2)
+    ws = FakeWebSocket()
+    run(channel.attach(ws, last_seq=10))
+    assert ws.sent == [{"type": "welcome", "session_id": "s", "seq": 2, "gap": True}]
+
+
+def test_new_connection_replaces_the_old_one():
+    channel = SessionChannel("s")
+    old, new = FakeWebSocket(), FakeWebSocket()
+    run(channel.attach(old))
+    run(channel.attach(new))
+    assert old.closed_with == CLOSE_REPLACED
+    run(channel.emit("reply", text="x"))
+    assert new.sent[-1]["type"] == "reply"
+    assert all(event["type"] == "welcome" for event in old.sent)
+    # A late detach of the replaced connection keeps the new one
+    channel.detach(old)
+    assert channel.connected
+
+
+def test_failed_send_detaches_and_event_is_replayed():
+    channel = SessionChannel("s")
+    dropped = FakeWebSocket()
+    run(channel.attach(dropped))
+    dropped.fail = True
+    assert run(channel.emit("reply", text="lost")) == 1
+    assert not channel.connected
+    ws = FakeWebSocket()
+    run(channel.attach(ws, last_seq=0))
+    assert [event.get("text") for event in ws.sent[1:]] == ["lost"]
+
+
+def test_registry_prunes_idle_disconnected_channels():
+    registry = ChannelRegistry(idle_seconds=0)
+    first = registry.get("s")
+    assert registry.get("s") is not first
+    registry = ChannelRegistry(idle_seconds=60)
+    assert registry.get("s") is registry.get("s")
+
+
+def test_ordered_tasks_run_one_after_another():
+    order = []
+
+    async def step(name, delay):
+        order.append(f"{name} start")
+        await asyncio.sleep(delay)
+        order.append(f"{name} end")
+
+    async def scenario():
+        channel = SessionChannel("s")
+        channel.spawn_ordered(step("slide", 0.02))
+        last = channel.spawn_ordered(step("utterance", 0))
+        await last
+
+    run(scenario())
+    assert order == ["slide start", "slide end", "utterance start", "utterance end"]
@@ -0,0 +1,55 @@
+import asyncio
+import os
+
+from app.core import context_helper, metrics
+from app.core import settings_store as settings_store_module
+from app.core.settings_store import SettingsStore
+
+
+def use_template(monkeypatch, tmp_path, text):
+    path = tmp_path / "context.txt"
+    path.write_text(text)
+    monkeypatch.setattr(settings_store_module, "CONTEXT_PATH", path)
+    monkeypatch.setattr(context_helper, "CONTEXT_PATH", path)
+    return path
+
+
+def prompt_cache(result):
+    return metrics.CACHE_REQUESTS.labels(cache="system_prompt", result=result).value
+
+
+def test_prompt_is_cached_until_the_template_changes(monkeypatch, tmp_path):
+    template = use_template(monkeypatch, tmp_path, "A <persona> student")
+    store = SettingsStore(tmp_path / "data")
+    assert store.system_prompt("s") == "A curious student"
+    hits = prompt_cache("hit")
+    assert store.system_prompt("s") == "A curious student"
+    assert prompt_cache("hit") == hits + 1
+
+    template.write_text("An eager <persona> student")
+    mtime = os.stat(template).st_mtime
+    os.utime(template, (mtime + 10, mtime + 10))
+    assert store.system_prompt("s") == "An eager curious student"
+
+
+def test_missing_template_falls_back_and_is_picked_up(monkeypatch, tmp_path):
+    template = use_template(monkeypatch, tmp_path, "")
+    template.unlink()
+    store = SettingsStore(tmp_path / "data")
+    assert store.system_prompt("s") == context_helper.DEFAULT_SYSTEM_PROMPT
+    template.write_text("A <persona> student")
+    assert store.system_prompt("s") == "A curious student"
+
+
+def test_profile_change_invalidates_the_prompt(monkeypatch, tmp_path):
+    use_template(monkeypatch, tmp_path, "A <persona> student")
+    store = SettingsStore(tmp_path / "data")
+
+    async def main():
+        assert store.system_prompt("s") == "A curious student"
+        await store.set("s", {"student_persona": "shy"})
+        assert store.system_prompt("s") == "A shy student"
+        await store.flush()
+
+    asyncio.run(main())
+    assert (tmp_path / "data" / "settings" / "s.json").exists()
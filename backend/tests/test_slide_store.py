@@ -0,0 +1,192 @@
+import asyncio
+import sqlite3
+
+from PIL import Image
+
+from app.core import slide_store as slide_store_module
+from app.core.slide_store import LEASE_SECONDS, SlideOutbox, SlideStore, _InlineCache
+
+
+class FakeUploader:
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.uploaded = []
+        self.cleared = []
+
+    def upload_file(self, path, key):
+        if self.fail:
+            raise ConnectionError("S3 unavailable")
+        self.uploaded.append(key)
+        return f"https://bucket.s3/{key}"
+
+    def clear_prefix(self, prefix):
+        if self.fail:
+            raise ConnectionError("S3 unavailable")
+        self.cleared.append(prefix)
+
+
+def make_store(tmp_path, uploader=None):
+    store = SlideStore(tmp_path)
+    store._uploader_factory = lambda: uploader
+    return store
+
+
+def make_slide(store, name="slide_000.png", namespace="ns"):
+    path = store.images_dir / namespace / name
+    path.parent.mkdir(parents=True, exist_ok=True)
+    Image.new("RGB", (64, 48), "white").save(path)
+    return path
+
+
+def row(outbox, key):
+    conn = sqlite3.connect(outbox.path)
+    try:
+        return conn.execute("SELECT attempts, next_attempt, url FROM outbox WHERE key = ?", (key,)).fetchone()
+    finally:
+        conn.close()
+
+
+def test_claimed_rows_are_leased_to_one_worker(tmp_path):
+    first = SlideOutbox(tmp_path / "outbox.sqlite3")
+    second = SlideOutbox(tmp_path / "outbox.sqlite3")
+    first.enqueue([("slides/ns/a.png", tmp_path / "a.png"), ("slides/ns/b.png", tmp_path / "b.png")])
+    assert len(first.claim(1, now=100.0)) == 1
+    # Another worker sharing the data dir only gets the unleased row
+    assert [key for key, _, _ in second.claim(10, now=100.0)] == ["slides/ns/b.png"]
+    assert second.claim(10, now=100.0) == []
+
+
+def test_lease_of_a_dead_worker_expires(tmp_path):
+    outbox = SlideOutbox(tmp_path / "outbox.sqlite3")
+    outbox.enqueue([("slides/ns/a.png", tmp_path / "a.png")])
+    assert len(outbox.claim(1, now=100.0)) == 1
+    # The worker died without marking the row: it is claimable once the lease runs out
+    assert outbox.claim(1, now=100.0 + LEASE_SECONDS - 1) == []
+    assert len(outbox.claim(1, now=100.0 + LEASE_SECONDS)) == 1
+
+
+def test_duplicate_enqueue_keeps_one_row(tmp_path):
+    store = make_store(tmp_path, FakeUploader())
+    path = make_slide(store)
+    assert store.enqueue([path]) == [None]
+    assert store.enqueue([path]) == [None]
+    assert store.outbox.pending() == 1
+    asyncio.run(store.sync_once())
+    # Already replicated: enqueueing again returns the S3 URL and uploads nothing
+    assert store.enqueue([path]) == ["https://bucket.s3/slides/ns/slide_000.png"]
+    assert store.outbox.pending() == 0
+    assert asyncio.run(store.sync_once()) == 0
+
+
+def test_failed_uploads_back_off_exponentially(tmp_path, monkeypatch):
+    store = make_store(tmp_path, FakeUploader(fail=True))
+    key = store.s3_key(make_slide(store))
+    store.enqueue([store.images_dir / "ns" / "slide_000.png"])
+    now = [1000.0]
+    monkeypatch.setattr(slide_store_module.time, "time", lambda: now[0])
+
+    asyncio.run(store.sync_once())
+    assert row(store.outbox, key)[:2] == (1, 1001.0)
+    # Not due yet
+    assert asyncio.run(store.sync_once()) == 0
+    now[0] = 1001.0
+    asyncio.run(store.sync_once())
+    assert row(store.outbox, key)[:2] == (2, 1003.0)
+
+
+def test_backoff_is_capped(tmp_path, monkeypatch):
+    store = make_store(tmp_path, FakeUploader(fail=True))
+    key = store.s3_key(make_slide(store))
+    store.enqueue([store.images_dir / "ns" / "slide_000.png"])
+    conn = sqlite3.connect(store.outbox.path)
+    conn.execute("UPDATE outbox SET attempts = 30")
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(slide_store_module.time, "time", lambda: 1000.0)
+    asyncio.run(store.sync_once())
+    assert row(store.outbox, key)[1] == 1000.0 + slide_store_module.MAX_BACKOFF_SECONDS
+
+
+def test_slides_removed_before_replication_are_dropped(tmp_path):
+    uploader = FakeUploader()
+    store = make_store(tmp_path, uploader)
+    path = make_slide(store)
+    store.enqueue([path])
+    path.unlink()
+    asyncio.run(store.sync_once())
+    assert uploader.uploaded == []
+    assert row(store.outbox, store.s3_key(path)) is None
+
+
+def test_resolve_inlines_until_replicated(tmp_path):
+    store = make_store(tmp_path, FakeUploader())
+    path = make_slide(store)
+    url = "/images/ns/slide_000.png"
+    store.enqueue([path])
+    assert store.resolve(url).startswith("data:image/jpeg;base64,")
+    asyncio.run(store.sync_once())
+    assert store.resolve(url) == "https://bucket.s3/slides/ns/slide_000.png"
+
+
+def test_resolve_leaves_other_urls_alone(tmp_path):
+    store = make_store(tmp_path)
+    urls = ["https://example.com/slide.png", "/images/ns/missing.png", "/images/../etc/passwd"]
+    assert store.resolve_all(urls) == {url: url for url in urls}
+
+
+def test_inline_cache_evicts_least_recently_used(monkeypatch):
+    inlined = []
+
+    def fake_inline(path):
+        inlined.append(str(path))
+        return "x" * 10
+
+    monkeypatch.setattr(slide_store_module, "inline_image", fake_inline)
+    cache = _InlineCache(max_bytes=25)
+    cache.get("a")
+    cache.get("b")
+    cache.get("a")  # a is now the most recently used
+    cache.get("c")  # 30 bytes: b is evicted
+    cache.get("a")
+    cache.get("b")
+    assert inlined == ["a", "b", "c", "b"]
+
+
+def test_inline_cache_skips_entries_larger_than_the_cache(monkeypatch):
+    monkeypatch.setattr(slide_store_module, "inline_image", lambda path: "x" * 100)
+    cache = _InlineCache(max_bytes=25)
+    cache.get("a")
+    assert cache._size == 0 and not cache._items
+
+
+def test_retired_namespaces_are_deleted_from_s3(tmp_path):
+    uploader = FakeUploader()
+    store = make_store(tmp_path, uploader)
+    store.enqueue([make_slide(store)])
+    store.retire_namespace("ns")
+    assert store.outbox.pending() == 0
+    asyncio.run(store.sync_once())
+    assert uploader.uploaded == []
+    assert uploader.cleared == ["slides/ns/"]
+    assert asyncio.run(store.sync_once()) == 0
+
+
+def test_failed_deletions_are_retried(tmp_path, monkeypatch):
+    uploader = FakeUploader(fail=True)
+    store = make_store(tmp_path, uploader)
+    store.retire_namespace("ns")
+    monkeypatch.setattr(slide_store_module.time, "time", lambda: 1000.0)
+    asyncio.run(store.sync_once())
+    assert store.outbox.claim_deletions(10, now=1000.0) == []
+    uploader.fail = False
+    monkeypatch.setattr(slide_store_module.time, "time", lambda: 1001.0)
+    asyncio.run(store.sync_once())
+    assert uploader.cleared == ["slides/ns/"]
+
+
+def test_without_s3_retired_namespaces_are_only_forgotten(tmp_path):
+    store = make_store(tmp_path)
+    store.enqueue([make_slide(store)])
+    store.retire_namespace("ns")
+    assert store.outbox.pending() == 0
+    assert store.outbox.claim_deletions(10, now=float("inf")) == []
@@ -0,0 +1,84 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from app.core import metrics, speculation
+from app.core.speculation import Speculator, similarity
+
+TEXT = "so what do you think the main idea of this slide is"
+
+
+@pytest.fixture
+def wf(tmp_path, monkeypatch):
+    monkeypatch.setattr(speculation, "SPECULATION_ENABLED", True)
+    monkeypatch.setattr(speculation, "STABLE_SECONDS", 0)
+    history = tmp_path / "history.jsonl"
+    history.write_text("{}\n")
+    drafts = []
+
+    async def draft_feedback(text, session_id=None, system_prompt=None):
+        drafts.append(text)
+        if text.startswith("fail"):
+            raise RuntimeError("provider down")
+        return f"reply to {text}"
+
+    return SimpleNamespace(history_file=lambda session_id: history, draft_feedback=draft_feedback,
+                           drafts=drafts, history=history)
+
+
+def speculate_then_take(wf, interim, final, between=None):
+    async def scenario():
+        speculator = Speculator()
+        speculator.interim(wf, "s", interim, "prompt")
+        await asyncio.sleep(0.01)
+        if between is not None:
+            between()
+        return await speculator.take(wf, "s", final)
+    return asyncio.run(scenario())
+
+
+def test_similarity_ignores_case_and_punctuation():
+    assert similarity("Hello, World!", "hello world") == 1.0
+    assert similarity("", "") == 1.0
+    assert similarity("one two three four", "five six seven eight") == 0.0
+    assert 0.5 < similarity("one two three four", "one two three five") < 1.0
+
+
+def test_matching_final_transcript_commits_the_speculation(wf):
+    assert speculate_then_take(wf, TEXT, TEXT.capitalize() + "?") == f"reply to {TEXT}"
+
+
+def test_different_final_transcript_is_not_committed(wf):
+    assert speculate_then_take(wf, TEXT, "never mind, let us move on to the next slide") is None
+
+
+def test_history_change_makes_the_speculation_stale(wf):
+    grow = lambda: wf.history.write_text("{}\n{}\n")
+    assert speculate_then_take(wf, TEXT, TEXT, between=grow) is None
+
+
+def test_failed_speculation_falls_back(wf):
+    failed = metrics.SPECULATIONS.labels(outcome="failed")
+    before = failed.value
+    text = "fail " + TEXT
+    assert speculate_then_take(wf, text, text) is None
+    assert failed.value == before + 1
+
+
+def test_short_transcripts_are_not_speculated(wf):
+    assert speculate_then_take(wf, "so what", "so what") is None
+    assert wf.drafts == []
+
+
+def test_take_without_speculation_returns_none(wf):
+    assert asyncio.run(Speculator().take(wf, "s", TEXT)) is None
+
+
+def test_unchanged_interim_is_ignored(wf):
+    async def scenario():
+        speculator = Speculator()
+        assert speculator.interim(wf, "s", TEXT, "prompt")
+        assert not speculator.interim(wf, "s", "  " + TEXT, "prompt")
+        speculator.discard("s")
+    asyncio.run(scenario())
@@ -0,0 +1,62 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from app.core.startup import StartupTimer, boot_id, prepare_data_dir
+
+BACKEND_DIR = Path(__file__).parent.parent
+PRINT_BOOT_ID = "from app.core.startup import boot_id; print(boot_id())"
+
+
+def worker_boot_id(env=None, **kwargs):
+    """boot_id() of a separate process, as seen by a worker the server spawned."""
+    result = subprocess.run(
+        [sys.executable, "-c", PRINT_BOOT_ID], cwd=BACKEND_DIR, env=env,
+        capture_output=True, text=True, check=True, **kwargs,
+    )
+    return result.stdout.strip()
+
+
+def without_boot_id():
+    env = dict(os.environ)
+    env.pop("SNAIL_BOOT_ID", None)
+    return env
+
+
+def test_explicit_boot_id_wins(monkeypatch):
+    monkeypatch.setenv("SNAIL_BOOT_ID", "deploy-42")
+    assert boot_id() == "deploy-42"
+    assert worker_boot_id(env=dict(os.environ)) == "deploy-42"
+
+
+def test_workers_of_one_launch_share_the_boot_id(monkeypatch):
+    monkeypatch.delenv("SNAIL_BOOT_ID", raising=False)
+    current = boot_id()
+    assert current.startswith(f"{os.getpgrp()}:")
+    assert boot_id() == current
+    # Child processes stay in the process group of the launch
+    assert worker_boot_id(env=without_boot_id()) == current
+
+
+def test_a_new_launch_gets_a_new_boot_id(monkeypatch):
+    monkeypatch.delenv("SNAIL_BOOT_ID", raising=False)
+    assert worker_boot_id(env=without_boot_id(), start_new_session=True) != boot_id()
+
+
+def test_data_dir_is_reset_once_per_launch(monkeypatch, tmp_path):
+    monkeypatch.setenv("DATA_RESET_ON_STARTUP", "1")
+    monkeypatch.setenv("SNAIL_BOOT_ID", "launch-1")
+    data_dir = tmp_path / "data"
+    (data_dir / "images").mkdir(parents=True)
+    (data_dir / "images" / "old.png").write_text("x")
+    assert prepare_data_dir(data_dir, StartupTimer())
+    assert not (data_dir / "images" / "old.png").exists()
+
+    # A later worker of the same launch keeps what the first one served
+    (data_dir / "images" / "new.png").write_text("x")
+    assert not prepare_data_dir(data_dir, StartupTimer())
+    assert (data_dir / "images" / "new.png").exists()
+
+    monkeypatch.setenv("SNAIL_BOOT_ID", "launch-2")
+    assert prepare_data_dir(data_dir, StartupTimer())
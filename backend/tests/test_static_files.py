@@ -0,0 +1,87 @@
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from app.core.static_files import IMMUTABLE_CACHE_CONTROL, ImmutableStaticFiles, parse_range
+
+DATA = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def client(tmp_path):
+    (tmp_path / "slide.png").write_bytes(DATA)
+    app = Starlette(routes=[Mount("/static", ImmutableStaticFiles(directory=tmp_path))])
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-9", (0, 9)),
+    ("bytes=10-", (10, 99)),
+    ("bytes=-5", (95, 99)),
+    ("bytes=-500", (0, 99)),
+    ("bytes=90-500", (90, 99)),
+    ("bytes=100-", None),
+    ("bytes=9-3", None),
+    ("bytes=-0", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=-", "bytes=0-1,5-6", "items=0-1", "bytes=a-b"])
+def test_parse_range_rejects_unsupported_headers(header):
+    with pytest.raises(ValueError):
+        parse_range(header, 100)
+
+
+def test_full_response_is_immutable(client):
+    response = client.get("/static/slide.png")
+    assert response.status_code == 200
+    assert response.content == DATA
+    assert response.headers["cache-control"] == IMMUTABLE_CACHE_CONTROL
+    assert response.headers["accept-ranges"] == "bytes"
+
+
+def test_conditional_request_is_not_modified(client):
+    etag = client.get("/static/slide.png").headers["etag"]
+    assert client.get("/static/slide.png", headers={"if-none-match": etag}).status_code == 304
+
+
+def test_range_request_returns_partial_content(client):
+    response = client.get("/static/slide.png", headers={"range": "bytes=100-199"})
+    assert response.status_code == 206
+    assert response.content == DATA[100:200]
+    assert response.headers["content-range"] == f"bytes 100-199/{len(DATA)}"
+    assert response.headers["content-length"] == "100"
+
+
+def test_suffix_range(client):
+    response = client.get("/static/slide.png", headers={"range": "bytes=-10"})
+    assert response.status_code == 206
+    assert response.content == DATA[-10:]
+
+
+def test_unsatisfiable_range_is_416(client):
+    response = client.get("/static/slide.png", headers={"range": f"bytes={len(DATA)}-"})
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(DATA)}"
+
+
+def test_multi_range_gets_the_whole_file(client):
+    response = client.get("/static/slide.png", headers={"range": "bytes=0-1,5-6"})
+    assert response.status_code == 200
+    assert response.content == DATA
+
+
+def test_if_range_with_current_etag_honours_the_range(client):
+    etag = client.get("/static/slide.png").headers["etag"]
+    response = client.get("/static/slide.png", headers={"range": "bytes=0-9", "if-range": etag})
+    assert response.status_code == 206
+    assert response.content == DATA[:10]
+
+
+def test_if_range_with_stale_validator_gets_the_whole_file(client):
+    response = client.get("/static/slide.png", headers={"range": "bytes=0-9", "if-range": '"stale"'})
+    assert response.status_code == 200
+    assert response.content == DATA
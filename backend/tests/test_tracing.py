@@ -0,0 +1,46 @@
+import json
+
+from app.core import metrics, tracing
+
+
+def finished_trace(name):
+    with tracing.span(name) as root:
+        with tracing.span("child"):
+            pass
+    return root
+
+
+def test_exporter_writes_traces_from_its_thread(tmp_path):
+    exporter = tracing.JsonlTraceExporter(tmp_path / "traces.jsonl")
+    for i in range(3):
+        exporter.export(finished_trace(f"t{i}"))
+    exporter.close()
+    lines = [json.loads(line) for line in (tmp_path / "traces.jsonl").read_text().splitlines()]
+    assert [t["name"] for t in lines] == ["t0", "t1", "t2"]
+    assert [s["name"] for s in lines[0]["spans"]] == ["t0", "child"]
+
+
+def test_exporter_rotates_at_max_bytes(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    exporter = tracing.JsonlTraceExporter(path, max_bytes=1)
+    exporter.export(finished_trace("old"))
+    exporter.close()
+    exporter = tracing.JsonlTraceExporter(path, max_bytes=1)
+    exporter.export(finished_trace("new"))
+    exporter.close()
+    assert json.loads(path.read_text())["name"] == "new"
+    assert json.loads((tmp_path / "traces.jsonl.1").read_text())["name"] == "old"
+
+
+def test_exporter_drops_traces_when_the_queue_is_full(tmp_path):
+    exporter = tracing.JsonlTraceExporter(tmp_path / "traces.jsonl", queue_size=1)
+    exporter.close()  # The writer is gone, so nothing drains the queue
+    dropped = metrics.TRACES_DROPPED.value
+    exporter.export(finished_trace("kept"))
+    exporter.export(finished_trace("dropped"))
+    assert metrics.TRACES_DROPPED.value == dropped + 1
+
+
+def test_export_is_off_by_default(monkeypatch):
+    monkeypatch.delenv("TRACING_ENABLED", raising=False)
+    assert tracing.get_exporter() is None
@@ -0,0 +1,164 @@
+"""
+Bulk deck pre-ingestion.
+
+Walks directories of PDF/PPTX decks and runs each one through the same
+pipeline as /api/upload (SlideConverter, deck outline, S3Uploader) in a
+process pool, writing the results to the deck cache and its manifest
+(see app.core.deck_manifest). The server links the cached decks into
+data/images at startup, so the first upload of an ingested deck is a cache
+hit instead of a LibreOffice/poppler conversion.
+
+Decks are identified by the same content hash as uploads
+(SlideConverter.namespace_for, which includes the rendering settings), so
+renamed or duplicate files are ingested once. The manifest is rewritten
+after every deck: an interrupted run resumes where it stopped, and decks
+already in the manifest are skipped.
+
+Run from the backend directory, with the server's environment (.env):
+    python -m tools.ingest_decks decks/ --workers 4
+    python -m tools.ingest_decks decks/ --no-s3 --cache-dir /srv/snail/deck_cache
+
+S3 upload happens when AWS_S3_BUCKET is set, unless --no-s3 is given. The
+server must use the same DECK_CACHE_DIR and rendering settings
+(SLIDE_RENDER_DPI, SLIDE_RENDER_PDFTOCAIRO) for the cache to be used.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+from typing import Dict, List, Optional
+
+BACKEND_DIR = Path(__file__).parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from dotenv import load_dotenv
+
+from app.core.deck_manifest import DEFAULT_CACHE_DIR, MANIFEST_FILE, read_manifest, write_manifest
+from app.core.slide_converter import MANIFEST_NAME, SlideConverter
+
+
+DECK_SUFFIXES = (".pdf", ".pptx", ".ppt")
+
+
+def find_decks(paths: List[str]) -> List[Path]:
+    """Deck files under the given files and directories, sorted."""
+    decks = []
+    for p in map(Path, paths):
+        if p.is_dir():
+            decks.extend(f for f in p.rglob("*") if f.is_file() and f.suffix.lower() in DECK_SUFFIXES)
+        elif p.suffix.lower() in DECK_SUFFIXES:
+            decks.append(p)
+    return sorted(set(decks))
+
+
+def is_ingested(entry: Optional[dict], images_dir: Path, want_s3: bool) -> bool:
+    """True if a manifest entry's slides exist (and were uploaded, when S3 is wanted)."""
+    if entry is None:
+        return False
+    namespace_dir = images_dir / entry["namespace"]
+    if not (namespace_dir / MANIFEST_NAME).exists():
+        return False
+    if not all((namespace_dir / name).exists() for name in entry["slides"]):
+        return False
+    return not want_s3 or len(entry.get("s3_urls") or []) == len(entry["slides"])
+
+
+def ingest_deck(path: str, images_dir: str, upload_s3: bool) -> dict:
+    """
+    Convert one deck (runs in a worker process) and return its manifest entry.
+
+    Raises:
+        Exception: Whatever the conversion or upload raised
+    """
+    from app.core.deck_outline import extract_outline
+
+    started = time.perf_counter()
+    deck = Path(path)
+    content = deck.read_bytes()
+    converter = SlideConverter(Path(images_dir))
+    namespace = converter.namespace_for(content)
+    image_paths = converter.convert_file(content, deck.name)
+    s3_urls: List[str] = []
+    if upload_s3:
+        from app.core.s3_uploader import S3Uploader
+
+        s3_urls = S3Uploader().upload_files(image_paths, s3_prefix=f"slides/{namespace}")
+    return {
+        "namespace": namespace,
+        "source": str(deck),
+        "slides": [p.name for p in image_paths],
+        "s3_urls": s3_urls,
+        "outline": extract_outline(content, deck.name),
+        "ingested_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="Deck files or directories (searched recursively)")
+    parser.add_argument("--cache-dir", help="Deck cache directory (default: DECK_CACHE_DIR or backend/deck_cache)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Parallel conversions")
+    parser.add_argument("--no-s3", action="store_true", help="Do not upload to S3 even if AWS_S3_BUCKET is set")
+    parser.add_argument("--force", action="store_true", help="Re-ingest decks already in the manifest")
+    args = parser.parse_args()
+
+    load_dotenv()
+    # Conversion spans would otherwise be exported to the server's trace file
+    os.environ.setdefault("TRACING_ENABLED", "0")
+    cache_dir = Path(args.cache_dir or os.getenv("DECK_CACHE_DIR") or DEFAULT_CACHE_DIR).resolve()
+    images_dir = cache_dir / "images"
+    manifest_path = cache_dir / MANIFEST_FILE
+    upload_s3 = bool(os.getenv("AWS_S3_BUCKET")) and not args.no_s3
+
+    decks = find_decks(args.paths)
+    manifest: Dict[str, dict] = read_manifest(manifest_path)
+    # Hash in the parent process: cheap, and duplicates are dropped before converting
+    hasher = SlideConverter(images_dir)
+    pending: Dict[str, Path] = {}
+    skipped = 0
+    for deck in decks:
+        namespace = hasher.namespace_for(deck.read_bytes())
+        if namespace in pending or (not args.force and is_ingested(manifest.get(namespace), images_dir, upload_s3)):
+            skipped += 1
+            continue
+        pending[namespace] = deck
+    print(f"{len(decks)} decks found, {skipped} already ingested or duplicate, {len(pending)} to ingest "
+          f"({'with' if upload_s3 else 'without'} S3 upload, {args.workers} workers)")
+
+    started = time.perf_counter()
+    failed = 0
+    with ProcessPoolExecutor(max_workers=max(args.workers, 1)) as pool:
+        futures = {
+            pool.submit(ingest_deck, str(deck), str(images_dir), upload_s3): deck
+            for deck in pending.values()
+        }
+        try:
+            for done, future in enumerate(as_completed(futures), start=1):
+                deck = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as e:
+                    failed += 1
+                    print(f"[{done}/{len(futures)}] FAILED {deck}: {e}")
+                    continue
+                manifest[entry["namespace"]] = entry
+                # Written after every deck so an interrupted run can resume
+                write_manifest(manifest_path, manifest)
+                print(f"[{done}/{len(futures)}] {deck} -> {entry['namespace']} "
+                      f"({len(entry['slides'])} slides, {entry['seconds']}s)")
+        except KeyboardInterrupt:
+            print("Interrupted; finished decks are in the manifest, rerun to resume")
+            pool.shutdown(wait=False, cancel_futures=True)
+            sys.exit(130)
+
+    print(f"Ingested {len(pending) - failed} decks in {time.perf_counter() - started:.1f}s "
+          f"({failed} failed); manifest: {manifest_path}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
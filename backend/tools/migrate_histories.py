@@ -0,0 +1,63 @@
+"""
+One-off conversion of session histories from the old text format.
+
+Histories used to be kept as "role:::content" lines in history.txt (default
+session) and histories/<session_id>.txt. The server only reads the JSONL
+history logs (see app.core.history_log) and never imports a text history on
+its own, so a stale history.txt cannot leak into a new session. Run this
+once, before starting the new server, to carry existing lessons over.
+
+Run from the backend directory (the server's working directory):
+    python -m tools.migrate_histories
+    python -m tools.migrate_histories --dir /srv/snail --dry-run
+
+A text history whose JSONL log already exists is skipped unless --force is
+given. The text files are left in place.
+"""
+import argparse
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+BACKEND_DIR = Path(__file__).parent.parent
+if str(BACKEND_DIR) not in sys.path:
+    sys.path.insert(0, str(BACKEND_DIR))
+
+from app.core.history_log import HistoryLog, read_legacy_history
+
+
+def find_histories(root: Path) -> List[Tuple[Path, Path]]:
+    """(text history, JSONL log) pairs under a server working directory."""
+    pairs = []
+    if (root / "history.txt").is_file():
+        pairs.append((root / "history.txt", root / "history.jsonl"))
+    sessions = root / "histories"
+    if sessions.is_dir():
+        pairs.extend((p, p.with_suffix(".jsonl")) for p in sorted(sessions.glob("*.txt")))
+    return pairs
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=".", help="Server working directory (default: current directory)")
+    parser.add_argument("--force", action="store_true", help="Overwrite JSONL logs that already exist")
+    parser.add_argument("--dry-run", action="store_true", help="List what would be converted")
+    args = parser.parse_args()
+
+    converted = skipped = 0
+    for text_path, log_path in find_histories(Path(args.dir)):
+        log = HistoryLog(log_path)
+        if log.exists() and not args.force:
+            print(f"{text_path}: skipped, {log_path} exists")
+            skipped += 1
+            continue
+        records = read_legacy_history(text_path)
+        if not args.dry_run:
+            log.reset(records)
+        print(f"{text_path} -> {log_path} ({len(records)} records)")
+        converted += 1
+    print(f"{converted} histories {'to convert' if args.dry_run else 'converted'}, {skipped} skipped")
+
+
+if __name__ == "__main__":
+    main()
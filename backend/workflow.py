@@ -1,3 +1,4 @@
+import asyncio
 import os
 import sys
 current_dir = os.path.dirname(__file__)
@@ -5,56 +6,197 @@ utils_path = os.path.join(current_dir,'..','backend')
 sys.path.append(utils_path)
 
 from chatbot import Chatbot
+from app.core import tracing
+from app.core.context_helper import render_system_prompt
+from app.core.conversation import build_conversation, resolve_slides, slide_message
+from app.core.history_log import HistoryLog
 
-database_file = "history.txt"
+database_file = "history.jsonl"
 context_file  = "context.txt"
+sessions_dir  = "histories"
+default_session = "default"
 # Necessary context keys: <persona>, <grade>, <subject>, <level>, <style>
 
-# Clears all conversation history
-def begin_conversation(settings):
+# One Chatbot, and with it one pair of OpenAI clients and their connection
+# pools, serves every call. Created on first use, once .env has been loaded.
+_chatbot = None
+
+def get_chatbot():
+    global _chatbot
+    if _chatbot is None:
+        _chatbot = Chatbot()
+    return _chatbot
+
+# History log of a session (see app.core.history_log); the default session
+# keeps using database_file
+def history_file(session_id=None):
+    if not session_id or session_id == default_session:
+        return database_file
+    os.makedirs(sessions_dir, exist_ok=True)
+    return os.path.join(sessions_dir, f"{session_id}.jsonl")
+
+# Opens a session's history log. Histories in the old role:::content text
+# format (history.txt, histories/<id>.txt) are not read; convert them once
+# with python -m tools.migrate_histories.
+def history_log(session_id=None):
+    return HistoryLog(history_file(session_id))
+
+# Runs a history write in a worker thread, off the event loop (the log takes
+# a file lock another worker may hold). The write is shielded: a supersession
+# arriving meanwhile waits for it to finish, so an exchange is never left half
+# written.
+async def write_history(write, *args):
+    done = asyncio.ensure_future(asyncio.to_thread(write, *args))
+    try:
+        await asyncio.shield(done)
+    except asyncio.CancelledError:
+        await done
+        raise
+
+# Clears all conversation history. deck_outline (one summary per slide) is kept
+# with the history and sent ahead of the turns of every call.
+def begin_conversation(settings, session_id=None, deck_outline=None):
     with open(context_file, 'r') as f:
-        context = f.read()
-        for key in settings.keys():
-            context = context.replace(key, settings[key])
-    with open(database_file, 'w') as g:
-        g.write(f"system:::{context}\n")
+        context = render_system_prompt(settings, template=f.read())
+    records = [{"role": "system", "content": context}]
+    if deck_outline:
+        records.append({"role": "deck", "content": deck_outline})
+    HistoryLog(history_file(session_id)).reset(records)
 
 # Adds a slide to the conversation
-def add_slide(slide_url):
-    image_file = f"{str(slide_url).zfill(3)}"
-    with open(database_file, 'a') as f:
-        f.write(f"slide:::{slide_url}\n")
-
-# Gets a chatbot response after receiving a user response
-def get_feedback(user_text):
-    conversation = []
-    with open(database_file, 'r+') as f:
-        contents = f.read().split('\n')
-        for c in contents:
-            if not c:
-                break
-            role, content = c.split(':::')
-            if role in ["system", "user", "assistant"]:
-                conversation.append((role, content))
-            else:
-                conversation.append((
-                    "user", [
-                        {
-                            "type" : "image_url",
-                            "image_url" : {
-                                "url"       : content,
-                                "detail"    : "high"
-                            }
-                        }
-                    ]
-                ))
-        print(conversation)
-        conversation.append(("user", user_text))
-
-        chatbot = Chatbot()
-        response = chatbot.response(conversation)
-
-    with open(database_file, 'a') as g:
-        g.write(f"user:::{user_text}\n")
-        g.write(f"assistant:::{response}\n")
+def add_slide(slide_url, session_id=None):
+    history_log(session_id).append([{"role": "slide", "content": slide_url}])
+
+# Gets a chatbot response after receiving a user response.
+# system_prompt, when given, replaces the system message stored in the history
+# so profile changes apply without restarting the conversation.
+def get_feedback(user_text, session_id=None, system_prompt=None):
+    with tracing.span("workflow.get_feedback", session=session_id or default_session):
+        return _get_feedback(user_text, session_id, system_prompt)
+
+def _get_feedback(user_text, session_id=None, system_prompt=None):
+    conversation = load_conversation(user_text, session_id, system_prompt)
+
+    response = get_chatbot().response(conversation)
+
+    record_exchange(user_text, response, session_id)
     return response
+
+# Reads the session history into chat messages and appends the new user text.
+# Only the header (system prompt, deck outline) and the latest turns are read,
+# so the cost does not grow with the lesson. The messages are laid out by
+# app.core.conversation: system prompt and deck outline first, then the turns
+# in history order, so the prompt prefix stays the same from one call to the
+# next and the provider's prompt cache can hit.
+def load_conversation(user_text, session_id=None, system_prompt=None):
+    stored_prompt = None
+    deck_outline = []
+    turns = []
+    with tracing.span("workflow.load_history") as sp:
+        header, window = history_log(session_id).read_window()
+        # One outbox lookup for all slides in the window
+        resolved = resolve_slides(r["content"] for r in window if r["role"] == "slide")
+        for record in header + window:
+            role, content = record["role"], record["content"]
+            if role == "system":
+                stored_prompt = content
+            elif role == "deck":
+                deck_outline = content
+            elif role in ["user", "assistant"]:
+                turns.append((role, content))
+            elif role == "slide":
+                turns.append(slide_message(content, resolved))
+        # system_prompt, when given, replaces the system message stored in the history
+        conversation = build_conversation(
+            system_prompt if system_prompt is not None else stored_prompt,
+            deck_outline,
+            turns,
+            user_text,
+        )
+        sp.set_attribute("messages", len(conversation))
+    return conversation
+
+# Appends a completed user/assistant exchange to the session history
+def record_exchange(user_text, response, session_id=None):
+    with tracing.span("workflow.append_history"):
+        history_log(session_id).append([
+            {"role": "user", "content": user_text},
+            {"role": "assistant", "content": response},
+        ])
+
+# Generates a complete chatbot response without recording it (speculative
+# replies). The caller records it with record_exchange if the reply is used.
+async def draft_feedback(user_text, session_id=None, system_prompt=None):
+    conversation = await asyncio.to_thread(load_conversation, user_text, session_id, system_prompt)
+    parts = []
+    async for delta in get_chatbot().astream(conversation, session_id=session_id or default_session):
+        parts.append(delta)
+    return "".join(parts).strip()
+
+# Streams a chatbot response as text deltas (async, for the event loop).
+# The exchange is only written to the history once the reply is complete, so a
+# reply cancelled by a newer utterance or slide change leaves no trace. Once
+# the reply is complete it is recorded even if a cancellation arrives during
+# the write (see write_history).
+async def stream_feedback(user_text, session_id=None, system_prompt=None):
+    conversation = await asyncio.to_thread(load_conversation, user_text, session_id, system_prompt)
+    parts = []
+    async for delta in get_chatbot().astream(conversation, session_id=session_id or default_session):
+        parts.append(delta)
+        yield delta
+    await write_history(record_exchange, user_text, "".join(parts).strip(), session_id)
+
+# Appends a teacher utterance and the replies of several students (classroom
+# mode); each reply is prefixed with the student's name
+def record_classroom(user_text, replies, session_id=None):
+    with tracing.span("workflow.append_history"):
+        history_log(session_id).append(
+            [{"role": "user", "content": user_text}]
+            + [{"role": "assistant", "content": f"{name}: {reply}", "student": name} for name, reply in replies]
+        )
+
+# Streams the replies of several students to one utterance (classroom mode).
+# students holds (name, persona prompt) pairs. Every student gets the same
+# conversation (shared prefix for prompt caching) followed by its persona, and
+# all of them run concurrently. Yields (name, delta, None) as text arrives and
+# (name, None, reply) once a student's reply is complete. A student whose call
+# fails is skipped; if all of them fail the first error is raised. The replies
+# are recorded together, in the order they finished, once all are done.
+async def stream_classroom(user_text, students, session_id=None, system_prompt=None):
+    conversation = await asyncio.to_thread(load_conversation, user_text, session_id, system_prompt)
+    queue = asyncio.Queue()
+    errors = []
+
+    async def answer(name, persona):
+        parts = []
+        try:
+            async for delta in get_chatbot().astream(conversation + [("system", persona)], session_id=session_id or default_session):
+                parts.append(delta)
+                await queue.put((name, delta, None))
+        except Exception as e:
+            print(f"Warning: classroom reply of {name} failed: {e}")
+            errors.append(e)
+            await queue.put((name, None, None))
+            return
+        await queue.put((name, None, "".join(parts).strip()))
+
+    tasks = [asyncio.ensure_future(answer(name, persona)) for name, persona in students]
+    replies = []
+    try:
+        finished = 0
+        while finished < len(tasks):
+            name, delta, reply = await queue.get()
+            if delta is not None:
+                yield name, delta, None
+                continue
+            finished += 1
+            if reply is not None:
+                replies.append((name, reply))
+                yield name, None, reply
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if errors and not replies:
+        raise errors[0]
+    await write_history(record_classroom, user_text, replies, session_id)
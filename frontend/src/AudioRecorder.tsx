@@ -3,15 +3,20 @@ import React, { useState, useRef, useEffect } from "react";
 
 interface AudioRecorderProps {
   onTranscriptComplete: (text: string) => void;
+  // Called with the transcript so far (final + interim) while still recording
+  onInterimTranscript?: (text: string) => void;
 }
 
-const AudioRecorder: React.FC<AudioRecorderProps> = ({ onTranscriptComplete }) => {
+const AudioRecorder: React.FC<AudioRecorderProps> = ({ onTranscriptComplete, onInterimTranscript }) => {
   const [isRecording, setIsRecording] = useState<boolean>(false);
   const [transcript, setTranscript] = useState<string>("");
   const [isSupported, setIsSupported] = useState<boolean>(true);
   const recognitionRef = useRef<any>(null);
   const finalTranscriptRef = useRef<string>("");
   const isRecordingRef = useRef<boolean>(false);
+  // Latest callback for the recognition handlers registered once on mount
+  const onInterimRef = useRef(onInterimTranscript);
+  onInterimRef.current = onInterimTranscript;
 
   useEffect(() => {
     // Check if browser supports Web Speech API
@@ -48,7 +53,11 @@ const AudioRecorder: React.FC<AudioRecorderProps> = ({ onTranscriptComplete }) =
       }
 
       // Display = final so far + interim
-      setTranscript((finalTranscriptRef.current + interim).trim());
+      const soFar = (finalTranscriptRef.current + interim).trim();
+      setTranscript(soFar);
+      if (soFar && isRecordingRef.current) {
+        onInterimRef.current?.(soFar);
+      }
       const finalLen = finalTranscriptRef.current.trim().length;
       const interimLen = interim.trim().length;
       if (finalLen || interimLen) {
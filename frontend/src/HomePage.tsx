@@ -1,5 +1,6 @@
 import React, { useState, useEffect, useRef } from "react";
 import { useNavigate } from "react-router-dom";
+import { getSessionId } from "./session";
 
 const gradeLevelOptions = [
   { value: "elementary", label: "Elementary" },
@@ -245,6 +246,7 @@ const HomePage: React.FC = () => {
 
       const res = await fetch("/api/upload", {
         method: "POST",
+        headers: { "X-Session-Id": getSessionId() },
         body: formData,
       });
       if (!res.ok) throw new Error("Upload failed");
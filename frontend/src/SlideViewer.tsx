@@ -1,7 +1,9 @@
 // src/SlideViewer.tsx
-import React, { useEffect, useState } from "react";
+import React, { useEffect, useRef, useState } from "react";
 import { useParams, Link } from "react-router-dom";
 import AudioRecorder from "./AudioRecorder";
+import { getSessionId } from "./session";
+import { SessionChannel, SupersededError } from "./sessionChannel";
 
 // Allow overriding API base (useful when serving built files without Vite proxy)
 const API_BASE =
@@ -9,12 +11,19 @@ const API_BASE =
     ? (import.meta as any).env.VITE_API_URL
     : "";
 
+// Times a feedback request is retried after a 429 (backend at LLM capacity)
+const MAX_OVERLOAD_RETRIES = 2;
+
 interface Slide {
   id: number;
   imageUrl: string;
   s3Url?: string;
 }
 
+// URL the backend shows the model: the S3 copy, or the server-local image
+// while it is still being replicated (the backend resolves it).
+const modelSlideUrl = (slide?: Slide): string | undefined => slide?.s3Url || slide?.imageUrl;
+
 interface ChatMessage {
   id: number;
   sender: "user" | "assistant";
@@ -39,6 +48,26 @@ const SlideViewer: React.FC = () => {
   ]);
   const [chatInput, setChatInput] = useState<string>("");
   const [isLlmLoading, setIsLlmLoading] = useState<boolean>(false);
+  const channelRef = useRef<SessionChannel | null>(null);
+  const lastInterimPostRef = useRef<number>(0);
+
+  // One WebSocket per viewer for slide changes and streamed replies
+  useEffect(() => {
+    const channel = new SessionChannel(API_BASE, (event) => {
+      // Server-initiated student messages (e.g. unprompted questions)
+      if (event.type === "student_message" && typeof event.text === "string") {
+        setMessages((prev) => [
+          ...prev,
+          { id: Date.now(), sender: "assistant", text: event.text },
+        ]);
+      }
+    });
+    channelRef.current = channel;
+    return () => {
+      channel.close();
+      channelRef.current = null;
+    };
+  }, []);
 
   // Fetch slide data when the viewer loads
   useEffect(() => {
@@ -76,22 +105,39 @@ const SlideViewer: React.FC = () => {
 
   const currentSlide = slides[currentSlideIndex];
 
+  // Warm the browser cache with the neighbouring slides. Image URLs are
+  // content-addressed and served as immutable, so navigation never refetches.
+  useEffect(() => {
+    [currentSlideIndex - 1, currentSlideIndex + 1].forEach((i) => {
+      const neighbour = slides[i];
+      if (neighbour) {
+        new Image().src = neighbour.imageUrl;
+      }
+    });
+  }, [currentSlideIndex, slides]);
+
   // Notify backend whenever the slide changes
   useEffect(() => {
     const notifySlideChange = async () => {
       if (slides.length === 0) return;
-      const s3 = slides[currentSlideIndex]?.s3Url;
-      if (!s3) {
-        console.warn("Slide S3 URL missing; slide change not sent");
+      const slideUrl = modelSlideUrl(slides[currentSlideIndex]);
+      if (!slideUrl) {
+        console.warn("Slide URL missing; slide change not sent");
+        return;
+      }
+      if (channelRef.current?.sendSlideChange(currentSlideIndex, slideUrl)) {
         return;
       }
       try {
         await fetch("/api/slide_change", {
           method: "POST",
-          headers: { "Content-Type": "application/json" },
+          headers: {
+            "Content-Type": "application/json",
+            "X-Session-Id": getSessionId(),
+          },
           body: JSON.stringify({
             slide_index: currentSlideIndex,
-            slide_url: s3,
+            slide_url: slideUrl,
           }),
         });
       } catch (e) {
@@ -130,20 +176,61 @@ const SlideViewer: React.FC = () => {
     setIsLlmLoading(true);
 
     try {
-      const s3 = slides[currentSlideIndex]?.s3Url;
-      if (!s3) {
-        throw new Error("Current slide is missing S3 URL.");
+      const slideUrl = modelSlideUrl(slides[currentSlideIndex]);
+      if (!slideUrl) {
+        throw new Error("Current slide is missing its URL.");
       }
+      const channel = channelRef.current;
+      if (channel?.isOpen()) {
+        // Stream the reply into a message that grows as deltas arrive
+        const replyId = Date.now() + 1;
+        let streamed = "";
+        setMessages((prev) => [...prev, { id: replyId, sender: "assistant", text: "" }]);
+        const setReplyText = (text: string) =>
+          setMessages((prev) => prev.map((m) => (m.id === replyId ? { ...m, text } : m)));
+        try {
+          const full = await channel.sendUtterance(
+            trimmed,
+            currentSlideIndex,
+            slideUrl,
+            (delta) => {
+              streamed += delta;
+              setReplyText(streamed);
+            },
+            (position) => {
+              if (!streamed) setReplyText(`Waiting for a turn (position ${position})…`);
+            }
+          );
+          setReplyText(full || "Transcript sent to backend.");
+        } catch (err) {
+          setMessages((prev) => prev.filter((m) => m.id !== replyId));
+          throw err;
+        }
+        return;
+      }
+
       const payload = {
         teacher_text: trimmed,
         slide_index: currentSlideIndex,
-        slide_url: s3,
+        slide_url: slideUrl,
       };
-      const res = await fetch(`${API_BASE}/api/feedback`, {
-        method: "POST",
-        headers: { "Content-Type": "application/json" },
-        body: JSON.stringify(payload),
-      });
+      let res: Response;
+      for (let attempt = 0; ; attempt++) {
+        res = await fetch(`${API_BASE}/api/feedback`, {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+            "X-Session-Id": getSessionId(),
+          },
+          body: JSON.stringify(payload),
+        });
+        // 429: the backend is at capacity; wait as long as it asks, a few times
+        if (res.status !== 429 || attempt >= MAX_OVERLOAD_RETRIES) break;
+        const retryAfter = Number(res.headers.get("Retry-After")) || 1;
+        await new Promise((resolve) => setTimeout(resolve, retryAfter * 1000));
+      }
+      // 409: a newer utterance or slide change replaced this request
+      if (res.status === 409) throw new SupersededError();
       if (!res.ok) throw new Error("Feedback request failed");
       const data: { student_feedback?: string } = await res.json();
       const assistantText =
@@ -160,6 +247,7 @@ const SlideViewer: React.FC = () => {
         },
       ]);
     } catch (err) {
+      if (err instanceof SupersededError) return;
       console.error(err);
       // Optionally show a message in the chat about the error
     } finally {
@@ -167,6 +255,27 @@ const SlideViewer: React.FC = () => {
     }
   };
 
+  // Interim transcripts let the backend start a reply before the teacher stops
+  const handleInterimTranscript = (text: string) => {
+    const slideUrl = modelSlideUrl(slides[currentSlideIndex]);
+    if (!slideUrl) return;
+    if (channelRef.current?.sendInterim(text, currentSlideIndex, slideUrl)) return;
+    // HTTP fallback: the backend waits for the transcript to settle anyway
+    const now = Date.now();
+    if (now - lastInterimPostRef.current < 400) return;
+    lastInterimPostRef.current = now;
+    fetch(`${API_BASE}/api/feedback/interim`, {
+      method: "POST",
+      headers: {
+        "Content-Type": "application/json",
+        "X-Session-Id": getSessionId(),
+      },
+      body: JSON.stringify({ teacher_text: text, slide_index: currentSlideIndex, slide_url: slideUrl }),
+    }).catch(() => {
+      // non-fatal: the final transcript is still sent
+    });
+  };
+
   const handleTranscriptComplete = async (text: string) => {
     console.log("[Audio] transcript complete, length:", text?.length || 0);
     await sendMessageToBackend(text);
@@ -479,7 +588,10 @@ const SlideViewer: React.FC = () => {
               padding: "8px 8px 0px 8px",
             }}
           >
-            <AudioRecorder onTranscriptComplete={handleTranscriptComplete} />
+            <AudioRecorder
+              onTranscriptComplete={handleTranscriptComplete}
+              onInterimTranscript={handleInterimTranscript}
+            />
           </div>
 
           {/* Chat input */}
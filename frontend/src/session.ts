@@ -0,0 +1,16 @@
+// src/session.ts
+// Per-tab session id sent as X-Session-Id so each teacher gets their own
+// student profile and conversation history on the backend.
+const SESSION_KEY = "sessionId";
+
+export function getSessionId(): string {
+  let id = sessionStorage.getItem(SESSION_KEY);
+  if (!id) {
+    id =
+      typeof crypto !== "undefined" && "randomUUID" in crypto
+        ? crypto.randomUUID()
+        : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2, 10)}`;
+    sessionStorage.setItem(SESSION_KEY, id);
+  }
+  return id;
+}
@@ -0,0 +1,198 @@
+// src/sessionChannel.ts
+// Long-lived WebSocket to /api/ws/<session id> carrying slide changes,
+// teacher utterances and streamed student replies. Reconnects with backoff
+// and resumes from the last received event sequence number. Callers fall
+// back to the HTTP endpoints while the socket is not open.
+import { getSessionId } from "./session";
+
+const PING_INTERVAL_MS = 20000;
+const MAX_BACKOFF_MS = 10000;
+
+export interface ServerEvent {
+  type: string;
+  seq?: number;
+  reply_to?: string;
+  [key: string]: any;
+}
+
+/** The reply was cancelled because a newer utterance or slide change arrived. */
+export class SupersededError extends Error {
+  constructor() {
+    super("Superseded by a newer utterance or slide change");
+    this.name = "SupersededError";
+  }
+}
+
+interface PendingReply {
+  onDelta?: (delta: string) => void;
+  onQueued?: (position: number, retryAfter: number) => void;
+  resolve: (text: string) => void;
+  reject: (err: Error) => void;
+}
+
+export class SessionChannel {
+  private url: string;
+  private socket: WebSocket | null = null;
+  private lastSeq: number | null = null;
+  private backoffMs = 500;
+  private pingTimer: number | undefined;
+  private reconnectTimer: number | undefined;
+  private closed = false;
+  private nextId = 1;
+  private pending = new Map<string, PendingReply>();
+  private onEvent: (event: ServerEvent) => void;
+
+  constructor(apiBase: string, onEvent: (event: ServerEvent) => void = () => {}) {
+    const base = apiBase || window.location.origin;
+    this.url = `${base.replace(/^http/, "ws")}/api/ws/${encodeURIComponent(getSessionId())}`;
+    this.onEvent = onEvent;
+    this.connect();
+  }
+
+  isOpen(): boolean {
+    return this.socket?.readyState === WebSocket.OPEN;
+  }
+
+  close(): void {
+    this.closed = true;
+    window.clearTimeout(this.reconnectTimer);
+    window.clearInterval(this.pingTimer);
+    this.socket?.close();
+    this.failPending("Channel closed");
+  }
+
+  /** Send a slide change; returns false if the socket is not open. */
+  sendSlideChange(slideIndex: number, slideUrl: string): boolean {
+    return this.send({ type: "slide_change", id: this.newId(), slide_index: slideIndex, slide_url: slideUrl });
+  }
+
+  /** Send an interim transcript for speculative replies; returns false if the socket is not open. */
+  sendInterim(teacherText: string, slideIndex: number, slideUrl: string): boolean {
+    return this.send({ type: "interim", teacher_text: teacherText, slide_index: slideIndex, slide_url: slideUrl });
+  }
+
+  /**
+   * Send a teacher utterance and resolve with the complete student reply.
+   * onQueued reports the queue position while the server waits for an LLM slot.
+   */
+  sendUtterance(
+    teacherText: string,
+    slideIndex: number,
+    slideUrl: string,
+    onDelta?: (delta: string) => void,
+    onQueued?: (position: number, retryAfter: number) => void
+  ): Promise<string> {
+    const id = this.newId();
+    return new Promise((resolve, reject) => {
+      this.pending.set(id, { onDelta, onQueued, resolve, reject });
+      const sent = this.send({
+        type: "utterance",
+        id,
+        teacher_text: teacherText,
+        slide_index: slideIndex,
+        slide_url: slideUrl,
+      });
+      if (!sent) {
+        this.pending.delete(id);
+        reject(new Error("Session channel is not connected"));
+      }
+    });
+  }
+
+  private newId(): string {
+    return `${Date.now().toString(36)}-${this.nextId++}`;
+  }
+
+  private send(message: object): boolean {
+    if (!this.isOpen()) return false;
+    this.socket!.send(JSON.stringify(message));
+    return true;
+  }
+
+  private connect(): void {
+    const resume = this.lastSeq !== null ? `?last_seq=${this.lastSeq}` : "";
+    const socket = new WebSocket(this.url + resume);
+    this.socket = socket;
+
+    socket.onopen = () => {
+      this.backoffMs = 500;
+      window.clearInterval(this.pingTimer);
+      this.pingTimer = window.setInterval(() => this.send({ type: "ping" }), PING_INTERVAL_MS);
+    };
+    socket.onmessage = (msg) => {
+      let event: ServerEvent;
+      try {
+        event = JSON.parse(msg.data);
+      } catch {
+        return;
+      }
+      this.handleEvent(event);
+    };
+    socket.onclose = () => {
+      window.clearInterval(this.pingTimer);
+      if (this.socket !== socket || this.closed) return;
+      this.reconnectTimer = window.setTimeout(() => this.connect(), this.backoffMs);
+      this.backoffMs = Math.min(this.backoffMs * 2, MAX_BACKOFF_MS);
+    };
+  }
+
+  private handleEvent(event: ServerEvent): void {
+    if (typeof event.seq === "number") {
+      this.lastSeq = event.seq;
+    }
+    switch (event.type) {
+      case "welcome":
+        this.lastSeq = event.seq ?? 0;
+        if (event.gap) {
+          // Events were lost while disconnected; replies in flight cannot complete
+          this.failPending("Connection lost before the reply arrived");
+        }
+        break;
+      case "ping":
+        this.send({ type: "pong" });
+        break;
+      case "reply_delta": {
+        const pending = event.reply_to ? this.pending.get(event.reply_to) : undefined;
+        pending?.onDelta?.(event.delta);
+        break;
+      }
+      case "queued": {
+        const pending = event.reply_to ? this.pending.get(event.reply_to) : undefined;
+        pending?.onQueued?.(event.position, event.retry_after);
+        break;
+      }
+      case "reply": {
+        const pending = event.reply_to ? this.pending.get(event.reply_to) : undefined;
+        if (pending) {
+          this.pending.delete(event.reply_to!);
+          pending.resolve(event.text);
+        }
+        break;
+      }
+      case "superseded": {
+        const pending = event.reply_to ? this.pending.get(event.reply_to) : undefined;
+        if (pending) {
+          this.pending.delete(event.reply_to!);
+          pending.reject(new SupersededError());
+        }
+        break;
+      }
+      case "error": {
+        const pending = event.reply_to ? this.pending.get(event.reply_to) : undefined;
+        if (pending) {
+          this.pending.delete(event.reply_to!);
+          pending.reject(new Error(event.detail));
+        } else {
+          console.warn("[ws] error", event.detail);
+        }
+        break;
+      }
+    }
+    this.onEvent(event);
+  }
+
+  private failPending(reason: string): void {
+    this.pending.forEach((p) => p.reject(new Error(reason)));
+    this.pending.clear();
+  }
+}